@@ -1,11 +1,10 @@
 import streamlit as st
-from PIL import Image, ImageDraw, ImageColor, ImageFont
+from PIL import ImageColor
 import io
-import json
-import os
-import csv
-from datetime import datetime
-import math 
+import hashlib
+
+import motor_croche
+import banco_croche
 
 # ==========================================
 # CONFIGURAÇÃO DA PÁGINA E BLINDAGEM DO CELULAR
@@ -25,27 +24,75 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# ==========================================
+# ETAPAS DO GRÁFICO EM CACHE (ENTRE RERUNS)
+# ==========================================
+# Cada etapa é pura e fica em cache pela sua entrada (hash da foto, tipo de peça, tamanhos, cores,
+# padrão). Mexer no ponto de parada não refaz nenhuma delas: só a carreira destacada muda.
+POR_ASSINATURA = {motor_croche.Grafico: lambda g: g.assinatura}
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def etapa_tamanho_upload(sha, _dados):
+    return motor_croche.tamanho_upload(_dados)
+
+# Chave: hash da foto + tamanho + cores + método + fios do estoque (nome e cor); devolve (imagem, relatório)
+@st.cache_data(max_entries=8, show_spinner="Reduzindo as cores da imagem...")
+def etapa_upload(sha, _dados, radial, largura, altura, num_cores, metodo, fios):
+    return motor_croche.imagem_do_upload(_dados, radial, largura, altura, num_cores, metodo, fios)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def etapa_letreiro(texto, escala, cor_fundo, cor_letra, radial):
+    return motor_croche.imagem_do_letreiro(texto, escala, cor_fundo, cor_letra, radial)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def etapa_padrao(nome, largura, altura, cor1_hex, cor2_hex):
+    # Máscara vetorizada (motor_croche): o gráfico indexado lê a imagem em RGB
+    return motor_croche.gerar_padrao(nome, largura, altura, ImageColor.getrgb(cor1_hex), ImageColor.getrgb(cor2_hex)).convert('RGB')
+
+# O gráfico indexado é montado uma vez por origem + formato da peça e compartilhado (só leitura)
+@st.cache_resource(max_entries=8, show_spinner=False)
+def etapa_grafico(origem, tipo_peca, num_carreiras, pontos_anel, _img_base):
+    return motor_croche.montar_grafico(_img_base, tipo_peca, num_carreiras, pontos_anel)
+
+# A prévia radial só muda quando muda o desenho: mexer no ponto de parada não redesenha os anéis
+@st.cache_data(max_entries=16, show_spinner=False, hash_funcs=POR_ASSINATURA)
+def previa_radial(grafico):
+    return motor_croche.desenhar_previa_radial(grafico)
+
+# A grade guarda o HTML das carreiras já montadas: fica viva entre reruns do mesmo gráfico
+@st.cache_resource(max_entries=4, show_spinner=False, hash_funcs=POR_ASSINATURA)
+def grade_html(grafico, sequencia):
+    return motor_croche.GradeHTML(grafico, sequencia)
+
+@st.cache_data(max_entries=8, show_spinner=False, hash_funcs=POR_ASSINATURA)
+def etapa_receita(grafico, sigla_pt, tipo_peca, tipo_ponto_base):
+    return motor_croche.receita(grafico, sigla_pt, tipo_peca, tipo_ponto_base)
+
+@st.cache_data(max_entries=4, show_spinner="Desenhando o tabuleiro...", hash_funcs=POR_ASSINATURA)
+def exportar_grafico(grafico, sequencia, formato):
+    exportador = motor_croche.Exportador(grafico, sequencia)
+    if formato == "png": return exportador.png()
+    if formato == "pdf": return exportador.pdf()
+    return exportador.zip_png()
+
 if 'ponto_parada' not in st.session_state: st.session_state.ponto_parada = 1
 if 'grafico_ativo' not in st.session_state: st.session_state.grafico_ativo = False
+if 'janela_centro' not in st.session_state: st.session_state.janela_centro = None
+if 'exportacao' not in st.session_state: st.session_state.exportacao = None
+if 'relatorio' not in st.session_state: st.session_state.relatorio = None
 
 # ==========================================
-# MOTOR DE BASE DE DADOS (JSON) COM HISTÓRICO
+# LIVRO-CAIXA EM SQLITE (banco_croche) COM HISTÓRICO
 # ==========================================
-FICHEIRO_BD = "contabilidade_croche.json"
+# Uma conexão para o servidor todo; o contabilidade_croche.json antigo é importado na primeira vez
+@st.cache_resource
+def obter_livro():
+    livro = banco_croche.Livro()
+    livro.importar_json()
+    return livro
 
-def carregar_bd():
-    if not os.path.exists(FICHEIRO_BD): 
-        return {"inventario": {}, "lucro_acumulado": 0.0, "pecas_produzidas": 0, "historico_vendas": []}
-    with open(FICHEIRO_BD, "r", encoding="utf-8") as f:
-        dados = json.load(f)
-        if "historico_vendas" not in dados: dados["historico_vendas"] = []
-        return dados
-
-def guardar_bd(dados):
-    with open(FICHEIRO_BD, "w", encoding="utf-8") as f: 
-        json.dump(dados, f, indent=4)
-
-bd = carregar_bd()
+livro = obter_livro()
+inventario = livro.fios()
 
 st.title("🧶 Estúdio de Crochê Pro 🌿 - Motor Avançado")
 
@@ -59,20 +106,12 @@ with tab_gerador:
 
     col_peca1, col_peca2 = st.columns(2)
     with col_peca1:
-        tipo_peca = st.radio("Como você vai tecer essa peça?", 
-                             ["Circular (Tubo - Ex: Gorro, Amigurumi)", 
-                              "Plana (Ida e Volta - Ex: Tapete)",
-                              "Circular Plana (Centro p/ Bordas - Ex: Porta-copo) 🚀"])
-        is_radial = "Centro" in tipo_peca
+        tipo_peca = st.radio("Como você vai tecer essa peça?", motor_croche.TIPOS_PECA)
+        is_radial, _ = motor_croche.formato_peca(tipo_peca)
     
     with col_peca2:
-        tipo_ponto_base = st.selectbox("Qual o ponto base da peça?", [
-            "Ponto Baixo (PB)", 
-            "Ponto Alto (PA)", 
-            "Meio Ponto Alto (MPA)", 
-            "Ponto Baixíssimo (PBX)", 
-            "Apenas Cores"
-        ])
+        tipo_ponto_base = st.selectbox("Qual o ponto base da peça?", list(motor_croche.PONTOS_BASE))
+        sigla_ponto = motor_croche.PONTOS_BASE[tipo_ponto_base]
 
     st.write("### Como deseja criar o desenho?")
     modo_entrada = st.radio("", ["📸 Subir Imagem / Buscar", "🔤 Escrever Nome (Letreiro)", "📐 Gerar Padrão (Formas Perfeitas)"])
@@ -102,20 +141,32 @@ with tab_gerador:
 
         imagem_carregada = st.file_uploader("📥 Anexe a imagem aqui", type=["png", "jpg", "jpeg"])
         if imagem_carregada is not None:
-            img_temp = Image.open(imagem_carregada).convert('RGB')
+            dados_upload = imagem_carregada.getvalue()
+            sha_upload = hashlib.sha256(dados_upload).hexdigest()
             if not is_radial:
-                largura_original, altura_original = img_temp.size
+                largura_original, altura_original = etapa_tamanho_upload(sha_upload, dados_upload)
                 proporcao = altura_original / largura_original 
                 col1, col2 = st.columns(2)
                 with col1: largura_pontos = st.number_input("Largura (Pontos)", min_value=5, value=30)
                 with col2: altura_carreiras = st.number_input("Altura (Carreiras)", min_value=5, value=max(5, int(largura_pontos * proporcao)))
-            else:
-                img_temp = img_temp.resize((200, 200), Image.Resampling.LANCZOS)
                 
             num_cores = st.slider("Quantas cores usar?", min_value=2, max_value=20, value=4)
-            img_base = img_temp.quantize(colors=num_cores).convert('RGB')
-            if not is_radial:
-                img_base = img_base.resize((largura_pontos, altura_carreiras), Image.Resampling.NEAREST)
+            col_q1, col_q2 = st.columns(2)
+            with col_q1: metodo_cores = st.selectbox("Método de redução de cores", motor_croche.metodos_quantizacao())
+            fios_com_cor = tuple((nome, dados["cor"]) for nome, dados in inventario.items() if dados["cor"])
+            with col_q2:
+                usar_fios = st.toggle("🧶 Usar só as cores dos meus fios", disabled=not fios_com_cor,
+                                      help="Cada cor do gráfico vira a do fio do estoque mais parecido. Cadastre a cor dos fios na aba Gestão.")
+            fios_escolhidos = fios_com_cor if usar_fios else ()
+            origem = ("foto", sha_upload, largura_pontos, altura_carreiras, num_cores, metodo_cores, fios_escolhidos)
+            img_base, relatorio_cores = etapa_upload(sha_upload, dados_upload, is_radial, largura_pontos, altura_carreiras,
+                                                     num_cores, metodo_cores, fios_escolhidos)
+            tempos = relatorio_cores["tempos_ms"]
+            st.caption(f"⏱️ Foto reduzida para {relatorio_cores['tamanho_quantizado'][0]}x{relatorio_cores['tamanho_quantizado'][1]} em {tempos['reduzir']:.0f} ms · "
+                       f"cores escolhidas em {tempos['quantizar']:.0f} ms" + (f" · fios casados em {tempos['fios']:.1f} ms" if fios_escolhidos else ""))
+            if relatorio_cores["fios"]:
+                st.dataframe([{"Cor da foto": c["cor"], "Fio": c["fio"], "Cor do fio": c["cor_fio"], "Diferença (ΔE)": round(c["delta_e"], 1)}
+                              for c in relatorio_cores["fios"]], hide_index=True, use_container_width=True)
 
     # --- NOVO MOTOR DE LETREIROS COM CORREÇÃO PARA O MODO RADIAL ---
     elif modo_entrada == "🔤 Escrever Nome (Letreiro)":
@@ -130,35 +181,16 @@ with tab_gerador:
         with col_c2: cor_letra_txt = st.color_picker("Cor da Letra", "#F59E0B")
         
         if texto_usuario:
-            # A fonte bitmap padrão do Python tem aprox 6x11 pixels por letra
-            largura_base = (len(texto_usuario) * 6) + 4
-            altura_base = 13
-            
-            img_txt = Image.new('RGB', (largura_base, altura_base), color=cor_fundo_txt)
-            draw_txt = ImageDraw.Draw(img_txt)
-            draw_txt.text((2, 1), texto_usuario, fill=cor_letra_txt)
-            
-            img_resized_txt = img_txt.resize((largura_base * escala_texto, altura_base * escala_texto), Image.Resampling.NEAREST)
+            origem = ("letreiro", texto_usuario, escala_texto, cor_fundo_txt, cor_letra_txt)
+            img_base, nome_cortado = etapa_letreiro(texto_usuario, escala_texto, cor_fundo_txt, cor_letra_txt, is_radial)
             
             if is_radial:
-                # SE ESTIVER NO MODO PORTA COPO: Cola o nome no centro de uma tela gigante 200x200
-                img_base = Image.new('RGB', (200, 200), color=cor_fundo_txt)
-                
                 # Impede que o nome seja maior que a tela do porta-copo para não quebrar
-                if img_resized_txt.width > 200 or img_resized_txt.height > 200:
-                    st.warning("⚠️ O nome ficou muito grande para o Porta-Copo! Diminua a espessura ou o tamanho do nome.")
-                    img_resized_txt = img_resized_txt.crop((0, 0, 200, 200))
-
-                offset_x = max(0, (200 - img_resized_txt.width) // 2)
-                offset_y = max(0, (200 - img_resized_txt.height) // 2)
-                
-                img_base.paste(img_resized_txt, (offset_x, offset_y))
+                if nome_cortado: st.warning("⚠️ O nome ficou muito grande para o Porta-Copo! Diminua a espessura ou o tamanho do nome.")
                 st.success("✅ O nome foi centralizado com sucesso dentro do molde circular do Porta-copo!")
             else:
                 # SE FOR MODO PLANO: Segue o tamanho exato da palavra
-                img_base = img_resized_txt
-                largura_pontos = largura_base * escala_texto
-                altura_carreiras = altura_base * escala_texto
+                largura_pontos, altura_carreiras = img_base.size
                 st.success(f"**Tamanho ideal gerado automaticamente:** {largura_pontos} pontos x {altura_carreiras} carreiras.")
 
     # --- FORMAS MATEMÁTICAS PERFEITAS ---
@@ -166,16 +198,7 @@ with tab_gerador:
         st.write("### 📐 Padrões Geométricos Perfeitos")
         st.write("Estas formas foram desenhadas na matemática exata para nunca ficarem tortas na sua agulha.")
         
-        padrao_geometrico = st.selectbox("✨ Selecione o desenho:", [
-            "Xadrez 2x2 (Bloquinhos)", 
-            "Xadrez 1x1 (Fino)", 
-            "Listras Horizontais", 
-            "Listras Verticais", 
-            "Diagonal (Escadinha)", 
-            "Ziguezague (Chevron)", 
-            "Moldura / Borda", 
-            "Coração (Pixel Art Perfeito)"
-        ])
+        padrao_geometrico = st.selectbox("✨ Selecione o desenho:", list(motor_croche.PADROES_GEOMETRICOS))
         
         if not is_radial:
             col_tam1, col_tam2 = st.columns(2)
@@ -189,57 +212,16 @@ with tab_gerador:
         with col_c1: cor1_hex = st.color_picker("Cor 1 (Fundo)", cor_f1)
         with col_c2: cor2_hex = st.color_picker("Cor 2 (Desenho)", cor_d1)
         
-        img_base = Image.new('RGB', (largura_pontos, altura_carreiras))
-        px = img_base.load()
-        rgb1, rgb2 = ImageColor.getrgb(cor1_hex), ImageColor.getrgb(cor2_hex)
-        
-        for y in range(altura_carreiras):
-            for x in range(largura_pontos):
-                cx, cy = largura_pontos / 2, altura_carreiras / 2
-                
-                if padrao_geometrico == "Xadrez 2x2 (Bloquinhos)": px[x, y] = rgb1 if (x // 2 + y // 2) % 2 == 0 else rgb2
-                elif padrao_geometrico == "Xadrez 1x1 (Fino)": px[x, y] = rgb1 if (x + y) % 2 == 0 else rgb2
-                elif padrao_geometrico == "Listras Horizontais": px[x, y] = rgb1 if (y // 2) % 2 == 0 else rgb2
-                elif padrao_geometrico == "Listras Verticais": px[x, y] = rgb1 if (x // 2) % 2 == 0 else rgb2
-                elif padrao_geometrico == "Diagonal (Escadinha)": px[x, y] = rgb1 if (x + y) % 3 == 0 else rgb2
-                elif padrao_geometrico == "Ziguezague (Chevron)": px[x, y] = rgb2 if (x + y) % 4 == 0 or (x - y) % 4 == 0 else rgb1
-                elif padrao_geometrico == "Moldura / Borda": px[x, y] = rgb2 if x < 2 or x > largura_pontos - 3 or y < 2 or y > altura_carreiras - 3 else rgb1
-                elif padrao_geometrico == "Coração (Pixel Art Perfeito)":
-                    escala = min(largura_pontos, altura_carreiras) / 2.5
-                    vx, vy = (x - cx) / escala, (cy - y) / (escala * 1.1)
-                    px[x, y] = rgb2 if (vx**2 + vy**2 - 1)**3 - (vx**2) * (vy**3) <= 0 else rgb1
+        origem = ("padrao", padrao_geometrico, largura_pontos, altura_carreiras, cor1_hex, cor2_hex)
+        img_base = etapa_padrao(padrao_geometrico, largura_pontos, altura_carreiras, cor1_hex, cor2_hex)
 
     # --- O MOTOR RADIAL DE COORDENADAS POLARES ---
-    radial_map = {}
-    if is_radial and img_base is not None:
-        total_pontos = 0
-        img_preview = Image.new('RGB', (400, 400), '#1E293B')
-        draw_prev = ImageDraw.Draw(img_preview)
-        
-        for r_idx in range(1, num_carreiras_radial + 1):
-            n_pontos = r_idx * pontos_anel_magico
-            radial_map[r_idx] = []
-            total_pontos += n_pontos
-            for s in range(n_pontos):
-                theta = (s / n_pontos) * 2 * math.pi - (math.pi / 2)
-                dist_pct = r_idx / num_carreiras_radial
-                x = int(100 + (dist_pct * 100) * math.cos(theta))
-                y = int(100 + (dist_pct * 100) * math.sin(theta))
-                x, y = max(0, min(199, x)), max(0, min(199, y))
-                radial_map[r_idx].append(img_base.getpixel((x, y)))
-
-        for r_idx in range(num_carreiras_radial, 0, -1):
-            n_pontos = r_idx * pontos_anel_magico
-            r_out = (r_idx / num_carreiras_radial) * 190
-            for s in range(n_pontos):
-                a1 = (s / n_pontos) * 360 - 90
-                a2 = ((s+1) / n_pontos) * 360 - 90
-                draw_prev.pieslice([200-r_out, 200-r_out, 200+r_out, 200+r_out], a1, a2, fill=radial_map[r_idx][s], outline="#333333")
-                
-        img_processada = img_preview
-    else:
-        img_processada = img_base
-        total_pontos = int(largura_pontos * altura_carreiras) if img_base else 0
+    # Gráfico indexado (motor_croche): montado uma vez, lido pela grade, receita, PNG e orçamento
+    grafico = None
+    if img_base is not None:
+        grafico = etapa_grafico(origem, tipo_peca, num_carreiras_radial, pontos_anel_magico, img_base)
+    img_processada = previa_radial(grafico) if is_radial and grafico else img_base
+    total_pontos = grafico.total if grafico else 0
 
     st.divider()
     estilo_texto = st.radio("", ["🔢 Número da Cor", "📈 Sequência Total do Ponto"])
@@ -248,6 +230,7 @@ with tab_gerador:
         if img_base is not None:
             st.session_state.grafico_ativo = True
             st.session_state.ponto_parada = 1
+            st.session_state.janela_centro = None
         else: st.warning("Configure o padrão primeiro.")
 
     if st.session_state.grafico_ativo and img_base is not None:
@@ -256,163 +239,60 @@ with tab_gerador:
             st.image(img_processada, caption=f"Visão Final ({total_pontos} pontos calculados)", width=350)
             
             st.write("### 📍 Onde você parou?")
+            parada_anterior = st.session_state.ponto_parada
             st.session_state.ponto_parada = st.number_input("Ponto de Parada Atual:", min_value=1, max_value=total_pontos, value=st.session_state.ponto_parada, step=1)
+            if st.session_state.ponto_parada != parada_anterior: st.session_state.janela_centro = None
             st.progress(st.session_state.ponto_parada / total_pontos)
             
-            cores_encontradas = {}
-            contador_cores = 1
-            if is_radial:
-                for r_idx in range(1, num_carreiras_radial + 1):
-                    for rgb in radial_map[r_idx]:
-                        if rgb not in cores_encontradas:
-                            cores_encontradas[rgb] = contador_cores; contador_cores += 1
-            else:
-                pixels = img_base.load()
-                for y in range(altura_carreiras):
-                    for x in range(largura_pontos):
-                        rgb = pixels[x, y]
-                        if rgb not in cores_encontradas:
-                            cores_encontradas[rgb] = contador_cores; contador_cores += 1
-
-            html_grid = "<div style='display:flex; flex-direction:column; gap:4px; padding:15px; background:#111; border-radius:10px; align-items:center; width:100%; max-height: 600px; overflow-y: auto;'>"
+            # --- GRADE EM JANELA: SÓ AS CARREIRAS EM VOLTA DO PONTO ---
+            grade = grade_html(grafico, "Sequência" in estilo_texto)
+            carr_parada = grade.carreira_do_ponto(st.session_state.ponto_parada)
+            visao = st.radio("Visualização da grade:", ["🔎 Janela em volta do ponto", "🧩 Grade completa"], horizontal=True)
             
-            if is_radial:
-                for r_idx in range(num_carreiras_radial, 0, -1):
-                    n_pontos = r_idx * pontos_anel_magico
-                    start_abs = (r_idx - 1) * r_idx // 2 * pontos_anel_magico
-                    
-                    html_grid += "<div style='display:flex; gap:2px; justify-content:center; flex-wrap:wrap; margin-bottom:4px;'>"
-                    html_grid += f"<div style='width: 50px; text-align:right; font-size:11px; margin-right:5px; color:#888; align-self:center;'>C {r_idx}</div>"
-                    
-                    for s in range(n_pontos):
-                        ponto_absoluto = start_abs + s + 1
-                        rgb = radial_map[r_idx][s]
-                        num_cor = cores_encontradas[rgb]
-                        hex_color = '#{:02x}{:02x}{:02x}'.format(rgb[0], rgb[1], rgb[2])
-                        brilho = (rgb[0]*299 + rgb[1]*587 + rgb[2]*114)/1000
-                        cor_texto = "black" if brilho > 128 else "white"
-                        num_exibicao = str(ponto_absoluto) if "Sequência" in estilo_texto else str(num_cor)
-                        
-                        estilo = f"opacity:1; transform:scale(1.4); z-index:50; border:2px solid #00FF00; box-shadow:0 0 10px #00FF00;" if ponto_absoluto == st.session_state.ponto_parada else ("opacity:0.9;" if ponto_absoluto < st.session_state.ponto_parada else "opacity:0.15;")
-                        html_grid += f"<div style='background:{hex_color}; color:{cor_texto}; width:16px; height:16px; border-radius:50%; display:flex; align-items:center; justify-content:center; font-size:8px; font-weight:bold; {estilo}'>{num_exibicao}</div>"
-                    html_grid += "</div>"
+            if "Janela" in visao:
+                raio = st.slider("Carreiras acima e abaixo do ponto", min_value=1, max_value=30, value=5)
+                centro = st.session_state.janela_centro or carr_parada
+                col_j1, col_j2, col_j3, col_j4, col_j5 = st.columns(5)
+                if col_j1.button("⏮️ Início", use_container_width=True): centro = 1
+                if col_j2.button("⬇️ Descer", use_container_width=True): centro = centro - (2 * raio + 1)
+                if col_j3.button("📍 Meu ponto", use_container_width=True): centro = carr_parada
+                if col_j4.button("⬆️ Subir", use_container_width=True): centro = centro + (2 * raio + 1)
+                if col_j5.button("⏭️ Fim", use_container_width=True): centro = grafico.carreiras
+                centro = max(1, min(grafico.carreiras, centro))
+                st.session_state.janela_centro = None if centro == carr_parada else centro
+                de, ate = max(1, centro - raio), min(grafico.carreiras, centro + raio)
+                st.caption(f"Mostrando as carreiras {de} a {ate} de {grafico.carreiras} (você está na carreira {carr_parada}).")
+                st.markdown(grade.html(st.session_state.ponto_parada, de, ate), unsafe_allow_html=True)
             else:
-                for y in range(altura_carreiras):
-                    html_grid += "<div style='display:flex; gap:1px; min-width:max-content;'>"
-                    num_carr = altura_carreiras - y
-                    dir_seta = "⬅️" if "Plana" in tipo_peca and num_carr % 2 == 0 else "➔"
-                    html_grid += f"<div style='width: 40px; text-align:right; font-size:11px; margin-right:5px; color:#888; align-self:center;'>C {num_carr} {dir_seta}</div>"
-                    
-                    for x in range(largura_pontos):
-                        p_carr = x + 1 if "Plana" in tipo_peca and num_carr % 2 == 0 else largura_pontos - x 
-                        ponto_absoluto = ((num_carr - 1) * largura_pontos) + p_carr
-                        rgb = pixels[x, y]
-                        num_cor = cores_encontradas[rgb]
-                        hex_color = '#{:02x}{:02x}{:02x}'.format(rgb[0], rgb[1], rgb[2])
-                        brilho = (rgb[0]*299 + rgb[1]*587 + rgb[2]*114)/1000
-                        cor_texto = "black" if brilho > 128 else "white"
-                        num_exibicao = str(ponto_absoluto) if "Sequência" in estilo_texto else str(num_cor)
-                        
-                        estilo = f"opacity:1; transform:scale(1.4); z-index:50; border:2px solid red;" if ponto_absoluto == st.session_state.ponto_parada else ("opacity:0.9;" if ponto_absoluto < st.session_state.ponto_parada else "opacity:0.15;")
-                        html_grid += f"<div style='background:{hex_color}; color:{cor_texto}; width:18px; height:18px; display:flex; align-items:center; justify-content:center; font-size:9px; font-weight:bold; {estilo}'>{num_exibicao}</div>"
-                    html_grid += "</div>"
-            
-            html_grid += "</div>"
-            st.markdown(html_grid, unsafe_allow_html=True)
+                st.markdown(grade.html(st.session_state.ponto_parada), unsafe_allow_html=True)
 
             with st.expander("📝 Ver Receita Escrita (Passo a Passo)"):
-                sigla_pt = " PB"
-                if "Baixo" in tipo_ponto_base: sigla_pt = " PB"
-                elif "Meio" in tipo_ponto_base: sigla_pt = " MPA"
-                elif "Alto" in tipo_ponto_base: sigla_pt = " PA"
-                elif "Baixíssimo" in tipo_ponto_base: sigla_pt = " PBX"
-                elif "Cores" in tipo_ponto_base: sigla_pt = ""
+                sigla_pt = f" {sigla_ponto}" if sigla_ponto else ""
                 
-                txt_rec = f"RECEITA DE CROCHÊ\nTipo: {tipo_peca}\nPonto Base: {tipo_ponto_base}\nTotal: {total_pontos} pontos\n" + "-"*30 + "\n\n"
-                
-                if is_radial:
-                    st.info(f"💡 Dica Radial: Cada carreira tem os pontos totais marcados. Distribua {pontos_anel_magico} aumentos uniformemente em cada volta!")
-                    for r_idx in range(1, num_carreiras_radial + 1):
-                        seq, cor_atual, cont = [], None, 0
-                        n_pontos = r_idx * pontos_anel_magico
-                        for s in range(n_pontos):
-                            rgb = radial_map[r_idx][s]
-                            num_cor = cores_encontradas[rgb]
-                            if cor_atual is None: cor_atual = num_cor; cont = 1
-                            elif cor_atual == num_cor: cont += 1
-                            else: seq.append(f"{cont}x{sigla_pt} Cor {cor_atual}"); cor_atual = num_cor; cont = 1
-                        if cont > 0: seq.append(f"{cont}x{sigla_pt} Cor {cor_atual}")
-                        
-                        linha = f"**Carr {r_idx}** ({n_pontos} pts): " + ", ".join(seq)
-                        st.markdown(linha)
-                        txt_rec += f"Carr {r_idx} ({n_pontos} pts): " + ", ".join(seq) + "\n"
-                else:
-                    for y in range(altura_carreiras - 1, -1, -1):
-                        num_carr = altura_carreiras - y
-                        dir_seta = "⬅️" if "Plana" in tipo_peca and num_carr % 2 == 0 else "➔"
-                        range_x = range(largura_pontos) if "Plana" in tipo_peca and num_carr % 2 == 0 else range(largura_pontos - 1, -1, -1) 
-                        
-                        seq, cor_atual, cont = [], None, 0
-                        for x in range_x:
-                            rgb = pixels[x, y]
-                            num_cor = cores_encontradas[rgb]
-                            if cor_atual is None: cor_atual = num_cor; cont = 1
-                            elif cor_atual == num_cor: cont += 1
-                            else: seq.append(f"{cont}x{sigla_pt} Cor {cor_atual}"); cor_atual = num_cor; cont = 1
-                        if cont > 0: seq.append(f"{cont}x{sigla_pt} Cor {cor_atual}")
-                        
-                        linha = f"**Carr {num_carr} {dir_seta}:** " + ", ".join(seq)
-                        st.markdown(linha)
-                        txt_rec += f"Carr {num_carr} {dir_seta}: " + ", ".join(seq) + "\n"
-
-                st.download_button("💾 Baixar Receita em Texto", data=txt_rec, file_name="minha_receita.txt")
+                if is_radial: st.info(f"💡 Dica Radial: Cada carreira tem os pontos totais marcados. Distribua {pontos_anel_magico} aumentos uniformemente em cada volta!")
+                # A receita só é montada quando pedida (e fica em cache pro mesmo gráfico)
+                if st.toggle("Montar a receita deste gráfico"):
+                    linhas_receita, txt_rec = etapa_receita(grafico, sigla_pt, tipo_peca, tipo_ponto_base)
+                    st.markdown("\n\n".join(linhas_receita))
+                    st.download_button("💾 Baixar Receita em Texto", data=txt_rec, file_name="minha_receita.txt")
 
             if not is_radial:
-                tamanho_quadrado = 40 
-                margem = 60 
-                largura_img, altura_img = (largura_pontos * tamanho_quadrado) + (margem * 2), (altura_carreiras * tamanho_quadrado) + (margem * 2)
-                img_download = Image.new('RGB', (largura_img, altura_img), color='white')
-                draw = ImageDraw.Draw(img_download)
-                
-                for y in range(altura_carreiras):
-                    for x in range(largura_pontos):
-                        rgb = pixels[x, y]
-                        x0, y0 = (x * tamanho_quadrado) + margem, (y * tamanho_quadrado) + margem
-                        draw.rectangle([x0, y0, x0+tamanho_quadrado, y0+tamanho_quadrado], fill=rgb, outline="black")
-                        if largura_pontos <= 100:
-                            num_cor = cores_encontradas[rgb]
-                            brilho = (rgb[0]*299 + rgb[1]*587 + rgb[2]*114)/1000
-                            cor_texto_dl = "black" if brilho > 128 else "white"
-                            if "Sequência" in estilo_texto:
-                                num_carr = altura_carreiras - y
-                                ponto_na_carr = x + 1 if "Plana" in tipo_peca and num_carr % 2 == 0 else largura_pontos - x
-                                numero_dl = str(((num_carr - 1) * largura_pontos) + ponto_na_carr)
-                            else: numero_dl = str(num_cor)
-                            draw.text((x0 + 5, y0 + 10), numero_dl, fill=cor_texto_dl)
-
-                for y_line in range(0, altura_carreiras + 1, 5):
-                    yp = (y_line * tamanho_quadrado) + margem
-                    draw.line([(margem, yp), (largura_img - margem, yp)], fill="red", width=3)
-                for x_line in range(0, largura_pontos + 1, 5):
-                    xp = (x_line * tamanho_quadrado) + margem
-                    draw.line([(xp, margem), (xp, altura_img - margem)], fill="red", width=3)
-
-                for y_num in range(altura_carreiras):
-                    num_carr = altura_carreiras - y_num
-                    dir = "<-" if "Plana" in tipo_peca and num_carr % 2 == 0 else "->"
-                    y_pos = (y_num * tamanho_quadrado) + margem + 12
-                    draw.text((10, y_pos), f"C{num_carr} {dir}", fill="black")
-                    draw.text((largura_img - margem + 10, y_pos), f"C{num_carr} {dir}", fill="black")
-
-                for x_num in range(largura_pontos):
-                    if (x_num + 1) % 5 == 0 or x_num == 0 or x_num == largura_pontos - 1:
-                        x_pos = (x_num * tamanho_quadrado) + margem + 15
-                        draw.text((x_pos, margem - 25), str(x_num + 1), fill="black")
-                        draw.text((x_pos, altura_img - margem + 10), str(x_num + 1), fill="black")
+                # Exportador em paleta (motor_croche): sprites por célula e páginas do tamanho de uma folha A4
+                formatos = ["🖨️ PDF em páginas (A4)", "📦 Páginas em PNG (.zip)"]
+                if grafico.total <= motor_croche.MAX_PONTOS_PNG_UNICO: formatos.insert(0, "🖼️ Tabuleiro inteiro (PNG)")
+                formato = st.radio("Formato do tabuleiro para baixar:", formatos, horizontal=True)
                 
-                buf = io.BytesIO()
-                img_download.save(buf, format="PNG")
-                st.download_button("📥 Baixar Tabuleiro Estático (PNG)", data=buf.getvalue(), file_name="grafico_regua.png", mime="image/png", type="secondary")
+                # O arquivo só é desenhado quando pedido; trocar o ponto de parada não redesenha nada
+                sequencia = "Sequência" in estilo_texto
+                pedido = (grafico.assinatura, sequencia, formato)
+                if st.button("⚙️ Preparar arquivo do tabuleiro", use_container_width=True): st.session_state.exportacao = pedido
+                if st.session_state.exportacao == pedido:
+                    if "PNG)" in formato:
+                        st.download_button("📥 Baixar Tabuleiro Estático (PNG)", data=exportar_grafico(grafico, sequencia, "png"), file_name="grafico_regua.png", mime="image/png", type="secondary")
+                    elif "PDF" in formato:
+                        st.download_button("📥 Baixar Tabuleiro para Imprimir (PDF)", data=exportar_grafico(grafico, sequencia, "pdf"), file_name="grafico_regua.pdf", mime="application/pdf", type="secondary")
+                    else:
+                        st.download_button("📥 Baixar Páginas do Tabuleiro (ZIP)", data=exportar_grafico(grafico, sequencia, "zip"), file_name="grafico_paginas.zip", mime="application/zip", type="secondary")
 
         except Exception as e: st.error(f"Erro no processamento: {e}")
 
@@ -422,60 +302,66 @@ with tab_gerador:
     # INTEGRAÇÃO FINANCEIRA COM INVENTÁRIO
     # ==========================================
     st.header("💰 Parte 2: Orçamento Integrado")
-    metros_gastos = total_pontos * 0.045
-
-    st.write("Selecione o fio que vai usar (Opcional):")
-    opcoes_fios = ["Inserir Manualmente"] + list(bd["inventario"].keys())
-    fio_selecionado = st.selectbox("Fio principal:", opcoes_fios)
+    # Metros de cada cor saem da contagem guardada no gráfico, no ponto base escolhido
+    metros_por_cor = motor_croche.consumo_por_cor(grafico, sigla_ponto) if grafico else []
+    metros_gastos = float(sum(metros_por_cor))
+
+    st.write("Associe cada cor do gráfico ao fio que vai usar (Opcional):")
+    opcoes_fios = ["Inserir Manualmente"] + list(inventario.keys())
+    fio_da_cor = []
+    if grafico:
+        # Cor cadastrada igual à do gráfico (ex.: foto casada com os fios) já vem escolhida
+        fio_pela_cor = {dados["cor"].lower(): nome for nome, dados in inventario.items() if dados["cor"]}
+        contagem_cores = grafico.contagem()
+        for i, hex_cor in enumerate(grafico.hexes):
+            col_cor, col_fio = st.columns([2, 3])
+            col_cor.markdown(f"<span style='display:inline-block;width:14px;height:14px;background:{hex_cor};border:1px solid #888;'></span> "
+                             f"**Cor {i + 1}** · {contagem_cores[i]} pts · {metros_por_cor[i]:.2f}m", unsafe_allow_html=True)
+            escolha = col_fio.selectbox(f"Fio da Cor {i + 1}", opcoes_fios, index=opcoes_fios.index(fio_pela_cor.get(hex_cor, "Inserir Manualmente")),
+                                        key=f"fio_{grafico.assinatura}_{i}", label_visibility="collapsed")
+            fio_da_cor.append(None if escolha == "Inserir Manualmente" else escolha)
+    consumo = motor_croche.consumo_por_fio(grafico, sigla_ponto, fio_da_cor) if grafico else {}
+    metros_manuais = metros_gastos - sum(metros for _, metros in consumo.values())
 
     col_calc1, col_calc2 = st.columns(2)
     with col_calc1:
-        if fio_selecionado == "Inserir Manualmente":
+        preco_novelo, metros_novelo = 18.0, 150.0
+        if not consumo or None in fio_da_cor:
             preco_novelo = st.number_input("Preço do Novelo (R$)", min_value=0.0, value=18.0)
             metros_novelo = st.number_input("Metros no Novelo (m)", min_value=1.0, value=150.0)
-        else:
-            preco_novelo = bd["inventario"][fio_selecionado]["preco"]
-            metros_novelo = bd["inventario"][fio_selecionado]["metros_total"]
-            st.info(f"Fio associado: Custa R$ {preco_novelo:.2f} por {metros_novelo}m. (Restam {bd['inventario'][fio_selecionado]['metros_restantes']:.2f}m)")
+        for fio, (_, metros) in consumo.items():
+            dados = inventario[fio]
+            st.info(f"{fio}: {metros:.2f}m desta peça. Custa R$ {dados['preco']:.2f} por {dados['metros_total']}m. (Restam {dados['metros_restantes']:.2f}m)")
+            if dados["metros_restantes"] < metros: st.warning(f"⚠️ O fio '{fio}' não tem metros suficientes para esta peça!")
             
     with col_calc2:
         valor_hora = st.number_input("Sua Hora de Trabalho (R$/h)", min_value=0.0, value=25.0, step=1.0)
         margem_lucro = st.number_input("Margem de Lucro (%)", min_value=0.0, value=30.0, step=5.0)
 
-    custo_material = metros_gastos * (preco_novelo / metros_novelo)
-    minutos_totais = total_pontos / 20
-    horas_totais = minutos_totais / 60
-    custo_tempo = horas_totais * valor_hora
-    taxa_desgaste = 1.50 
-    custo_producao = custo_material + custo_tempo + taxa_desgaste
-    valor_lucro = custo_producao * (margem_lucro / 100)
-    preco_final = custo_producao + valor_lucro
+    custo_material = metros_manuais * (preco_novelo / metros_novelo)
+    custo_material += sum(metros * (inventario[fio]["preco"] / inventario[fio]["metros_total"]) for fio, (_, metros) in consumo.items())
+    orc = motor_croche.orcamento(total_pontos, custo_material, valor_hora, margem_lucro)
+    minutos_totais, horas_totais = orc["minutos"], orc["minutos"] / 60
+    custo_tempo, custo_producao, valor_lucro, preco_final = orc["custo_tempo"], orc["custo_producao"], orc["lucro"], orc["preco_final"]
 
     st.write("### 🧾 Relatório Financeiro")
     col_res1, col_res2, col_res3 = st.columns(3)
     col_res1.metric("Tempo", f"{int(horas_totais)}h {int(minutos_totais % 60)}m")
-    col_res2.metric("Material", f"R$ {custo_material:.2f}")
+    col_res2.metric("Material", f"R$ {custo_material:.2f}", f"{metros_gastos:.2f}m de fio", delta_color="off")
     col_res3.metric("Mão de Obra", f"R$ {custo_tempo:.2f}")
     st.success(f"### Preço de Venda Sugerido: R$ {preco_final:.2f}")
 
-    if fio_selecionado != "Inserir Manualmente":
+    if consumo and None not in fio_da_cor:
         if st.button("✅ Confirmar Produção e Gerar Orçamento", type="primary"):
-            if bd["inventario"][fio_selecionado]["metros_restantes"] >= metros_gastos:
-                bd["inventario"][fio_selecionado]["metros_restantes"] -= metros_gastos
-                bd["lucro_acumulado"] += valor_lucro
-                bd["pecas_produzidas"] += 1
-                
-                data_atual = datetime.now().strftime("%d/%m/%Y %H:%M")
-                novo_registro = {
-                    "Data": data_atual, "Fio Usado": fio_selecionado, "Total de Pontos": total_pontos,
-                    "Metros Gastos": round(metros_gastos, 2), "Custo de Producao (R$)": round(custo_producao, 2),
-                    "Lucro (R$)": round(valor_lucro, 2), "Preco de Venda (R$)": round(preco_final, 2)
-                }
-                bd["historico_vendas"].append(novo_registro)
-                guardar_bd(bd)
-                st.success(f"Orçamento arquivado! Foram descontados {metros_gastos:.2f}m do estoque de '{fio_selecionado}'.")
-            else:
-                st.error("⚠️ Atenção: Você não tem metros suficientes no estoque para produzir esta peça!")
+            # Todos os fios descontados na mesma transação, e só se ainda houver metros na hora de gravar
+            try:
+                livro.confirmar_producao(consumo, total_pontos, custo_producao, valor_lucro, preco_final)
+                descontos = ", ".join(f"{metros:.2f}m de '{fio}'" for fio, (_, metros) in consumo.items())
+                st.success(f"Orçamento arquivado! Foram descontados do estoque: {descontos}.")
+            except banco_croche.EstoqueInsuficiente as e:
+                st.error(f"⚠️ Atenção: Você não tem metros suficientes do fio '{e}' para produzir esta peça! Nada foi descontado.")
+    elif consumo:
+        st.caption("Associe todas as cores a fios do estoque para confirmar a produção e descontar os metros.")
 
 # ==========================================
 # SEPARADOR 2: GESTÃO E RELATÓRIOS
@@ -483,38 +369,67 @@ with tab_gerador:
 with tab_gestao:
     st.header("📦 Gestão de Estoque e Finanças")
     st.write("### 📈 Balanço Geral")
+    lucro_acumulado, pecas_produzidas = livro.totais()
     col_ind1, col_ind2 = st.columns(2)
-    col_ind1.metric("Lucro Acumulado", f"R$ {bd['lucro_acumulado']:.2f}")
-    col_ind2.metric("Orçamentos Confirmados", f"{bd['pecas_produzidas']} peças")
+    col_ind1.metric("Lucro Acumulado", f"R$ {lucro_acumulado:.2f}")
+    col_ind2.metric("Orçamentos Confirmados", f"{pecas_produzidas} peças")
     
-    if len(bd["historico_vendas"]) > 0:
-        csv_buffer = io.StringIO()
-        cabecalhos = ["Data", "Fio Usado", "Total de Pontos", "Metros Gastos", "Custo de Producao (R$)", "Lucro (R$)", "Preco de Venda (R$)"]
-        writer = csv.DictWriter(csv_buffer, fieldnames=cabecalhos, delimiter=';')
-        writer.writeheader()
-        writer.writerows(bd["historico_vendas"])
-        st.download_button("📉 Baixar Relatório Completo (Planilha CSV)", data=csv_buffer.getvalue(), file_name="relatorio_orcamentos_croche.csv", mime="text/csv", type="primary")
+    # --- RESUMOS: somados a cada venda gravada, então abrir a aba não relê o histórico ---
+    primeira_venda, ultima_venda = livro.intervalo_datas()
+    if primeira_venda:
+        aba_mes, aba_fio, aba_tamanho = st.tabs(["📅 Por mês", "🧶 Por fio", "📏 Por tamanho da peça"])
+        for aba, dimensao, titulo in ((aba_mes, "mes", "Mês"), (aba_fio, "fio", "Fio"), (aba_tamanho, "tamanho", "Tamanho")):
+            with aba:
+                linhas = livro.resumo(dimensao)
+                tabela = {titulo: [l["chave"] for l in linhas],
+                          "Peças": [l["pecas"] for l in linhas],
+                          "Metros": [round(l["metros"], 2) for l in linhas],
+                          "Faturamento (R$)": [round(l["faturamento"], 2) for l in linhas],
+                          "Lucro (R$)": [round(l["lucro"], 2) for l in linhas]}
+                st.dataframe(tabela, hide_index=True, use_container_width=True)
+                st.bar_chart(tabela, x=titulo, y=["Faturamento (R$)", "Lucro (R$)"], stack=False)
+
+        # --- RELATÓRIO: montado só quando pedido, em lotes, só com o período escolhido ---
+        st.write("### 📉 Relatório de Vendas")
+        periodo = st.date_input("Período do relatório", value=(primeira_venda, ultima_venda), format="DD/MM/YYYY")
+        de, ate = (periodo[0], periodo[-1]) if periodo else (primeira_venda, ultima_venda)
+        formatos_relatorio = ["📄 CSV (planilha simples)"] + (["📗 Excel (.xlsx)"] if banco_croche.xlsx_disponivel() else [])
+        formato_relatorio = st.radio("Formato do relatório:", formatos_relatorio, horizontal=True)
+        pedido_relatorio = (de, ate, formato_relatorio)
+        
+        if st.button("⚙️ Preparar relatório", use_container_width=True):
+            arquivo = io.BytesIO()
+            if "xlsx" in formato_relatorio: banco_croche.escrever_xlsx(livro.vendas(de, ate), arquivo)
+            else: banco_croche.escrever_csv(livro.vendas(de, ate), arquivo)
+            st.session_state.relatorio = (pedido_relatorio, arquivo.getvalue())
+        if st.session_state.relatorio and st.session_state.relatorio[0] == pedido_relatorio:
+            nome_base = f"relatorio_orcamentos_croche_{de:%Y%m%d}_{ate:%Y%m%d}"
+            if "xlsx" in formato_relatorio:
+                st.download_button("📉 Baixar Relatório (Excel)", data=st.session_state.relatorio[1], file_name=nome_base + ".xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", type="primary")
+            else:
+                st.download_button("📉 Baixar Relatório (Planilha CSV)", data=st.session_state.relatorio[1], file_name=nome_base + ".csv", mime="text/csv", type="primary")
 
     st.divider()
     st.write("### ➕ Registrar Novo Fio no Estoque")
     with st.form("form_inventario", clear_on_submit=True):
-        col_f1, col_f2, col_f3 = st.columns(3)
+        col_f1, col_f2, col_f3, col_f4 = st.columns(4)
         with col_f1: nome_fio = st.text_input("Nome/Cor do Fio")
         with col_f2: preco_fio = st.number_input("Preço (R$)", min_value=0.0, value=18.00, step=0.50)
         with col_f3: metros_fio = st.number_input("Metragem (m)", min_value=1.0, value=150.0, step=1.0)
+        with col_f4: cor_fio = st.color_picker("Cor do novelo", "#FFFFFF")
         if st.form_submit_button("Guardar no Inventário"):
             if nome_fio:
-                bd["inventario"][nome_fio] = {"preco": preco_fio, "metros_total": metros_fio, "metros_restantes": metros_fio}
-                guardar_bd(bd)
+                livro.registrar_fio(nome_fio, preco_fio, metros_fio, cor_fio)
                 st.success(f"Fio '{nome_fio}' registrado com sucesso no estoque!")
                 st.rerun() 
             else: st.error("O nome do fio é obrigatório.")
 
     st.write("### 📋 Seu Estoque Atual")
-    if len(bd["inventario"]) > 0:
-        for nome, dados in bd["inventario"].items():
+    inventario = livro.fios()   # relido: a confirmação lá em cima pode ter acabado de descontar metros
+    if len(inventario) > 0:
+        for nome, dados in inventario.items():
             percentagem = (dados["metros_restantes"] / dados["metros_total"]) * 100
-            st.write(f"**{nome}** (Custo original: R$ {dados['preco']:.2f})")
+            st.write(f"**{nome}** (Custo original: R$ {dados['preco']:.2f})" + (f" · cor {dados['cor']}" if dados["cor"] else " · sem cor cadastrada"))
             st.progress(int(percentagem), text=f"Restam {dados['metros_restantes']:.2f}m de {dados['metros_total']}m")
             if percentagem <= 20: st.warning(f"⚠️ Atenção: O estoque do fio '{nome}' está no fim!")
             st.write("---")
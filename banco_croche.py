@@ -0,0 +1,294 @@
+"""Livro-caixa do Estúdio de Crochê em SQLite (WAL): estoque de fios e histórico de vendas.
+
+Substitui o contabilidade_croche.json, que era lido inteiro a cada rerun e reescrito inteiro a
+cada venda. Aqui cada venda é um INSERT e o desconto do fio é um UPDATE condicional na mesma
+transação: duas abas confirmando ao mesmo tempo não perdem metros nem vendas.
+"""
+import io
+import os
+import csv
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+ARQUIVO_BANCO = os.environ.get("CROCHE_DB", "contabilidade_croche.db")
+FICHEIRO_JSON_ANTIGO = "contabilidade_croche.json"
+FORMATO_DATA = "%d/%m/%Y %H:%M"       # como a data aparece no app e no CSV
+FORMATO_DATA_BANCO = "%Y-%m-%d %H:%M"  # como fica gravada (ordena e agrupa por mês direto no SQL)
+
+# Colunas do histórico, na ordem do CSV que o app sempre exportou
+COLUNAS_VENDAS = ["Data", "Fio Usado", "Total de Pontos", "Metros Gastos", "Custo de Producao (R$)", "Lucro (R$)", "Preco de Venda (R$)"]
+
+# Faixas de tamanho da peça (em pontos) para o resumo por tamanho; a última não tem teto
+FAIXAS_TAMANHO = [(500, "Pequena (até 500 pts)"), (2000, "Média (501 a 2.000 pts)"),
+                  (10000, "Grande (2.001 a 10.000 pts)"), (None, "Gigante (mais de 10.000 pts)")]
+LOTE_EXPORTACAO = 2000
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+def faixa_tamanho(total_pontos):
+    for teto, nome in FAIXAS_TAMANHO:
+        if teto is None or total_pontos <= teto: return nome
+
+class Livro:
+    def __init__(self, caminho=ARQUIVO_BANCO):
+        self.caminho = caminho
+        self.conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self.trava = threading.Lock()
+        with self.trava:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS fios (
+                nome TEXT PRIMARY KEY,
+                preco REAL NOT NULL,
+                metros_total REAL NOT NULL,
+                metros_restantes REAL NOT NULL)""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS vendas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data TEXT NOT NULL,
+                fio TEXT NOT NULL,
+                total_pontos INTEGER NOT NULL,
+                metros REAL NOT NULL,
+                custo REAL NOT NULL,
+                lucro REAL NOT NULL,
+                preco_venda REAL NOT NULL)""")
+            # Totais numa linha só, atualizados junto com cada venda: o balanço não soma o histórico
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS totais (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                lucro_acumulado REAL NOT NULL DEFAULT 0,
+                pecas_produzidas INTEGER NOT NULL DEFAULT 0)""")
+            self.conn.execute("INSERT OR IGNORE INTO totais (id) VALUES (1)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+            # Cor do novelo (#rrggbb), usada para casar as cores do gráfico com o estoque; fios antigos ficam sem
+            if "cor" not in [c[1] for c in self.conn.execute("PRAGMA table_info(fios)")]:
+                try: self.conn.execute("ALTER TABLE fios ADD COLUMN cor TEXT")
+                except sqlite3.OperationalError: pass   # outra sessão acabou de criar a coluna
+            self.conn.execute("CREATE INDEX IF NOT EXISTS vendas_data ON vendas (data)")
+            # Quanto de cada fio a venda gastou (uma linha por fio; vendas.fio guarda os nomes juntos)
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS vendas_fios (
+                venda_id INTEGER NOT NULL REFERENCES vendas (id),
+                fio TEXT NOT NULL,
+                pontos INTEGER NOT NULL,
+                metros REAL NOT NULL,
+                PRIMARY KEY (venda_id, fio))""")
+            if not self.conn.execute("SELECT 1 FROM meta WHERE chave='vendas_fios'").fetchone():
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._preencher_vendas_fios(self.conn)
+                self.conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('vendas_fios', ?)", (datetime.now().isoformat(),))
+                self.conn.execute("COMMIT")
+            # Resumos (por mês, por fio, por faixa de tamanho) somados a cada venda, nunca recalculados do histórico
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS resumos (
+                dimensao TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                pecas INTEGER NOT NULL DEFAULT 0,
+                pontos INTEGER NOT NULL DEFAULT 0,
+                metros REAL NOT NULL DEFAULT 0,
+                custo REAL NOT NULL DEFAULT 0,
+                lucro REAL NOT NULL DEFAULT 0,
+                faturamento REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimensao, chave))""")
+            self.conn.create_function("faixa_tamanho", 1, faixa_tamanho, deterministic=True)
+            # Banco criado antes dos resumos existirem: monta uma vez a partir das vendas
+            if not self.conn.execute("SELECT 1 FROM meta WHERE chave='resumos'").fetchone():
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._reconstruir_resumos(self.conn)
+                self.conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('resumos', ?)", (datetime.now().isoformat(),))
+                self.conn.execute("COMMIT")
+
+    @contextmanager
+    def _transacao(self):
+        # BEGIN IMMEDIATE segura a escrita: outra sessão (ou outro processo) espera a vez
+        with self.trava:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # --- LEITURA (o que cada rerun do app precisa) ---
+    def fios(self):
+        """nome -> {"preco", "metros_total", "metros_restantes", "cor"}, no formato do antigo bd["inventario"] (+ cor)."""
+        with self.trava:
+            linhas = self.conn.execute("SELECT nome, preco, metros_total, metros_restantes, cor FROM fios ORDER BY rowid").fetchall()
+        return {nome: {"preco": preco, "metros_total": total, "metros_restantes": restantes, "cor": cor}
+                for nome, preco, total, restantes, cor in linhas}
+
+    def totais(self):
+        """(lucro_acumulado, pecas_produzidas)"""
+        with self.trava:
+            return self.conn.execute("SELECT lucro_acumulado, pecas_produzidas FROM totais WHERE id=1").fetchone()
+
+    def contar_vendas(self):
+        with self.trava:
+            return self.conn.execute("SELECT COUNT(*) FROM vendas").fetchone()[0]
+
+    def intervalo_datas(self):
+        """(primeira, última) data com venda, ou (None, None) sem histórico."""
+        with self.trava:
+            primeira, ultima = self.conn.execute("SELECT MIN(data), MAX(data) FROM vendas").fetchone()
+        if primeira is None: return None, None
+        return (datetime.strptime(primeira, FORMATO_DATA_BANCO).date(), datetime.strptime(ultima, FORMATO_DATA_BANCO).date())
+
+    def resumo(self, dimensao):
+        """Linhas do resumo (mes, fio ou tamanho), já somadas: não lê o histórico."""
+        with self.trava:
+            linhas = self.conn.execute("SELECT chave, pecas, pontos, metros, custo, lucro, faturamento FROM resumos "
+                                       "WHERE dimensao=? ORDER BY chave", (dimensao,)).fetchall()
+        if dimensao == "tamanho":
+            ordem = {nome: i for i, (_, nome) in enumerate(FAIXAS_TAMANHO)}
+            linhas.sort(key=lambda l: ordem.get(l[0], len(ordem)))
+        return [dict(zip(("chave", "pecas", "pontos", "metros", "custo", "lucro", "faturamento"), l)) for l in linhas]
+
+    def vendas(self, de=None, ate=None, lote=LOTE_EXPORTACAO):
+        """Gera o histórico (de/ate são datas, inclusivas) como dicionários com as COLUNAS_VENDAS, em lotes.
+
+        Lê por uma conexão própria (no WAL, leitor não trava quem está gravando venda) e de `lote`
+        em `lote` linhas: o histórico inteiro nunca fica na memória de uma vez.
+        """
+        filtros, parametros = [], []
+        if de: filtros.append("data >= ?"); parametros.append(de.strftime("%Y-%m-%d"))
+        if ate: filtros.append("data < ?"); parametros.append((ate + timedelta(days=1)).strftime("%Y-%m-%d"))
+        sql = "SELECT data, fio, total_pontos, metros, custo, lucro, preco_venda FROM vendas"
+        if filtros: sql += " WHERE " + " AND ".join(filtros)
+        leitor = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            cur = leitor.execute(sql + " ORDER BY data, id", parametros)
+            while True:
+                linhas = cur.fetchmany(lote)
+                if not linhas: break
+                for linha in linhas: yield _venda_para_registro(linha)
+        finally:
+            leitor.close()
+
+    # --- ESCRITA ---
+    def registrar_fio(self, nome, preco, metros, cor=None):
+        """Cadastra o fio (ou recomeça um já cadastrado) com o novelo cheio. cor: "#rrggbb" ou None."""
+        with self._transacao() as conn:
+            conn.execute("INSERT INTO fios (nome, preco, metros_total, metros_restantes, cor) VALUES (?, ?, ?, ?, ?) "
+                         "ON CONFLICT(nome) DO UPDATE SET preco=excluded.preco, metros_total=excluded.metros_total, "
+                         "metros_restantes=excluded.metros_restantes, cor=excluded.cor", (nome, preco, metros, metros, cor))
+
+    def confirmar_producao(self, consumo, total_pontos, custo, lucro, preco_venda, quando=None):
+        """Desconta os metros de cada fio e arquiva a venda, tudo ou nada.
+
+        consumo: nome do fio -> (pontos, metros). Cada desconto só acontece se ainda houver metros
+        suficientes no momento da escrita (UPDATE ... WHERE metros_restantes >= ?); se faltar em
+        qualquer fio nada é gravado e sobe EstoqueInsuficiente com o nome dele.
+        """
+        data = (quando or datetime.now()).strftime(FORMATO_DATA_BANCO)
+        fios = sorted(((nome, pontos, round(metros, 2)) for nome, (pontos, metros) in consumo.items()), key=lambda f: -f[2])
+        metros_total = round(sum(m for _, _, m in fios), 2)
+        with self._transacao() as conn:
+            for nome, _, metros in fios:
+                cur = conn.execute("UPDATE fios SET metros_restantes = metros_restantes - ? WHERE nome=? AND metros_restantes >= ?",
+                                   (metros, nome, metros))
+                if cur.rowcount == 0: raise EstoqueInsuficiente(nome)
+            cur = conn.execute("INSERT INTO vendas (data, fio, total_pontos, metros, custo, lucro, preco_venda) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (data, " + ".join(nome for nome, _, _ in fios), total_pontos, metros_total,
+                                round(custo, 2), round(lucro, 2), round(preco_venda, 2)))
+            conn.executemany("INSERT INTO vendas_fios (venda_id, fio, pontos, metros) VALUES (?, ?, ?, ?)",
+                             [(cur.lastrowid, nome, pontos, metros) for nome, pontos, metros in fios])
+            conn.execute("UPDATE totais SET lucro_acumulado = lucro_acumulado + ?, pecas_produzidas = pecas_produzidas + 1 WHERE id=1",
+                         (lucro,))
+            valores = (round(custo, 2), round(lucro, 2), round(preco_venda, 2))
+            linhas = [("mes", data[:7], total_pontos, metros_total) + valores,
+                      ("tamanho", faixa_tamanho(total_pontos), total_pontos, metros_total) + valores]
+            # Por fio: custo, lucro e faturamento repartidos pela fração de metros (a mesma conta do _reconstruir_resumos)
+            for nome, pontos, metros in fios:
+                fracao = metros / metros_total if metros_total > 0 else 1.0 / len(fios)
+                linhas.append(("fio", nome, pontos, metros) + tuple(v * fracao for v in valores))
+            conn.executemany("INSERT INTO resumos (dimensao, chave, pecas, pontos, metros, custo, lucro, faturamento) "
+                             "VALUES (?, ?, 1, ?, ?, ?, ?, ?) ON CONFLICT(dimensao, chave) DO UPDATE SET "
+                             "pecas=pecas+1, pontos=pontos+excluded.pontos, metros=metros+excluded.metros, custo=custo+excluded.custo, "
+                             "lucro=lucro+excluded.lucro, faturamento=faturamento+excluded.faturamento", linhas)
+
+    def _preencher_vendas_fios(self, conn):
+        """Vendas de um fio só (as antigas e as importadas do JSON) ganham sua linha em vendas_fios."""
+        conn.execute("INSERT INTO vendas_fios (venda_id, fio, pontos, metros) SELECT id, fio, total_pontos, metros FROM vendas "
+                     "WHERE id NOT IN (SELECT venda_id FROM vendas_fios)")
+
+    def _reconstruir_resumos(self, conn):
+        """Refaz os resumos a partir das vendas: só na importação e na primeira abertura de um banco antigo."""
+        conn.execute("DELETE FROM resumos")
+        for dimensao, expressao in (("mes", "substr(data, 1, 7)"), ("tamanho", "faixa_tamanho(total_pontos)")):
+            conn.execute(f"INSERT INTO resumos (dimensao, chave, pecas, pontos, metros, custo, lucro, faturamento) "
+                         f"SELECT ?, {expressao}, COUNT(*), SUM(total_pontos), SUM(metros), SUM(custo), SUM(lucro), SUM(preco_venda) "
+                         f"FROM vendas GROUP BY {expressao}", (dimensao,))
+        conn.execute("INSERT INTO resumos (dimensao, chave, pecas, pontos, metros, custo, lucro, faturamento) "
+                     "SELECT 'fio', f.fio, COUNT(*), SUM(f.pontos), SUM(f.metros), SUM(v.custo * f.fracao), SUM(v.lucro * f.fracao), "
+                     "SUM(v.preco_venda * f.fracao) FROM vendas v JOIN ("
+                     "  SELECT venda_id, fio, pontos, metros, CASE WHEN SUM(metros) OVER w > 0 THEN metros / SUM(metros) OVER w "
+                     "  ELSE 1.0 / COUNT(*) OVER w END AS fracao FROM vendas_fios WINDOW w AS (PARTITION BY venda_id)"
+                     ") f ON f.venda_id = v.id GROUP BY f.fio")
+
+    # --- MIGRAÇÃO DO JSON ANTIGO ---
+    def importar_json(self, caminho=FICHEIRO_JSON_ANTIGO):
+        """Copia o contabilidade_croche.json para o banco uma única vez. Devolve quantas vendas vieram.
+
+        O arquivo JSON fica onde está, como backup; uma marca na tabela meta impede reimportar.
+        """
+        if not os.path.exists(caminho): return 0
+        with self._transacao() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE chave='json_importado'").fetchone(): return 0
+            with open(caminho, "r", encoding="utf-8") as f: dados = json.load(f)
+            for nome, fio in dados.get("inventario", {}).items():
+                conn.execute("INSERT OR REPLACE INTO fios (nome, preco, metros_total, metros_restantes) VALUES (?, ?, ?, ?)",
+                             (nome, fio["preco"], fio["metros_total"], fio["metros_restantes"]))
+            vendas = dados.get("historico_vendas", [])
+            conn.executemany("INSERT INTO vendas (data, fio, total_pontos, metros, custo, lucro, preco_venda) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [_registro_para_venda(r) for r in vendas])
+            self._preencher_vendas_fios(conn)
+            conn.execute("UPDATE totais SET lucro_acumulado=?, pecas_produzidas=? WHERE id=1",
+                         (dados.get("lucro_acumulado", 0.0), dados.get("pecas_produzidas", 0)))
+            self._reconstruir_resumos(conn)
+            conn.execute("INSERT INTO meta (chave, valor) VALUES ('json_importado', ?)", (datetime.now().isoformat(),))
+        print(f"📦 {caminho} importado para o banco: {len(dados.get('inventario', {}))} fios, {len(vendas)} vendas")
+        return len(vendas)
+
+def _registro_para_venda(r):
+    data = datetime.strptime(r["Data"], FORMATO_DATA).strftime(FORMATO_DATA_BANCO)
+    return (data, r["Fio Usado"], r["Total de Pontos"], r["Metros Gastos"], r["Custo de Producao (R$)"],
+            r["Lucro (R$)"], r["Preco de Venda (R$)"])
+
+def _venda_para_registro(linha):
+    data = datetime.strptime(linha[0], FORMATO_DATA_BANCO).strftime(FORMATO_DATA)
+    return dict(zip(COLUNAS_VENDAS, (data,) + tuple(linha[1:])))
+
+# ==========================================
+# EXPORTAÇÃO DO HISTÓRICO (CSV / XLSX)
+# ==========================================
+def csv_em_partes(registros, lote=LOTE_EXPORTACAO):
+    """Gera o CSV (separado por ';', como sempre foi) em pedaços de texto de `lote` linhas."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=COLUNAS_VENDAS, delimiter=';')
+    writer.writeheader()
+    for n, registro in enumerate(registros, 1):
+        writer.writerow(registro)
+        if n % lote == 0:
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+    if buf.tell(): yield buf.getvalue()
+
+def escrever_csv(registros, destino):
+    for parte in csv_em_partes(registros): destino.write(parte.encode("utf-8"))
+
+def xlsx_disponivel():
+    try:
+        import openpyxl  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def escrever_xlsx(registros, destino):
+    """Planilha em modo write-only do openpyxl (opcional): as linhas vão direto pro arquivo."""
+    import openpyxl
+    livro = openpyxl.Workbook(write_only=True)
+    folha = livro.create_sheet("Vendas")
+    folha.append(COLUNAS_VENDAS)
+    for registro in registros: folha.append([registro[c] for c in COLUNAS_VENDAS])
+    livro.save(destino)
@@ -0,0 +1,175 @@
+"""Compara o livro-caixa em SQLite (banco_croche) com o antigo contabilidade_croche.json.
+
+Para cada tamanho de histórico mede:
+- rerun:   o que o app lê a cada interação (JSON: json.load do arquivo todo; SQLite: fios + totais);
+- escrita: uma venda confirmada (JSON: reescreve o arquivo com indent=4; SQLite: UPDATE + INSERT),
+           e no SQLite também uma venda de 6 cores, cada uma num fio;
+- resumos: as três tabelas da aba Gestão (por mês, fio e tamanho), conferidas contra um GROUP BY;
+- csv:     o relatório com o histórico inteiro, gerado em lotes.
+
+Depois dispara vários processos confirmando vendas no mesmo fio ao mesmo tempo e confere se
+algum metro ou venda se perdeu.
+
+    python benchmark_banco.py --tamanhos 100,1000,10000,50000 --processos 4 --vendas 50
+"""
+import io
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from datetime import datetime, timedelta
+
+import banco_croche
+
+# --- O JEITO ANTIGO (cópia do que o app.py fazia) ---
+def carregar_bd(caminho):
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def guardar_bd(caminho, dados):
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(dados, f, indent=4)
+
+def confirmar_json(caminho, fio, metros, lucro):
+    bd = carregar_bd(caminho)
+    if bd["inventario"][fio]["metros_restantes"] < metros: return False
+    bd["inventario"][fio]["metros_restantes"] -= metros
+    bd["lucro_acumulado"] += lucro
+    bd["pecas_produzidas"] += 1
+    bd["historico_vendas"].append({
+        "Data": datetime.now().strftime(banco_croche.FORMATO_DATA), "Fio Usado": fio, "Total de Pontos": 900,
+        "Metros Gastos": metros, "Custo de Producao (R$)": 20.0, "Lucro (R$)": lucro, "Preco de Venda (R$)": 26.0})
+    guardar_bd(caminho, bd)
+    return True
+
+def gerar_json(caminho, n_vendas, metros_fio=1e9):
+    inicio = datetime(2022, 1, 1)
+    fios = {f"Fio {i}": {"preco": 18.0, "metros_total": metros_fio, "metros_restantes": metros_fio} for i in range(10)}
+    vendas = [{"Data": (inicio + timedelta(hours=7 * i)).strftime(banco_croche.FORMATO_DATA), "Fio Usado": f"Fio {i % 10}",
+               "Total de Pontos": 900, "Metros Gastos": 40.5, "Custo de Producao (R$)": 20.0, "Lucro (R$)": 6.0,
+               "Preco de Venda (R$)": 26.0} for i in range(n_vendas)]
+    guardar_bd(caminho, {"inventario": fios, "lucro_acumulado": 6.0 * n_vendas, "pecas_produzidas": n_vendas, "historico_vendas": vendas})
+
+def cronometrar(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000
+
+def medir_tamanho(pasta, n_vendas, repeticoes):
+    arq_json, arq_db = os.path.join(pasta, f"bd_{n_vendas}.json"), os.path.join(pasta, f"bd_{n_vendas}.db")
+    gerar_json(arq_json, n_vendas)
+    tamanho_json = os.path.getsize(arq_json)
+
+    json_rerun = cronometrar(lambda: carregar_bd(arq_json), repeticoes)
+    json_escrita = cronometrar(lambda: confirmar_json(arq_json, "Fio 3", 1.0, 6.0), repeticoes)
+
+    livro = banco_croche.Livro(arq_db)
+    inicio = time.perf_counter()
+    livro.importar_json(arq_json)
+    importar_ms = (time.perf_counter() - inicio) * 1000
+    db_rerun = cronometrar(lambda: (livro.fios(), livro.totais(), livro.contar_vendas()), repeticoes)
+    db_escrita = cronometrar(lambda: livro.confirmar_producao({"Fio 3": (900, 1.0)}, 900, 20.0, 6.0, 26.0), repeticoes)
+    seis_fios = {f"Fio {i}": (150, 0.5 + i) for i in range(6)}
+    db_escrita_6 = cronometrar(lambda: livro.confirmar_producao(seis_fios, 900, 20.0, 6.0, 26.0), repeticoes)
+    resumos_ms = cronometrar(lambda: [livro.resumo(d) for d in ("mes", "fio", "tamanho")], repeticoes)
+    csv_ms = cronometrar(lambda: banco_croche.escrever_csv(livro.vendas(), io.BytesIO()), 1)
+
+    # Os resumos somados venda a venda têm que bater com o histórico
+    incremental = {d: livro.resumo(d) for d in ("mes", "fio", "tamanho")}
+    with livro._transacao() as conn: livro._reconstruir_resumos(conn)
+    resumos_ok = all(_iguais(incremental[d], livro.resumo(d)) for d in incremental)
+    return {"vendas": n_vendas, "json_kb": tamanho_json // 1024, "json_rerun_ms": json_rerun, "json_escrita_ms": json_escrita,
+            "sqlite_rerun_ms": db_rerun, "sqlite_escrita_ms": db_escrita, "sqlite_escrita_6_ms": db_escrita_6, "importar_ms": importar_ms,
+            "resumos_ms": resumos_ms, "csv_ms": csv_ms, "resumos_ok": resumos_ok}
+
+def _iguais(a, b):
+    if [l["chave"] for l in a] != [l["chave"] for l in b]: return False
+    return all(abs(x[c] - y[c]) < 1e-6 for x, y in zip(a, b) for c in ("pecas", "pontos", "metros", "custo", "lucro", "faturamento"))
+
+# --- CONCORRÊNCIA: várias sessões confirmando no mesmo fio ---
+def _sessao(modo, caminho, vendas, largada, saida):
+    livro = banco_croche.Livro(caminho) if modo == "sqlite" else None
+    largada.wait()
+    ok = erros = 0
+    for _ in range(vendas):
+        try:
+            if modo == "sqlite":
+                livro.confirmar_producao({"Fio 0": (900, 1.0)}, 900, 20.0, 6.0, 26.0); ok += 1
+            elif confirmar_json(caminho, "Fio 0", 1.0, 6.0): ok += 1
+        except Exception:
+            erros += 1   # JSON lido pela metade enquanto outra sessão reescrevia
+    saida.put((ok, erros))
+
+def medir_concorrencia(pasta, modo, processos, vendas):
+    arq_json = os.path.join(pasta, f"conc_{modo}.json")
+    gerar_json(arq_json, 0, metros_fio=10000.0)
+    caminho = arq_json
+    if modo == "sqlite":
+        caminho = os.path.join(pasta, "conc.db")
+        banco_croche.Livro(caminho).importar_json(arq_json)
+
+    largada, saida = multiprocessing.Event(), multiprocessing.Queue()
+    filhos = [multiprocessing.Process(target=_sessao, args=(modo, caminho, vendas, largada, saida)) for _ in range(processos)]
+    for f in filhos: f.start()
+    inicio = time.perf_counter()
+    largada.set()
+    resultados = [saida.get() for _ in filhos]
+    for f in filhos: f.join()
+    duracao = time.perf_counter() - inicio
+
+    confirmadas = sum(ok for ok, _ in resultados)
+    erros = sum(e for _, e in resultados)
+    if modo == "sqlite":
+        livro = banco_croche.Livro(caminho)
+        restantes, gravadas = livro.fios()["Fio 0"]["metros_restantes"], livro.contar_vendas()
+    else:
+        try:
+            bd = carregar_bd(caminho)
+            restantes, gravadas = bd["inventario"]["Fio 0"]["metros_restantes"], len(bd["historico_vendas"])
+        except ValueError:
+            restantes, gravadas = float("nan"), 0
+    return {"modo": modo, "confirmadas": confirmadas, "erros": erros, "vendas_gravadas": gravadas,
+            "metros_esperados": 10000.0 - confirmadas, "metros_restantes": restantes, "segundos": duracao}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do livro-caixa: JSON inteiro x SQLite WAL")
+    parser.add_argument("--tamanhos", default="100,1000,10000,50000", help="tamanhos do histórico de vendas")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--processos", type=int, default=4, help="sessões confirmando ao mesmo tempo")
+    parser.add_argument("--vendas", type=int, default=50, help="vendas confirmadas por sessão")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix="bench_banco_")
+    try:
+        print(f"{'vendas':>8}{'json KB':>10}{'json rerun':>12}{'json venda':>12}{'sqlite rerun':>14}{'sqlite venda':>14}{'6 fios':>9}"
+              f"{'resumos':>10}{'csv':>10}{'importar':>10}   (ms, mediana)")
+        resumos_errados = 0
+        for n in [int(t) for t in args.tamanhos.split(",") if t]:
+            r = medir_tamanho(pasta, n, args.repeticoes)
+            if not r["resumos_ok"]: resumos_errados += 1
+            print(f"{r['vendas']:>8}{r['json_kb']:>10}{r['json_rerun_ms']:>12.2f}{r['json_escrita_ms']:>12.2f}"
+                  f"{r['sqlite_rerun_ms']:>14.3f}{r['sqlite_escrita_ms']:>14.3f}{r['sqlite_escrita_6_ms']:>9.3f}{r['resumos_ms']:>10.3f}{r['csv_ms']:>10.1f}"
+                  f"{r['importar_ms']:>10.1f}" + ("" if r["resumos_ok"] else "   ❌ resumos diferentes do histórico"))
+
+        print(f"\n⏳ {args.processos} sessões x {args.vendas} vendas no mesmo fio")
+        perdas = 0
+        for modo in ("json", "sqlite"):
+            r = medir_concorrencia(pasta, modo, args.processos, args.vendas)
+            perdidas = r["confirmadas"] - r["vendas_gravadas"]
+            ok = perdidas == 0 and r["erros"] == 0 and abs(r["metros_restantes"] - r["metros_esperados"]) < 1e-6
+            if modo == "sqlite" and not ok: perdas += 1
+            print(f"{'✅' if ok else '❌'} {modo:<7} confirmadas={r['confirmadas']} gravadas={r['vendas_gravadas']} erros={r['erros']} "
+                  f"metros esperados={r['metros_esperados']:.0f} no arquivo={r['metros_restantes']:.0f} ({r['segundos']:.2f}s)")
+        if perdas or resumos_errados: raise SystemExit(1)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compara a redução de cores antiga (quantize na foto inteira) com a do motor_croche (reduz antes).
+
+Gera uma "foto de celular" sintética em JPEG e, para cada método, mede o tempo até o gráfico plano
+e a qualidade: a diferença média (ΔE em Lab) entre o gráfico e a foto reduzida para o mesmo tamanho
+com BOX. Por fim mede o casamento das cores com um estoque de fios.
+
+    python benchmark_cores.py --foto 4000x3000 --grafico 40x30 --cores 4,8,16
+"""
+import io
+import time
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+import motor_croche
+
+def foto_sintetica(largura, altura, semente=7):
+    """Degradê + formas coloridas + ruído de sensor, salva como JPEG de celular."""
+    rng = np.random.default_rng(semente)
+    y, x = np.mgrid[0:altura, 0:largura].astype(np.float32)
+    fundo = np.stack([255 * x / largura, 255 * y / altura, 128 + 100 * np.sin(x / 300)], axis=-1)
+    img = Image.fromarray(fundo.clip(0, 255).astype(np.uint8))
+    desenho = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = int(rng.integers(0, largura)), int(rng.integers(0, altura))
+        lado = int(rng.integers(largura // 20, largura // 5))
+        desenho.ellipse([x0, y0, x0 + lado, y0 + lado], fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+    img = img.filter(ImageFilter.GaussianBlur(3))
+    ruido = rng.normal(0, 6, (altura, largura, 3))
+    img = Image.fromarray((np.asarray(img, dtype=np.float32) + ruido).clip(0, 255).astype(np.uint8))
+    saida = io.BytesIO()
+    img.save(saida, format="JPEG", quality=90)
+    return saida.getvalue()
+
+def upload_antigo(dados, largura, altura, num_cores):
+    """Cópia do que o app.py fazia antes: quantize na resolução original, depois NEAREST."""
+    img = Image.open(io.BytesIO(dados)).convert('RGB')
+    return img.quantize(colors=num_cores).convert('RGB').resize((largura, altura), Image.Resampling.NEAREST)
+
+def erro_medio(img, referencia):
+    return float(np.linalg.norm(motor_croche.rgb_para_lab(np.asarray(img)) - motor_croche.rgb_para_lab(np.asarray(referencia)), axis=-1).mean())
+
+def cronometrar(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da redução de cores: foto inteira x reduzida antes")
+    parser.add_argument("--foto", default="4000x3000", help="tamanho da foto sintética (12 MP por padrão)")
+    parser.add_argument("--grafico", default="40x30", help="largura x altura do gráfico plano")
+    parser.add_argument("--cores", default="4,8,16")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    lf, af = (int(v) for v in args.foto.split("x"))
+    lg, ag = (int(v) for v in args.grafico.split("x"))
+    dados = foto_sintetica(lf, af)
+    referencia = Image.open(io.BytesIO(dados)).convert('RGB').resize((lg, ag), Image.Resampling.BOX)
+    print(f"📷 foto {lf}x{af} ({len(dados) // 1024} KB) -> gráfico {lg}x{ag}")
+    print(f"\n{'método':<36}{'cores':>7}{'ms':>10}{'ΔE médio':>11}")
+    for num_cores in [int(c) for c in args.cores.split(",") if c]:
+        ms, img = cronometrar(lambda: upload_antigo(dados, lg, ag, num_cores), 1)
+        print(f"{'antigo (foto inteira)':<36}{num_cores:>7}{ms:>10.0f}{erro_medio(img, referencia):>11.2f}")
+        for metodo in motor_croche.metodos_quantizacao():
+            ms, (img, _) = cronometrar(lambda: motor_croche.imagem_do_upload(dados, False, lg, ag, num_cores, metodo), args.repeticoes)
+            print(f"{metodo:<36}{num_cores:>7}{ms:>10.1f}{erro_medio(img, referencia):>11.2f}")
+
+    # Estoque de 40 fios: o casamento compara só a paleta, então não depende do tamanho da foto
+    rng = np.random.default_rng(3)
+    fios = tuple((f"Fio {i}", "#%02X%02X%02X" % tuple(int(c) for c in rng.integers(0, 256, 3))) for i in range(40))
+    img_p = Image.open(io.BytesIO(dados)).reduce(8).convert('RGB').quantize(colors=16)
+    motor_croche.indice_fios(fios)
+    ms, (_, casamento) = cronometrar(lambda: motor_croche.casar_com_fios(img_p, fios), args.repeticoes)
+    print(f"\n🧶 casar 16 cores com {len(fios)} fios: {ms:.2f} ms (ΔE médio {np.mean([c['delta_e'] for c in casamento]):.1f})")
+
+if __name__ == "__main__":
+    main()
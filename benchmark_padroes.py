@@ -0,0 +1,67 @@
+"""Compara o motor vetorizado de padrões (motor_croche) com o laço pixel a pixel antigo do app.py.
+
+Confere que as duas versões geram exatamente a mesma imagem e mostra o tempo de cada uma.
+
+    python benchmark_padroes.py --tamanhos 30,100,300,600
+"""
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import motor_croche
+
+RGB1, RGB2 = (44, 44, 44), (255, 215, 0)
+
+def padrao_laco_antigo(padrao_geometrico, largura_pontos, altura_carreiras, rgb1, rgb2):
+    """Cópia fiel do laço que o app.py usava antes do motor vetorizado."""
+    img_base = Image.new('RGB', (largura_pontos, altura_carreiras))
+    px = img_base.load()
+    for y in range(altura_carreiras):
+        for x in range(largura_pontos):
+            cx, cy = largura_pontos / 2, altura_carreiras / 2
+
+            if padrao_geometrico == "Xadrez 2x2 (Bloquinhos)": px[x, y] = rgb1 if (x // 2 + y // 2) % 2 == 0 else rgb2
+            elif padrao_geometrico == "Xadrez 1x1 (Fino)": px[x, y] = rgb1 if (x + y) % 2 == 0 else rgb2
+            elif padrao_geometrico == "Listras Horizontais": px[x, y] = rgb1 if (y // 2) % 2 == 0 else rgb2
+            elif padrao_geometrico == "Listras Verticais": px[x, y] = rgb1 if (x // 2) % 2 == 0 else rgb2
+            elif padrao_geometrico == "Diagonal (Escadinha)": px[x, y] = rgb1 if (x + y) % 3 == 0 else rgb2
+            elif padrao_geometrico == "Ziguezague (Chevron)": px[x, y] = rgb2 if (x + y) % 4 == 0 or (x - y) % 4 == 0 else rgb1
+            elif padrao_geometrico == "Moldura / Borda": px[x, y] = rgb2 if x < 2 or x > largura_pontos - 3 or y < 2 or y > altura_carreiras - 3 else rgb1
+            elif padrao_geometrico == "Coração (Pixel Art Perfeito)":
+                escala = min(largura_pontos, altura_carreiras) / 2.5
+                vx, vy = (x - cx) / escala, (cy - y) / (escala * 1.1)
+                px[x, y] = rgb2 if (vx**2 + vy**2 - 1)**3 - (vx**2) * (vy**3) <= 0 else rgb1
+    return img_base
+
+def cronometrar(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos padrões geométricos: laço antigo x NumPy")
+    parser.add_argument("--tamanhos", default="30,100,300,600", help="lados dos gráficos (quadrados)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    divergencias = 0
+    print(f"{'padrão':<30}{'tamanho':>9}{'laço ms':>12}{'numpy ms':>12}{'ganho':>9}")
+    for lado in [int(t) for t in args.tamanhos.split(",") if t]:
+        for nome in motor_croche.PADROES_GEOMETRICOS:
+            t_laco, antigo = cronometrar(lambda: padrao_laco_antigo(nome, lado, lado, RGB1, RGB2), args.repeticoes)
+            t_novo, novo = cronometrar(lambda: motor_croche.gerar_padrao(nome, lado, lado, RGB1, RGB2).convert("RGB"), args.repeticoes)
+            igual = np.array_equal(np.asarray(antigo), np.asarray(novo))
+            if not igual: divergencias += 1
+            print(f"{nome:<30}{lado:>9}{t_laco * 1000:>12.2f}{t_novo * 1000:>12.2f}{t_laco / t_novo:>8.0f}x"
+                  + ("" if igual else "   ❌ DIFERENTE"))
+    if divergencias:
+        print(f"\n❌ {divergencias} combinações com resultado diferente do laço antigo")
+        raise SystemExit(1)
+    print("\n✅ Todas as imagens idênticas às do laço antigo")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Mede a partida a frio do robô: importação do estagiario.py e primeira mensagem.
+
+Cada medida roda num processo Python novo (como um host que acabou de acordar do zero):
+
+- ansioso:  importa pypdf, Pillow, requests e Google antes do estagiario, como era antes
+            dos imports preguiçosos;
+- frio:     importa só o estagiario e manda a primeira mensagem sem aquecer;
+- aquecido: importa, roda aquecer() (o que o /healthz faz na partida) e só então manda a mensagem.
+
+O Drive e o Twilio são os falsos do benchmark_robo.py, então o tempo de rede é só a latência simulada.
+
+    python benchmark_partida.py --repeticoes 5 --latencia-drive 0.1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+MODOS = ("ansioso", "frio", "aquecido")
+
+def _filho(modo, latencia):
+    """Roda dentro do processo novo e imprime as medidas em JSON."""
+    medidas = {}
+    inicio = time.perf_counter()
+    if modo == "ansioso":
+        import requests, pypdf, PIL.Image, PIL.ImageOps
+        import google.oauth2.service_account, googleapiclient.discovery, googleapiclient.http, googleapiclient.errors
+    import estagiario
+    medidas["importar_ms"] = (time.perf_counter() - inicio) * 1000
+
+    # O benchmark_robo importa Pillow pra gerar o acervo: ele entra depois de medir o import
+    import benchmark_robo
+    drive = benchmark_robo.DriveFalso(latencia, 0)
+    enviador = benchmark_robo.EnviadorCronometrado()
+    estagiario.get_drive_service = lambda: drive
+    estagiario.ENVIADOR = enviador
+    estagiario.AQUECER_NA_PARTIDA = False
+    pdf = benchmark_robo.gerar_pdf(["extrato do banco nubank " * 10])
+    servidor, base_url = benchmark_robo.subir_servidor_midia({"/doc.pdf": (pdf, "application/pdf")})
+
+    if modo == "aquecido":
+        inicio = time.perf_counter()
+        estagiario.aquecer()
+        medidas["aquecer_ms"] = (time.perf_counter() - inicio) * 1000
+
+    cliente = estagiario.app.test_client()
+    dados = {"MessageSid": "SMpartida", "From": "whatsapp:+5500", "To": "whatsapp:+1000",
+             "NumMedia": "1", "MediaUrl0": f"{base_url}/doc.pdf", "MediaContentType0": "application/pdf"}
+    inicio = time.perf_counter()
+    cliente.post("/bot", data=dados)
+    medidas["primeira_resposta_ms"] = (time.perf_counter() - inicio) * 1000
+    chegada = enviador.esperar("whatsapp:+5500", 60)
+    medidas["primeiro_documento_ms"] = (chegada[0] - inicio) * 1000 if chegada else None
+    servidor.shutdown()
+    print("RESULTADO " + json.dumps(medidas))
+
+def medir_modo(modo, latencia):
+    pasta = tempfile.mkdtemp(prefix="bench_partida_")
+    # Os trabalhadores sobem no primeiro /bot, já com o Drive e o Twilio falsos
+    ambiente = dict(os.environ, FILA_DB=os.path.join(pasta, "fila.db"), CACHE_DIR=os.path.join(pasta, "cache"),
+                    INICIAR_TRABALHADORES="0")
+    saida = subprocess.run([sys.executable, os.path.abspath(__file__), "--filho", modo, "--latencia-drive", str(latencia)],
+                           capture_output=True, text=True, env=ambiente, cwd=os.path.dirname(os.path.abspath(__file__)))
+    for linha in saida.stdout.splitlines():
+        if linha.startswith("RESULTADO "): return json.loads(linha[len("RESULTADO "):])
+    raise RuntimeError(f"processo filho falhou ({modo}):\n{saida.stderr}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de partida a frio do estagiario.py")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--latencia-drive", type=float, default=0.05)
+    parser.add_argument("--filho", choices=MODOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        _filho(args.filho, args.latencia_drive)
+        return
+
+    resultados = {modo: [] for modo in MODOS}
+    for i in range(args.repeticoes):
+        for modo in MODOS:
+            resultados[modo].append(medir_modo(modo, args.latencia_drive))
+        print(f"⏳ rodada {i + 1}/{args.repeticoes}", flush=True)
+
+    colunas = ("importar_ms", "aquecer_ms", "primeira_resposta_ms", "primeiro_documento_ms")
+    print(f"\n{'modo':<10}" + "".join(f"{c:>24}" for c in colunas) + "   (mediana)")
+    for modo in MODOS:
+        linha = f"{modo:<10}"
+        for c in colunas:
+            valores = [r[c] for r in resultados[modo] if r.get(c) is not None]
+            linha += f"{statistics.median(valores):>24.1f}" if valores else f"{'-':>24}"
+        print(linha)
+
+if __name__ == "__main__":
+    main()
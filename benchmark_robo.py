@@ -0,0 +1,433 @@
+"""Benchmark offline do robô do WhatsApp (estagiario.py), sem Twilio e sem Google Drive.
+
+Sobe um servidor local com um acervo gerado de PDFs e fotos, troca o Drive por um
+falso com latência configurável e o Twilio por um enviador que marca a hora da
+resposta, e dispara o /bot com a concorrência pedida.
+
+    python benchmark_robo.py --requisicoes 200 --concorrencia 16 --latencia-drive 0.05
+    python benchmark_robo.py --saida atual.json --base referencia.json --tolerancia 0.2
+
+Sai com código 1 se o p95 passar de --limite-p95 ou piorar mais que --tolerancia
+em relação ao --base (pra travar regressão no CI).
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import http.server
+from concurrent.futures import ThreadPoolExecutor
+
+# A fila e o cache do robô vão pra uma pasta temporária, antes de importar o estagiario
+# (os leitores de PDF reimportam este arquivo, mas já herdam as variáveis: não criam outra pasta)
+if "FILA_DB" not in os.environ or "CACHE_DIR" not in os.environ:
+    _DIR_TEMP = tempfile.mkdtemp(prefix="bench_robo_")
+    os.environ.setdefault("FILA_DB", os.path.join(_DIR_TEMP, "fila.db"))
+    os.environ.setdefault("CACHE_DIR", os.path.join(_DIR_TEMP, "cache"))
+# Os trabalhadores sobem só depois de trocar o Drive e o Twilio pelos falsos
+os.environ.setdefault("INICIAR_TRABALHADORES", "0")
+
+import estagiario
+import leitor_pdf
+import metricas
+
+# ==========================================
+# ACERVO GERADO (PDFs E FOTOS)
+# ==========================================
+PALAVRAS_FILLER = "lorem ipsum documento pagina valor total data cliente referencia numero conta".split()
+
+def gerar_pdf(paginas):
+    """Monta um PDF mínimo, com uma linha de texto Helvetica por página."""
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    filhos = []
+    for texto in paginas:
+        id_pagina = len(objetos) + 1
+        filhos.append(id_pagina)
+        texto = texto.replace("\\", "").replace("(", "").replace(")", "")
+        conteudo = f"BT /F1 10 Tf 40 750 Td ({texto}) Tj ET".encode("latin-1", "replace")
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {id_pagina + 1} 0 R >>".encode())
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in filhos)}] /Count {len(filhos)} >>".encode()
+
+    saida = io.BytesIO()
+    saida.write(b"%PDF-1.4\n")
+    posicoes = []
+    for i, obj in enumerate(objetos, start=1):
+        posicoes.append(saida.tell())
+        saida.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+    inicio_xref = saida.tell()
+    saida.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1))
+    for p in posicoes: saida.write(b"%010d 00000 n \n" % p)
+    saida.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref))
+    return saida.getvalue()
+
+def _texto_pagina(rnd, palavra_chave=None):
+    palavras = [rnd.choice(PALAVRAS_FILLER) for _ in range(60)]
+    if palavra_chave: palavras.insert(rnd.randrange(len(palavras)), palavra_chave)
+    return " ".join(palavras)
+
+def gerar_foto(largura, altura, rnd):
+    """Foto de "documento": fundo claro com ruído e linhas de texto escuras, em JPEG."""
+    from PIL import Image, ImageDraw
+    img = Image.effect_noise((largura, altura), 25).convert("RGB").point(lambda v: 180 + v // 4)
+    desenho = ImageDraw.Draw(img)
+    for y in range(altura // 20, altura - altura // 20, max(12, altura // 60)):
+        desenho.text((largura // 15, y), _texto_pagina(rnd)[:120], fill=(20, 20, 20))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+def palavras_do_cerebro():
+    # Termo com peso vem como ["termo", peso]
+    return [p if isinstance(p, str) else p[0] for lista in estagiario.CEREBRO_DO_ROBO.values() for p in lista]
+
+def gerar_acervo(rnd, paginas=(1, 5, 20, 100), fotos=((1200, 1600), (3000, 4000))):
+    """Devolve {caminho: (bytes, content_type)}."""
+    palavras_chave = palavras_do_cerebro()
+    acervo = {}
+    for n in paginas:
+        # A palavra-chave aparece numa página aleatória: mede também a parada antecipada
+        pagina_chave = rnd.randrange(n)
+        textos = [_texto_pagina(rnd, rnd.choice(palavras_chave) if i == pagina_chave else None) for i in range(n)]
+        acervo[f"/pdf_{n}p.pdf"] = (gerar_pdf(textos), "application/pdf")
+    for largura, altura in fotos:
+        acervo[f"/foto_{largura}x{altura}.jpg"] = (gerar_foto(largura, altura, rnd), "image/jpeg")
+    # PDF escaneado (só imagem, sem camada de texto): exercita o OCR por página
+    from PIL import Image
+    paginas_escaneadas = [Image.open(io.BytesIO(gerar_foto(1240, 1754, rnd))) for _ in range(3)]
+    buf = io.BytesIO()
+    paginas_escaneadas[0].save(buf, format="PDF", save_all=True, append_images=paginas_escaneadas[1:], resolution=150)
+    acervo["/escaneado_3p.pdf"] = (buf.getvalue(), "application/pdf")
+    return acervo
+
+# ==========================================
+# SERVIDOR LOCAL DE MÍDIA (NO LUGAR DO MediaUrl0 DO TWILIO)
+# ==========================================
+def subir_servidor_midia(acervo, unico=True):
+    """Serve o acervo. Com unico=True, '?n=123' muda os bytes finais (o cache por SHA não acerta)."""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            caminho, _, consulta = self.path.partition("?")
+            item = acervo.get(caminho)
+            if item is None:
+                self.send_response(404); self.send_header("Content-Length", "0"); self.end_headers()
+                return
+            corpo, tipo = item
+            if unico and consulta: corpo = corpo + b"\n%" + consulta.encode()  # depois do %%EOF / fim do JPEG
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+# ==========================================
+# DRIVE FALSO (files().create/get/list/export/delete)
+# ==========================================
+class _Pedido:
+    def __init__(self, drive, funcao):
+        self.drive = drive
+        self.funcao = funcao
+
+    def execute(self):
+        self.drive.esperar()
+        return self.funcao()
+
+class _ArquivosFalsos:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def create(self, body=None, media_body=None, fields=None, supportsAllDrives=None):
+        def criar():
+            conteudo = b""
+            if media_body is not None: conteudo = media_body.getbytes(0, media_body.size())
+            return {"id": self.drive.guardar(body or {}, conteudo)}
+        return _Pedido(self.drive, criar)
+
+    def get(self, fileId=None, fields=None, supportsAllDrives=None):
+        def buscar():
+            with self.drive.trava: existe = fileId in self.drive.arquivos
+            if not existe:
+                import httplib2
+                from googleapiclient.errors import HttpError
+                raise HttpError(httplib2.Response({"status": 404}), b"File not found")
+            return {"id": fileId, "trashed": False}
+        return _Pedido(self.drive, buscar)
+
+    def list(self, q="", pageToken=None, **kwargs):
+        def listar():
+            with self.drive.trava:
+                pastas = [{"id": i, "name": a["name"]} for i, a in self.drive.arquivos.items()
+                          if a.get("mimeType") == "application/vnd.google-apps.folder"]
+            if "name = '" in q:
+                nome = q.split("name = '", 1)[1].split("'", 1)[0]
+                pastas = [p for p in pastas if p["name"] == nome]
+            return {"files": pastas}
+        return _Pedido(self.drive, listar)
+
+    def export(self, fileId=None, mimeType=None):
+        return _Pedido(self.drive, lambda: self.drive.resultado_ocr(mimeType))
+
+    def delete(self, fileId=None, supportsAllDrives=None):
+        def apagar():
+            with self.drive.trava: self.drive.arquivos.pop(fileId, None)
+            return ""
+        return _Pedido(self.drive, apagar)
+
+class DriveFalso:
+    """Imita as chamadas do Drive usadas pelo robô, com latência fixa + variação aleatória."""
+
+    def __init__(self, latencia=0.05, variacao=0.02, seed=0):
+        self.latencia = latencia
+        self.variacao = variacao
+        self.rnd = random.Random(seed)
+        self.trava = threading.Lock()
+        self.arquivos = {}
+        self.proximo_id = 0
+        self.chamadas = 0
+        palavras_chave = palavras_do_cerebro()
+        self.texto_ocr = _texto_pagina(self.rnd, self.rnd.choice(palavras_chave))
+        self.pdf_ocr = gerar_pdf([self.texto_ocr])
+
+    def esperar(self):
+        with self.trava:
+            self.chamadas += 1
+            espera = max(0.0, self.latencia + self.rnd.uniform(-self.variacao, self.variacao))
+        if espera: time.sleep(espera)
+
+    def guardar(self, meta, conteudo):
+        with self.trava:
+            self.proximo_id += 1
+            id_arquivo = f"falso{self.proximo_id}"
+            # Só o tamanho: o benchmark não precisa guardar os PDFs enviados
+            self.arquivos[id_arquivo] = dict(meta, tamanho=len(conteudo))
+        return id_arquivo
+
+    def resultado_ocr(self, formato):
+        if formato == "text/plain": return self.texto_ocr.encode("utf-8")
+        return self.pdf_ocr
+
+    def files(self):
+        return _ArquivosFalsos(self)
+
+class EnviadorCronometrado(estagiario.EnviadorFalso):
+    """Guarda a hora em que cada resposta final saiu, pelo número do remetente."""
+
+    def __init__(self):
+        super().__init__()
+        self.chegadas = {}
+        self.condicao = threading.Condition()
+
+    def enviar(self, para, de, texto):
+        super().enviar(para, de, texto)
+        with self.condicao:
+            self.chegadas[para] = (time.perf_counter(), texto)
+            self.condicao.notify_all()
+
+    def esperar(self, para, limite):
+        with self.condicao:
+            self.condicao.wait_for(lambda: para in self.chegadas, timeout=limite)
+            return self.chegadas.get(para)
+
+# ==========================================
+# COLETA DAS ETAPAS (TEMPO E MEMÓRIA)
+# ==========================================
+class ColetorEtapas:
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.amostras = {}
+        self.picos = {}
+        self.abertas = []
+        self.trava = threading.Lock()
+
+    def _dobrar_pico(self):
+        pico = tracemalloc.get_traced_memory()[1]
+        for aberta in self.abertas: aberta[2] = max(aberta[2], pico - aberta[1])
+        tracemalloc.reset_peak()
+
+    def __call__(self, etapa, evento, duracao):
+        with self.trava:
+            if evento == "fim": self.amostras.setdefault(etapa, []).append(duracao)
+            if not self.memoria: return
+            # Etapas aninhadas (documento > ocr): o pico vale pra todas as que estão abertas
+            self._dobrar_pico()
+            if evento == "inicio":
+                self.abertas.append([etapa, tracemalloc.get_traced_memory()[0], 0])
+            else:
+                for i in range(len(self.abertas) - 1, -1, -1):
+                    if self.abertas[i][0] == etapa:
+                        _, _, pico = self.abertas.pop(i)
+                        self.picos[etapa] = max(self.picos.get(etapa, 0), pico)
+                        break
+
+def percentil(valores, p):
+    if not valores: return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))]
+
+def _resumo(valores):
+    return {"n": len(valores), "p50": percentil(valores, 50), "p95": percentil(valores, 95), "p99": percentil(valores, 99)}
+
+# ==========================================
+# EXECUÇÃO
+# ==========================================
+def disparar(cliente, enviador, base_url, caminhos, tipos, requisicoes, concorrencia, anexos, limite, rodada):
+    """Manda as mensagens e espera a resposta final de cada uma. Devolve latências (s) e erros."""
+    latencias, erros = [], 0
+    trava = threading.Lock()
+
+    def uma(i):
+        nonlocal erros
+        para = f"whatsapp:+55{rodada}{i:09d}"
+        dados = {"MessageSid": f"SMbench{rodada}{i}", "From": para, "To": "whatsapp:+10000000000", "NumMedia": str(anexos)}
+        for a in range(anexos):
+            caminho = caminhos[(i + a) % len(caminhos)]
+            dados[f"MediaUrl{a}"] = f"{base_url}{caminho}?n={rodada}-{i}-{a}"
+            dados[f"MediaContentType{a}"] = tipos[caminho]
+        inicio = time.perf_counter()
+        resposta = cliente.post("/bot", data=dados)
+        chegada = enviador.esperar(para, limite) if resposta.status_code == 200 else None
+        with trava:
+            if chegada is None or "❌" in chegada[1]: erros += 1
+            if chegada is not None: latencias.append(chegada[0] - inicio)
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        list(pool.map(uma, range(requisicoes)))
+    return latencias, erros
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do /bot (Drive e Twilio falsos).")
+    parser.add_argument("--requisicoes", type=int, default=100)
+    parser.add_argument("--concorrencia", type=int, default=8, help="mensagens disparadas ao mesmo tempo")
+    parser.add_argument("--anexos", type=int, default=1, help="anexos por mensagem")
+    parser.add_argument("--trabalhadores", type=int, default=estagiario.NUM_TRABALHADORES)
+    parser.add_argument("--latencia-drive", type=float, default=0.05, help="segundos por chamada ao Drive falso")
+    parser.add_argument("--variacao-drive", type=float, default=0.02)
+    parser.add_argument("--paginas", default="1,5,20,100", help="páginas dos PDFs gerados")
+    parser.add_argument("--fotos", default="1200x1600,3000x4000", help="tamanhos das fotos geradas")
+    parser.add_argument("--repetidos", action="store_true", help="manda os mesmos bytes sempre (testa o cache)")
+    parser.add_argument("--sem-memoria", action="store_true", help="pula a rodada serial com tracemalloc")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    parser.add_argument("--base", help="relatório JSON de referência pra comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora máxima do p95 contra a base (0.2 = 20%%)")
+    parser.add_argument("--limite-p95", type=float, help="p95 máximo aceito, em segundos")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    paginas = [int(p) for p in args.paginas.split(",") if p]
+    fotos = [tuple(int(v) for v in f.split("x")) for f in args.fotos.split(",") if f]
+    print("📚 Gerando acervo...")
+    acervo = gerar_acervo(rnd, paginas, fotos)
+    for caminho, (corpo, _) in acervo.items(): print(f"   {caminho}: {len(corpo) // 1024} KB")
+
+    servidor, base_url = subir_servidor_midia(acervo, unico=not args.repetidos)
+    drive = DriveFalso(args.latencia_drive, args.variacao_drive, args.seed)
+    enviador = EnviadorCronometrado()
+    estagiario.get_drive_service = lambda: drive
+    estagiario.ENVIADOR = enviador
+    estagiario.NUM_TRABALHADORES = args.trabalhadores
+    # Os leitores de PDF reimportam o __main__ (este arquivo): o forkserver já deixa o estagiario importado
+    leitor_pdf.iniciar("estagiario")
+    estagiario.iniciar_trabalhadores()
+    cliente = estagiario.app.test_client()
+    caminhos = sorted(acervo)
+    tipos = {c: t for c, (_, t) in acervo.items()}
+    limite = 120 + args.latencia_drive * 10
+
+    relatorio = {"config": vars(args), "acervo": {c: len(b) for c, (b, _) in acervo.items()}}
+
+    # Rodada 1: serial, com tracemalloc, pra medir o pico de memória de cada etapa
+    if not args.sem_memoria:
+        print("🧠 Rodada serial medindo memória por etapa...")
+        coletor = ColetorEtapas(memoria=True)
+        metricas.OUVINTES.append(coletor)
+        tracemalloc.start()
+        disparar(cliente, enviador, base_url, caminhos, tipos, len(caminhos), 1, 1, limite, rodada=1)
+        pico_total = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        metricas.OUVINTES.remove(coletor)
+        # O tracemalloc só enxerga memória alocada pelo Python (os buffers do Pillow ficam de fora)
+        relatorio["memoria_mb"] = {"pico_total": round(pico_total / 1e6, 2),
+                                   "por_etapa": {e: round(p / 1e6, 2) for e, p in sorted(coletor.picos.items())}}
+        enviador.chegadas.clear()
+
+    # Rodada 2: carga com a concorrência pedida
+    print(f"🚀 {args.requisicoes} mensagens, concorrência {args.concorrencia}, {args.trabalhadores} trabalhadores...")
+    coletor = ColetorEtapas()
+    metricas.OUVINTES.append(coletor)
+    chamadas_antes = drive.chamadas
+    inicio = time.perf_counter()
+    latencias, erros = disparar(cliente, enviador, base_url, caminhos, tipos,
+                                args.requisicoes, args.concorrencia, args.anexos, limite, rodada=2)
+    duracao = time.perf_counter() - inicio
+    metricas.OUVINTES.remove(coletor)
+    servidor.shutdown()
+
+    relatorio["ponta_a_ponta_s"] = _resumo(latencias)
+    relatorio["vazao_msgs_por_s"] = round(len(latencias) / duracao, 2) if duracao else None
+    relatorio["erros"] = erros
+    relatorio["chamadas_drive"] = drive.chamadas - chamadas_antes
+    relatorio["etapas_s"] = {e: _resumo(v) for e, v in sorted(coletor.amostras.items())}
+    try:
+        import resource
+        # ru_maxrss vem em KB no Linux
+        relatorio["rss_pico_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        pass
+
+    _imprimir(relatorio)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f: json.dump(relatorio, f, indent=4, ensure_ascii=False)
+
+    sys.exit(_verificar(relatorio, args))
+
+def _ms(v):
+    return "-" if v is None else f"{v * 1000:8.1f}"
+
+def _imprimir(rel):
+    e2e = rel["ponta_a_ponta_s"]
+    print("\n==================== RESULTADO ====================")
+    print(f"Ponta a ponta (ms): p50 {_ms(e2e['p50'])}  p95 {_ms(e2e['p95'])}  p99 {_ms(e2e['p99'])}  (n={e2e['n']})")
+    print(f"Vazão: {rel['vazao_msgs_por_s']} msg/s   Erros: {rel['erros']}   Chamadas ao Drive: {rel['chamadas_drive']}")
+    if "rss_pico_mb" in rel: print(f"RSS pico: {rel['rss_pico_mb']} MB")
+    memoria = rel.get("memoria_mb", {}).get("por_etapa", {})
+    print(f"\n{'etapa':<14}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'pico MB':>10}")
+    for etapa, r in rel["etapas_s"].items():
+        pico = memoria.get(etapa)
+        print(f"{etapa:<14}{r['n']:>6}{_ms(r['p50']):>10}{_ms(r['p95']):>10}{_ms(r['p99']):>10}{'-' if pico is None else pico:>10}")
+
+def _verificar(rel, args):
+    p95 = rel["ponta_a_ponta_s"]["p95"]
+    if p95 is None:
+        print("❌ Nenhuma resposta chegou.")
+        return 1
+    if args.limite_p95 is not None and p95 > args.limite_p95:
+        print(f"❌ p95 {p95:.3f}s passou do limite de {args.limite_p95:.3f}s")
+        return 1
+    if args.base:
+        with open(args.base, "r", encoding="utf-8") as f: base = json.load(f)
+        p95_base = base["ponta_a_ponta_s"]["p95"]
+        if p95_base and p95 > p95_base * (1 + args.tolerancia):
+            print(f"❌ Regressão: p95 {p95:.3f}s contra {p95_base:.3f}s na base (+{(p95 / p95_base - 1) * 100:.0f}%)")
+            return 1
+        print(f"✅ p95 {p95:.3f}s dentro da tolerância (base {p95_base:.3f}s)")
+    return 0
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
-from flask import Flask, request
+from flask import Flask, request, Response
 from twilio.twiml.messaging_response import MessagingResponse
-import requests
 import io
-import unicodedata
-from pypdf import PdfReader
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+import os
+import re
+import json
+import time
+import sqlite3
+import multiprocessing
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import metricas
+import leitor_pdf
+from metricas import medir
+from leitor_pdf import normalizar_texto
+# pypdf, Pillow, requests e as bibliotecas do Google são importados dentro das funções:
+# a primeira resposta pro Twilio não precisa de nenhum deles (ver aquecer())
 
 app = Flask(__name__)
 
@@ -14,37 +26,238 @@ app = Flask(__name__)
 # ⚠️ GARANTA QUE O ID ESTÁ SEM ESPAÇOS EM BRANCO NO FINAL
 FOLDER_ID_RAIZ = "1hxtNpuLtMiwfahaBRQcKrH6w_2cN_YFQ" 
 
+# Fila de trabalhos: o /bot só anota o pedido e responde na hora pro Twilio
+FILA_DB = os.environ.get("FILA_DB", "fila_robo.db")
+NUM_TRABALHADORES = int(os.environ.get("NUM_TRABALHADORES", "2"))
+MAX_TENTATIVAS = 3
+# Por quanto tempo um MessageSid repetido pelo Twilio é reconhecido como a mesma mensagem
+IDEMPOTENCIA_HORAS = float(os.environ.get("IDEMPOTENCIA_HORAS", "24"))
+# Jobs terminados (payload + resposta) ficam na fila por esse tempo e depois são apagados
+JOBS_RETENCAO_HORAS = float(os.environ.get("JOBS_RETENCAO_HORAS", "72"))
+# Aquece tudo (imports, Drive, pastas, dicionário) numa thread assim que os trabalhadores sobem
+AQUECER_NA_PARTIDA = os.environ.get("AQUECER_NA_PARTIDA", "1") == "1"
+# Sobe a fila e os trabalhadores já na importação (gunicorn, flask run...). Quem importa o
+# estagiario só pelas funções (lote, benchmarks, testes) põe "0" e sobe na mão, se quiser
+INICIAR_TRABALHADORES = os.environ.get("INICIAR_TRABALHADORES", "1") == "1"
+
+# Mensagem com vários anexos: quantos anexos o processo inteiro processa juntos (threads fixas,
+# cada uma com o seu cliente do Drive), e quantas chamadas ao Drive ao mesmo tempo (cota da API)
+MAX_ANEXOS_PARALELO = int(os.environ.get("MAX_ANEXOS_PARALELO", "4"))
+LIMITE_GLOBAL_DRIVE = int(os.environ.get("LIMITE_GLOBAL_DRIVE", "8"))
+
+# Cada termo vale 1 ponto; ["termo", peso] muda isso. Termo genérico (que aparece em documento
+# de qualquer pasta) vale meio ponto: "Comprovante de pagamento - Hospital" é de saúde, não de banco.
 CEREBRO_DO_ROBO = {
     "1. Despesas Médicas": ["unimed", "hospital", "clinica", "medico", "dentista", "saude"],
     "2. Educação": ["escola", "faculdade", "universidade", "ensino", "curso"],
     "3. Rendimentos": ["informe", "holerite", "salario", "pro-labore"],
-    "4. Bancos": ["extrato", "banco", "nubank", "caixa", "santander", "comprovante"],
-    "5. Impostos": ["darf", "das", "receita"],
+    "4. Bancos": ["extrato", "banco", "nubank", ["caixa", 0.5], "santander", ["comprovante", 0.5]],
+    # "das" sozinho não serve ("das" = "de + as" aparece em todo texto): o DAS e o DARF dizem isto por extenso
+    "5. Impostos": ["darf", "documento de arrecadacao", ["receita", 0.5]],
     "6. Veículos": ["ipva", "licenciamento", "detran"],
     "7. Imóveis": ["iptu", "aluguel", "condominio"]
 }
 
+# Arquivo opcional no mesmo formato do CEREBRO_DO_ROBO (JSON).
+# Se ele existir, vale ele; se for editado, o robô recarrega sozinho sem reiniciar.
+ARQUIVO_CEREBRO = os.environ.get("ARQUIVO_CEREBRO", "cerebro_do_robo.json")
+
+# Leitura de PDF: para assim que tiver certeza, e nunca passa destes limites
+MAX_PAGINAS_PDF = int(os.environ.get("MAX_PAGINAS_PDF", "50"))
+MAX_CARACTERES_PDF = int(os.environ.get("MAX_CARACTERES_PDF", "200000"))
+TEMPO_MAX_PDF = float(os.environ.get("TEMPO_MAX_PDF", "10"))
+CONFIANCA_ACERTOS = 3  # a pasta líder precisa de pelo menos esses pontos (palavras diferentes x peso)
+CONFIANCA_MARGEM = 2   # ... e dessa vantagem sobre a segunda colocada
+# Página com menos letras que isso (e com imagem) é tratada como escaneada e vai pro OCR
+MIN_CARACTERES_PAGINA = int(os.environ.get("MIN_CARACTERES_PAGINA", "30"))
+MAX_PAGINAS_OCR = int(os.environ.get("MAX_PAGINAS_OCR", "10"))
+
+# Cache pelo conteúdo do arquivo: a mesma foto mandada de novo não passa pelo Drive
+CACHE_DIR = os.environ.get("CACHE_DIR", "cache_docs")
+CACHE_MAX_MB = int(os.environ.get("CACHE_MAX_MB", "500"))
+# Arquivo repetido responde direto do cache; só se a última conferência passou disso é que o robô
+# pergunta pro Drive se o arquivo ainda está lá (e sobe de novo se foi apagado)
+CACHE_CONFERIR_DRIVE_HORAS = float(os.environ.get("CACHE_CONFERIR_DRIVE_HORAS", "24"))
+
+# Download da mídia do Twilio: até MIDIA_EM_MEMORIA_MB fica na RAM, passando disso vai pro disco
+TIMEOUT_DOWNLOAD = (5, 30)  # (conectar, ler) em segundos
+MAX_MIDIA_MB = int(os.environ.get("MAX_MIDIA_MB", "25"))
+MIDIA_EM_MEMORIA_MB = int(os.environ.get("MIDIA_EM_MEMORIA_MB", "5"))
+
+# Tratamento da foto antes do OCR: o OCR do Drive não precisa de 12 megapixels coloridos
+OCR_MAX_LADO = int(os.environ.get("OCR_MAX_LADO", "2200"))  # ~ folha A4 a 200 DPI
+OCR_QUALIDADE_JPEG = int(os.environ.get("OCR_QUALIDADE_JPEG", "80"))
+OCR_CONTRASTE = os.environ.get("OCR_CONTRASTE", "1") == "1"
+OCR_ENDIREITAR = os.environ.get("OCR_ENDIREITAR", "0") == "1"
+OCR_MAX_INCLINACAO = 5  # graus testados pra cada lado ao endireitar
+
+# --- CLIENTE DO DRIVE (UM SÓ POR PROCESSO) ---
+_trava_drive = threading.Lock()
+_credenciais = None
+_local_drive = threading.local()
+
 def get_drive_service():
+    global _credenciais
+    service = getattr(_local_drive, "service", None)
+    if service is not None: return service
     try:
-        creds = service_account.Credentials.from_service_account_file(
-            'service_account.json', 
-            scopes=['https://www.googleapis.com/auth/drive']
-        )
-        # Imprime quem é o robô pra gente ter certeza
-        print(f"🤖 LOGADO COMO: {creds.service_account_email}")
-        return build('drive', 'v3', credentials=creds)
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+        with _trava_drive:
+            if _credenciais is None:
+                _credenciais = service_account.Credentials.from_service_account_file(
+                    'service_account.json', 
+                    scopes=['https://www.googleapis.com/auth/drive']
+                )
+                # Imprime quem é o robô pra gente ter certeza
+                print(f"🤖 LOGADO COMO: {_credenciais.service_account_email}")
+        # O httplib2 não é thread-safe: cada thread tem o seu cliente,
+        # mas a credencial (e o token de acesso) é a mesma pro processo todo
+        service = build('drive', 'v3', credentials=_credenciais, cache_discovery=False)
+        _local_drive.service = service
+        return service
     except Exception as e:
         print(f"❌ ERRO NA CHAVE: {str(e)}")
         return None
 
-def ocr_google_drive(service, arquivo_bytes, nome_arquivo):
+# --- CACHE DOS IDs DAS PASTAS ---
+class CachePastas:
+    """Guarda nome da pasta -> ID no Drive, pra não listar a pasta raiz a cada upload."""
+
+    def __init__(self):
+        self.ids = {}
+        self.trava = threading.Lock()
+
+    def aquecer(self, service):
+        q = f"'{FOLDER_ID_RAIZ}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed=false"
+        pagina = None
+        while True:
+            res = service.files().list(
+                q=q,
+                spaces='drive',
+                corpora='allDrives',
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                fields='nextPageToken, files(id, name)',
+                pageSize=100,
+                pageToken=pagina
+            ).execute()
+            with self.trava:
+                for f in res.get('files', []): self.ids.setdefault(f['name'], f['id'])
+            pagina = res.get('nextPageToken')
+            if not pagina: break
+        return len(self.ids)
+
+    def obter(self, service, nome_pasta):
+        id_pasta = self.ids.get(nome_pasta)
+        if id_pasta: return id_pasta
+        # Só uma thread busca/cria por vez: duas mensagens juntas não criam pasta duplicada
+        with self.trava:
+            id_pasta = self.ids.get(nome_pasta)
+            if id_pasta: return id_pasta
+
+            q = f"name = '{nome_pasta}' and '{FOLDER_ID_RAIZ}' in parents and trashed=false"
+            res = service.files().list(
+                q=q, 
+                spaces='drive', 
+                corpora='allDrives', 
+                includeItemsFromAllDrives=True, 
+                supportsAllDrives=True
+            ).execute().get('files', [])
+
+            if not res:
+                meta = {'name': nome_pasta, 'parents': [FOLDER_ID_RAIZ], 'mimeType': 'application/vnd.google-apps.folder'}
+                id_pasta = service.files().create(body=meta, supportsAllDrives=True).execute()['id']
+            else: 
+                id_pasta = res[0]['id']
+            self.ids[nome_pasta] = id_pasta
+            return id_pasta
+
+    def esquecer(self, nome_pasta):
+        with self.trava: self.ids.pop(nome_pasta, None)
+
+CACHE_PASTAS = CachePastas()
+
+def aquecer_cache_pastas():
     try:
+        service = get_drive_service()
+        if service: print(f"📁 {CACHE_PASTAS.aquecer(service)} pastas no cache")
+    except Exception as e:
+        print(f"❌ ERRO AO AQUECER PASTAS: {str(e)}")
+
+# --- TRATAMENTO DA IMAGEM ANTES DO OCR ---
+def _angulo_inclinacao(img):
+    """Acha o giro que deixa as linhas de texto mais retas (perfil de projeção das linhas)."""
+    from PIL import Image, ImageOps
+    amostra = img.copy()
+    amostra.thumbnail((600, 600))
+    amostra = ImageOps.invert(amostra)  # texto claro em fundo preto: o giro preenche com 0
+    melhor, melhor_nota = 0.0, -1.0
+    for passo in range(-OCR_MAX_INCLINACAO * 2, OCR_MAX_INCLINACAO * 2 + 1):
+        angulo = passo / 2
+        girada = amostra.rotate(angulo, resample=Image.Resampling.BILINEAR, fillcolor=0)
+        # Reduzir pra 1 coluna dá a média de cada linha; linhas retas = picos fortes = variância alta
+        medias = list(girada.resize((1, girada.height), Image.Resampling.BOX).getdata())
+        media = sum(medias) / len(medias)
+        nota = sum((v - media) ** 2 for v in medias)
+        if nota > melhor_nota: melhor, melhor_nota = angulo, nota
+    return melhor
+
+def preprocessar_imagem(arquivo, tipo):
+    """Gira pelo EXIF, passa pra cinza, reduz, ajusta contraste e regrava como JPEG compacto.
+
+    Devolve (arquivo, mime, relatorio). Se o Pillow não abrir a imagem, volta o original
+    com o MIME que o Twilio informou.
+    """
+    arquivo.seek(0, os.SEEK_END)
+    relatorio = {"bytes_antes": arquivo.tell(), "bytes_depois": None, "etapas_ms": {}}
+    arquivo.seek(0)
+    inicio = time.perf_counter()
+
+    def etapa(nome):
+        nonlocal inicio
+        agora = time.perf_counter()
+        relatorio["etapas_ms"][nome] = round((agora - inicio) * 1000, 1)
+        inicio = agora
+
+    try:
+        from PIL import Image, ImageOps
+        img = Image.open(arquivo)
+        img.draft('L', (OCR_MAX_LADO, OCR_MAX_LADO))  # JPEG já decodifica reduzido, bem mais rápido
+        img.load()
+        etapa("abrir")
+        img = ImageOps.exif_transpose(img).convert('L')
+        etapa("girar_cinza")
+        img.thumbnail((OCR_MAX_LADO, OCR_MAX_LADO), Image.Resampling.LANCZOS)
+        etapa("reduzir")
+        if OCR_CONTRASTE:
+            img = ImageOps.autocontrast(img, cutoff=1)
+            etapa("contraste")
+        if OCR_ENDIREITAR:
+            angulo = _angulo_inclinacao(img)
+            if angulo: img = img.rotate(angulo, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+            etapa("endireitar")
+
+        saida = tempfile.SpooledTemporaryFile(max_size=MIDIA_EM_MEMORIA_MB * 1024 * 1024)
+        img.save(saida, format='JPEG', quality=OCR_QUALIDADE_JPEG, optimize=True)
+        etapa("jpeg")
+        relatorio["bytes_depois"] = saida.tell()
+        saida.seek(0)
+        return saida, 'image/jpeg', relatorio
+    except Exception as e:
+        relatorio["erro"] = str(e)
+        arquivo.seek(0)
+        return arquivo, tipo or 'image/jpeg', relatorio
+
+def ocr_google_drive(service, arquivo_bytes, nome_arquivo, mimetype='image/jpeg', formato='application/pdf'):
+    try:
+        from googleapiclient.http import MediaIoBaseUpload
         meta = {
             'name': nome_arquivo, 
             'mimeType': 'application/vnd.google-apps.document',
             'parents': [FOLDER_ID_RAIZ]
         }
-        media = MediaIoBaseUpload(arquivo_bytes, mimetype='image/jpeg', resumable=True)
+        media = MediaIoBaseUpload(arquivo_bytes, mimetype=mimetype, resumable=True)
         
         # O SEGREDO DO 403: supportsAllDrives=True
         arquivo_criado = service.files().create(
@@ -55,100 +268,749 @@ def ocr_google_drive(service, arquivo_bytes, nome_arquivo):
         ).execute()
         
         file_id = arquivo_criado.get('id')
-        pdf_content = service.files().export(fileId=file_id, mimeType='application/pdf').execute()
+        pdf_content = service.files().export(fileId=file_id, mimeType=formato).execute()
         service.files().delete(fileId=file_id, supportsAllDrives=True).execute()
         
         return io.BytesIO(pdf_content), None
     except Exception as e:
         return None, str(e)
 
-def normalizar_texto(texto):
+# --- CLASSIFICADOR COMPILADO ---
+class Placar:
+    """Pontos de cada pasta, somados enquanto o documento vai sendo lido.
+
+    Cada palavra conta uma vez só (com o seu peso): um termo repetido em todas as linhas não
+    vale mais que três termos diferentes da mesma pasta.
+    """
+
+    def __init__(self, ordem):
+        self.ordem = ordem
+        self.contagem = {}   # pasta -> soma dos pesos das palavras diferentes dela que apareceram
+        self.palavras = {}
+        self.primeira = {}
+
+    def vencedor(self):
+        if not self.contagem: return "Geral"
+        # Mais pontos ganha; no empate, quem apareceu primeiro no documento
+        return min(self.contagem, key=lambda p: (-self.contagem[p], self.primeira[p], self.ordem[p]))
+
+    def confiante(self):
+        pontos = sorted(self.contagem.values(), reverse=True) + [0]
+        return pontos[0] >= CONFIANCA_ACERTOS and pontos[0] - pontos[1] >= CONFIANCA_MARGEM
+
+class Classificador:
+    """Compila o dicionário numa regex só e conta os acertos de cada pasta numa única leitura do texto."""
+
+    def __init__(self, tabela):
+        self.pasta_da_palavra = {}
+        self.peso = {}
+        for pasta, palavras in tabela.items():
+            for p in palavras:
+                termo, peso = (p, 1) if isinstance(p, str) else p
+                termo = normalizar_texto(termo)
+                if termo in self.pasta_da_palavra: continue
+                self.pasta_da_palavra[termo] = pasta
+                self.peso[termo] = float(peso)
+        self.ordem = {pasta: i for i, pasta in enumerate(tabela)}
+        # Palavra inteira (aceitando plural com "s"): "curso" não casa dentro de "percurso"
+        termos = sorted(self.pasta_da_palavra, key=len, reverse=True)
+        self.regex = re.compile(r"(?<!\w)(" + "|".join(re.escape(t) for t in termos) + r")s?(?!\w)") if termos else None
+
+    def pontuar(self, texto_limpo, placar=None, deslocamento=0):
+        if placar is None: placar = Placar(self.ordem)
+        if self.regex is None: return placar
+        for m in self.regex.finditer(texto_limpo):
+            pasta = self.pasta_da_palavra[m.group(1)]
+            vistas = placar.palavras.setdefault(pasta, set())
+            if m.group(1) in vistas: continue
+            vistas.add(m.group(1))
+            placar.contagem[pasta] = placar.contagem.get(pasta, 0) + self.peso[m.group(1)]
+            placar.primeira.setdefault(pasta, deslocamento + m.start())
+        return placar
+
+    def escolher(self, texto_limpo):
+        return self.pontuar(texto_limpo).vencedor()
+
+_classificador = None
+_versao_cerebro = None
+_trava_cerebro = threading.Lock()
+
+def obter_classificador():
+    global _classificador, _versao_cerebro
+    try: versao = os.stat(ARQUIVO_CEREBRO).st_mtime
+    except OSError: versao = None
+    if _classificador is not None and versao == _versao_cerebro: return _classificador
+
+    with _trava_cerebro:
+        if _classificador is None or versao != _versao_cerebro:
+            tabela = CEREBRO_DO_ROBO
+            if versao is not None:
+                try:
+                    with open(ARQUIVO_CEREBRO, "r", encoding="utf-8") as f: tabela = json.load(f)
+                except Exception as e:
+                    print(f"❌ ERRO NO {ARQUIVO_CEREBRO}: {str(e)}")
+                    # Arquivo quebrado: segue com o dicionário que já estava valendo
+                    if _classificador is not None:
+                        _versao_cerebro = versao
+                        return _classificador
+            _classificador = Classificador(tabela)
+            _versao_cerebro = versao
+            print(f"🧠 Dicionário compilado: {len(_classificador.pasta_da_palavra)} palavras")
+    return _classificador
+
+# pagina = página em que a pasta escolhida assumiu a liderança de vez (None se ficou em "Geral")
+# paginas_ocr = páginas escaneadas (sem camada de texto) que passaram pelo OCR
+Decisao = namedtuple("Decisao", "pasta pagina paginas_lidas motivo texto paginas_ocr")
+
+def ocr_texto_paginas(service, pdf_paginas):
+    """Manda o PDF só com as páginas escaneadas (todas juntas) num pedido de OCR só."""
+    texto, erro = ocr_google_drive(service, pdf_paginas, "temp_ocr_paginas", 'application/pdf', 'text/plain')
+    if texto is None: raise RuntimeError(erro)
+    return texto.getvalue().decode("utf-8-sig", errors="replace")
+
+def classificar_pdf(pdf_bytes, ocr=None):
+    """Lê o PDF página por página e para assim que a pasta estiver decidida ou estourar um limite.
+
+    A leitura roda num processo filho (leitor_pdf) que é morto quando passa de TEMPO_MAX_PDF:
+    nem um PdfReader nem uma página travada seguram o trabalhador além do prazo.
+    Páginas sem camada de texto ficam de lado. Se as páginas com texto não bastarem pra
+    decidir, e foi passado `ocr(pdf_paginas) -> texto`, elas vão juntas (num PDF só) pro OCR.
+    Sem `ocr`, o motivo volta como "precisa de OCR". Se a leitura parou num limite, não tem OCR.
+    """
     try:
-        texto = texto.lower()
-        return "".join([c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c)])
-    except: return ""
+        classificador = obter_classificador()
+        placar = Placar(classificador.ordem)
+        prazo = time.monotonic() + TEMPO_MAX_PDF
+        lidos, paginas_lidas, pagina_decisiva, lider = 0, 0, None, "Geral"
+        textos, escaneadas, paginas_ocr = [], [], ()
+        motivo = "fim do documento"
+
+        def somar(texto, pagina):
+            nonlocal lidos, lider, pagina_decisiva
+            texto = texto[:MAX_CARACTERES_PDF - lidos]
+            classificador.pontuar(texto, placar, lidos)
+            textos.append(texto)
+            lidos += len(texto) + 1
+            novo_lider = placar.vencedor()
+            if novo_lider != lider: lider, pagina_decisiva = novo_lider, pagina
+
+        with leitor_pdf.LeitorPdf(pdf_bytes, MAX_PAGINAS_PDF, MAX_CARACTERES_PDF, MIN_CARACTERES_PAGINA) as leitor:
+            try:
+                for i, texto, escaneada in leitor.paginas(prazo):
+                    paginas_lidas = i
+                    if escaneada:
+                        escaneadas.append(i)
+                        continue
+                    somar(texto, i)
+                    if placar.confiante():
+                        motivo = "confiante"; break
+                else:
+                    motivo = leitor.motivo_fim or motivo
+                precisa_ocr = escaneadas and not placar.confiante() and not motivo.startswith("limite")
+                if precisa_ocr and ocr is not None:
+                    numeros = tuple(escaneadas[:MAX_PAGINAS_OCR])
+                    try:
+                        pdf_escaneadas = leitor.juntar(numeros, prazo)
+                    except RuntimeError as e:
+                        # O filho falhou ao cortar as páginas: como no OCR que falha, vale o que já foi decidido
+                        motivo, precisa_ocr = f"OCR falhou: {str(e)}", False
+            except leitor_pdf.TempoEsgotado:
+                motivo, precisa_ocr = "limite de tempo", False
+                # Fica no log: um filho travado não pode passar por PDF lento sem ninguém ver
+                metricas.ERROS.inc("pdf_prazo")
+                print(f"⏱️ Leitor de PDF morto no prazo de {TEMPO_MAX_PDF}s (pid {leitor.processo.pid}, {paginas_lidas} página(s) lidas)")
+
+        # O OCR (rede, com seus próprios timeouts) só roda depois que o filho já foi encerrado
+        if precisa_ocr:
+            if ocr is None:
+                motivo = "precisa de OCR"
+            else:
+                try:
+                    # O Drive devolve o texto de todas juntas: conta como a primeira página escaneada
+                    somar(normalizar_texto(ocr(pdf_escaneadas)), numeros[0])
+                    paginas_ocr = numeros
+                    motivo = f"OCR de {len(numeros)} página(s) escaneada(s)"
+                except Exception as e:
+                    # Sem OCR, vale o que as páginas com texto já decidiram
+                    motivo = f"OCR falhou: {str(e)}"
+
+        return Decisao(lider, pagina_decisiva, paginas_lidas, motivo, " ".join(textos), paginas_ocr)
+    except Exception as e:
+        return Decisao("Erro Leitura", None, 0, str(e), "", ())
 
 def decidir_pasta(pdf_bytes):
-    try:
-        reader = PdfReader(pdf_bytes)
-        texto = ""
-        for page in reader.pages: texto += (page.extract_text() or "") + " "
-        texto_limpo = normalizar_texto(texto)
-        for pasta, palavras in CEREBRO_DO_ROBO.items():
-            for p in palavras:
-                if normalizar_texto(p) in texto_limpo: return pasta
-        return "Geral"
-    except: return "Erro Leitura"
+    return classificar_pdf(pdf_bytes).pasta
 
 def salvar_drive(service, pdf_bytes, nome_arq, nome_pasta):
     try:
-        # Busca pasta existente com suporte a drives compartilhados
-        q = f"name = '{nome_pasta}' and '{FOLDER_ID_RAIZ}' in parents and trashed=false"
-        res = service.files().list(
-            q=q, 
-            spaces='drive', 
-            corpora='allDrives', 
-            includeItemsFromAllDrives=True, 
-            supportsAllDrives=True
-        ).execute().get('files', [])
-        
-        if not res:
-            meta = {'name': nome_pasta, 'parents': [FOLDER_ID_RAIZ], 'mimeType': 'application/vnd.google-apps.folder'}
-            id_destino = service.files().create(body=meta, supportsAllDrives=True).execute()['id']
-        else: 
-            id_destino = res[0]['id']
-        
-        meta_arq = {'name': nome_arq, 'parents': [id_destino]}
-        media = MediaIoBaseUpload(pdf_bytes, mimetype='application/pdf')
-        service.files().create(body=meta_arq, media_body=media, supportsAllDrives=True).execute()
-        return True, None
+        from googleapiclient.http import MediaIoBaseUpload
+        from googleapiclient.errors import HttpError
+        for tentativa in range(2):
+            id_destino = CACHE_PASTAS.obter(service, nome_pasta)
+            meta_arq = {'name': nome_arq, 'parents': [id_destino]}
+            media = MediaIoBaseUpload(pdf_bytes, mimetype='application/pdf')
+            try:
+                criado = service.files().create(body=meta_arq, media_body=media, fields='id', supportsAllDrives=True).execute()
+                return criado['id'], None
+            except HttpError as e:
+                # Pasta apagada no Drive: esquece o ID do cache e busca/cria de novo
+                if e.resp.status != 404 or tentativa: raise
+                CACHE_PASTAS.esquecer(nome_pasta)
+                pdf_bytes.seek(0)
     except Exception as e:
         return False, str(e)
 
-@app.route("/bot", methods=['POST'])
-def bot():
-    msg = request.values.get('Body', '')
-    num_media = request.values.get('NumMedia', '0')
-    tipo = request.values.get('MediaContentType0', '') 
-    resp = MessagingResponse()
-    
-    if int(num_media) > 0:
-        url = request.values.get('MediaUrl0')
-        r = requests.get(url)
-        
-        if r.status_code == 401: # Erro do Twilio
-            resp.message("🔒 Erro 401: Desative o 'HTTP Basic Auth' no Twilio.")
-            return str(resp)
+def existe_no_drive(service, id_arquivo):
+    """False quando o Drive diz que o arquivo sumiu (apagado ou na lixeira); None se não deu pra saber."""
+    from googleapiclient.errors import HttpError
+    try:
+        arquivo = service.files().get(fileId=id_arquivo, fields='id, trashed', supportsAllDrives=True).execute()
+        return not arquivo.get('trashed')
+    except HttpError as e:
+        if e.resp.status == 404: return False
+        print(f"⚠️ Não consegui conferir o arquivo no Drive: {str(e)}")
+    except Exception as e:
+        print(f"⚠️ Não consegui conferir o arquivo no Drive: {str(e)}")
+    return None
+
+# --- DOWNLOAD DA MÍDIA ---
+class MidiaGrandeDemais(Exception):
+    pass
+
+_sessao = None
+_trava_sessao = threading.Lock()
+
+def obter_sessao():
+    """Uma sessão HTTP só, com pool de conexões e novas tentativas em erro temporário."""
+    global _sessao
+    with _trava_sessao:
+        if _sessao is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            tentativas = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=tentativas)
+            _sessao = requests.Session()
+            _sessao.mount("https://", adaptador)
+            _sessao.mount("http://", adaptador)
+    return _sessao
+
+def baixar_midia(url):
+    """Baixa em pedaços pra um arquivo temporário, já calculando o SHA-256.
+
+    Devolve (arquivo, sha, status_http). O arquivo vem posicionado no início.
+    """
+    limite = MAX_MIDIA_MB * 1024 * 1024
+    with obter_sessao().get(url, stream=True, timeout=TIMEOUT_DOWNLOAD) as r:
+        if r.status_code != 200: return None, None, r.status_code
+        if int(r.headers.get("Content-Length") or 0) > limite:
+            raise MidiaGrandeDemais(f"arquivo maior que {MAX_MIDIA_MB} MB")
+
+        arquivo = tempfile.SpooledTemporaryFile(max_size=MIDIA_EM_MEMORIA_MB * 1024 * 1024)
+        sha = hashlib.sha256()
+        total = 0
+        for bloco in r.iter_content(chunk_size=64 * 1024):
+            total += len(bloco)
+            if total > limite:
+                arquivo.close()
+                raise MidiaGrandeDemais(f"arquivo maior que {MAX_MIDIA_MB} MB")
+            sha.update(bloco)
+            arquivo.write(bloco)
+        arquivo.seek(0)
+        metricas.BYTES.inc("download", valor=total)
+        metricas.anotar(bytes_midia=total)
+        return arquivo, sha.hexdigest(), r.status_code
+
+# --- CACHE POR CONTEÚDO (SHA-256) ---
+class CacheDocumentos:
+    """Resultado de cada arquivo já processado, pela impressão digital do conteúdo.
+
+    O índice (pasta, ID no Drive, texto) fica no SQLite e o PDF lido fica num arquivo
+    ao lado. Quando passa do tamanho máximo, sai primeiro o que foi usado há mais tempo.
+    """
+
+    def __init__(self, pasta, max_bytes):
+        os.makedirs(pasta, exist_ok=True)
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(os.path.join(pasta, "indice.db"), check_same_thread=False, isolation_level=None)
+        self.trava = threading.Lock()
+        with self.trava:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS docs (
+                sha TEXT PRIMARY KEY,
+                pasta TEXT NOT NULL,
+                drive_id TEXT,
+                texto TEXT,
+                tamanho INTEGER NOT NULL,
+                usado_em REAL NOT NULL,
+                conferido_em REAL)""")
+            # Quando o drive_id foi visto no Drive pela última vez; índices antigos ficam sem (conferem no próximo uso)
+            if "conferido_em" not in [c[1] for c in self.conn.execute("PRAGMA table_info(docs)")]:
+                try: self.conn.execute("ALTER TABLE docs ADD COLUMN conferido_em REAL")
+                except sqlite3.OperationalError: pass   # outro processo acabou de criar a coluna
+            self.conn.execute("CREATE INDEX IF NOT EXISTS docs_usado_em ON docs (usado_em)")
+
+    def _arquivo(self, sha):
+        return os.path.join(self.pasta, f"{sha}.pdf")
+
+    def buscar(self, sha):
+        with self.trava:
+            linha = self.conn.execute("SELECT pasta, drive_id, texto, conferido_em FROM docs WHERE sha=?", (sha,)).fetchone()
+            if not linha: return None
+            self.conn.execute("UPDATE docs SET usado_em=? WHERE sha=?", (time.time(), sha))
+        return {"pasta": linha[0], "drive_id": linha[1], "texto": linha[2], "conferido_em": linha[3]}
+
+    def abrir_pdf(self, sha):
+        return open(self._arquivo(sha), "rb")
+
+    def marcar_conferido(self, sha, drive_id):
+        """O arquivo `drive_id` acabou de ser visto (ou subido de novo) no Drive."""
+        with self.trava:
+            self.conn.execute("UPDATE docs SET drive_id=?, conferido_em=? WHERE sha=?", (drive_id, time.time(), sha))
+
+    def guardar(self, sha, pasta, drive_id, texto, pdf_bytes):
+        pdf_bytes.seek(0)
+        temporario = self._arquivo(sha) + ".tmp"
+        with open(temporario, "wb") as f:
+            while True:
+                bloco = pdf_bytes.read(1024 * 1024)
+                if not bloco: break
+                f.write(bloco)
+        os.replace(temporario, self._arquivo(sha))
+        tamanho = os.path.getsize(self._arquivo(sha)) + len(texto or "")
+        with self.trava:
+            agora = time.time()
+            self.conn.execute("INSERT OR REPLACE INTO docs (sha, pasta, drive_id, texto, tamanho, usado_em, conferido_em) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)", (sha, pasta, drive_id, texto, tamanho, agora, agora))
+            self._despejar()
+
+    def _despejar(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM docs").fetchone()[0]
+        if total <= self.max_bytes: return
+        for sha, tamanho in self.conn.execute("SELECT sha, tamanho FROM docs ORDER BY usado_em").fetchall():
+            if total <= self.max_bytes: break
+            self.conn.execute("DELETE FROM docs WHERE sha=?", (sha,))
+            try: os.remove(self._arquivo(sha))
+            except OSError: pass
+            total -= tamanho
+
+_cache_docs = None
+_trava_cache = threading.Lock()
+
+def obter_cache_docs():
+    global _cache_docs
+    with _trava_cache:
+        if _cache_docs is None: _cache_docs = CacheDocumentos(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024)
+    return _cache_docs
+
+# --- FILA PERSISTENTE (SQLITE) ---
+class FilaJobs:
+    """Fila de documentos gravada em SQLite, pra um restart não perder nada.
+
+    Guarda também cada MessageSid do Twilio já recebido (por IDEMPOTENCIA_HORAS):
+    quando o Twilio repete o POST, a mensagem não vira um segundo job.
+    """
+
+    def __init__(self, caminho):
+        self.conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self.trava = threading.Lock()
+        self.aviso = threading.Event()
+        with self.trava:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dados TEXT NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                resultado TEXT,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL)""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS mensagens (
+                sid TEXT PRIMARY KEY,
+                job_id INTEGER NOT NULL,
+                expira_em REAL NOT NULL)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS mensagens_expira_em ON mensagens (expira_em)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_estado ON jobs (estado, atualizado_em)")
+            # Se o servidor caiu no meio do processamento, o job volta pra fila
+            # (a não ser que ele mesmo derrube o servidor toda vez)
+            self.conn.execute("UPDATE jobs SET estado='falhou', resultado='Excedeu tentativas' "
+                              "WHERE estado='processando' AND tentativas >= ?", (MAX_TENTATIVAS,))
+            self.conn.execute("UPDATE jobs SET estado='pendente' WHERE estado='processando'")
+        self.proxima_limpeza = 0.0
+
+    @contextmanager
+    def _transacao(self):
+        # BEGIN IMMEDIATE segura a escrita: dois processos não pegam/criam o mesmo job
+        with self.trava:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def colocar(self, dados, sid=None):
+        """Enfileira o job. Devolve (novo, estado, resultado); novo=False se o sid já tinha chegado."""
+        agora = time.time()
+        with self._transacao() as conn:
+            if sid:
+                conn.execute("DELETE FROM mensagens WHERE expira_em < ?", (agora,))
+                linha = conn.execute("SELECT j.estado, j.resultado FROM mensagens m JOIN jobs j ON j.id = m.job_id "
+                                     "WHERE m.sid=?", (sid,)).fetchone()
+                if linha: return False, linha[0], linha[1]
+            cur = conn.execute("INSERT INTO jobs (dados, criado_em, atualizado_em) VALUES (?, ?, ?)",
+                               (json.dumps(dados), agora, agora))
+            if sid:
+                conn.execute("INSERT INTO mensagens (sid, job_id, expira_em) VALUES (?, ?, ?)",
+                             (sid, cur.lastrowid, agora + IDEMPOTENCIA_HORAS * 3600))
+        self.aviso.set()
+        return True, "pendente", None
+
+    def pegar(self):
+        with self._transacao() as conn:
+            linha = conn.execute("SELECT id, dados FROM jobs WHERE estado='pendente' ORDER BY id LIMIT 1").fetchone()
+            if linha:
+                conn.execute("UPDATE jobs SET estado='processando', tentativas=tentativas+1, atualizado_em=? WHERE id=?",
+                             (time.time(), linha[0]))
+        if not linha: return None
+        return linha[0], json.loads(linha[1])
+
+    def finalizar(self, job_id, estado, resultado):
+        with self.trava:
+            self.conn.execute("UPDATE jobs SET estado=?, resultado=?, atualizado_em=? WHERE id=?",
+                              (estado, resultado, time.time(), job_id))
+
+    def limpar(self):
+        """Apaga as mensagens vencidas e os jobs terminados há mais de JOBS_RETENCAO_HORAS.
+
+        Um job nunca sai antes do seu MessageSid vencer: a repetição do Twilio ainda precisa dele.
+        """
+        agora = time.time()
+        limite = agora - max(JOBS_RETENCAO_HORAS, IDEMPOTENCIA_HORAS) * 3600
+        with self._transacao() as conn:
+            conn.execute("DELETE FROM mensagens WHERE expira_em < ?", (agora,))
+            apagados = conn.execute("DELETE FROM jobs WHERE estado IN ('concluido', 'falhou') AND atualizado_em < ?",
+                                    (limite,)).rowcount
+        self.proxima_limpeza = agora + 3600
+        return apagados
+
+    def contar(self, estado):
+        with self.trava:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE estado=?", (estado,)).fetchone()[0]
+
+# --- QUEM MANDA A RESPOSTA FINAL ---
+class EnviadorTwilio:
+    """Manda a resposta final pelo WhatsApp usando a API REST do Twilio."""
+
+    def __init__(self):
+        self.cliente = None
+
+    def enviar(self, para, de, texto):
+        if self.cliente is None:
+            from twilio.rest import Client
+            self.cliente = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
+        self.cliente.messages.create(to=para, from_=de, body=texto)
+
+class EnviadorFalso:
+    """Guarda as mensagens na memória. Use nos testes no lugar do Twilio."""
+
+    def __init__(self):
+        self.enviadas = []
+
+    def enviar(self, para, de, texto):
+        self.enviadas.append({"para": para, "de": de, "texto": texto})
+
+# Troque por EnviadorFalso() nos testes
+ENVIADOR = EnviadorTwilio()
+FILA = None
+POOL_ANEXOS = None
+SEMAFORO_DRIVE = threading.BoundedSemaphore(LIMITE_GLOBAL_DRIVE)
+_trava_inicio = threading.Lock()
+_trabalhadores = []
+
+@contextmanager
+def _vez_no_drive():
+    """Espera a vez no SEMAFORO_DRIVE (e mede quanto tempo ficou esperando)."""
+    with medir("espera_drive"): SEMAFORO_DRIVE.acquire()
+    try: yield
+    finally: SEMAFORO_DRIVE.release()
+
+def _erro(tipo, texto):
+    metricas.ERROS.inc(tipo)
+    metricas.anotar(erro=tipo)
+    return texto
+
+def _reaproveitar(cache, sha, ja_salvo):
+    """Resposta pra um arquivo que já está no cache, ou None se precisa processar do zero.
+
+    Normalmente nem fala com o Drive. Se a última conferência passou de CACHE_CONFERIR_DRIVE_HORAS,
+    pergunta se o arquivo ainda está lá; se foi apagado, sobe de novo o PDF guardado no cache,
+    sem ler nem OCR. Se a pergunta falhar, vale o cache (melhor que subir duplicado).
+    """
+    pasta = ja_salvo['pasta']
+    reaproveitado = f"♻️ Esse arquivo já tinha sido salvo na pasta: {pasta}"
+    if time.time() - (ja_salvo['conferido_em'] or 0) < CACHE_CONFERIR_DRIVE_HORAS * 3600:
+        metricas.anotar(cache=True, pasta=pasta)
+        return reaproveitado
+
+    service = get_drive_service()
+    existe = None
+    if service:
+        with _vez_no_drive(), medir("conferir_drive"):
+            existe = existe_no_drive(service, ja_salvo['drive_id'])
+    if existe is not False:
+        if existe: cache.marcar_conferido(sha, ja_salvo['drive_id'])
+        metricas.anotar(cache=True, pasta=pasta)
+        return reaproveitado
+
+    try: pdf = cache.abrir_pdf(sha)
+    except OSError: return None
+    with pdf, _vez_no_drive(), medir("salvar"):
+        id_arquivo, erro_salvar = salvar_drive(service, pdf, f"DOC_Zap_{pasta[:10]}.pdf", pasta)
+    if not id_arquivo:
+        return _erro("salvar", f"❌ Erro 403/Permissão ao salvar final: {erro_salvar}")
+    cache.marcar_conferido(sha, id_arquivo)
+    metricas.DOCUMENTOS.inc(pasta)
+    metricas.anotar(cache=True, reenviado=True, pasta=pasta)
+    return f"✅ Salvo de novo na pasta: {pasta} (tinha sumido do Drive)"
+
+def processar_documento(url, tipo):
+    """Faz o serviço pesado (download, OCR, pasta, upload) e devolve o texto da resposta."""
+    import requests
+    try:
+        with medir("download"):
+            arquivo_original, sha, status = baixar_midia(url)
+    except MidiaGrandeDemais as e:
+        return _erro("midia_grande", f"❌ Arquivo grande demais: {str(e)}")
+    except requests.RequestException as e:
+        return _erro("download", f"❌ Erro ao baixar a mídia: {str(e)}")
+
+    if status == 401: # Erro do Twilio
+        return _erro("twilio_401", "🔒 Erro 401: Desative o 'HTTP Basic Auth' no Twilio.")
+    if not arquivo_original:
+        return _erro("download", f"❌ Erro ao baixar a mídia (HTTP {status})")
+
+    try:
+        cache = obter_cache_docs()
+        ja_salvo = cache.buscar(sha)
+        if ja_salvo:
+            resposta = _reaproveitar(cache, sha, ja_salvo)
+            if resposta: return resposta
 
         service = get_drive_service()
         if not service:
-            resp.message("❌ Erro grave: Não consegui ler a chave JSON no Render.")
-            return str(resp)
+            return _erro("chave", "❌ Erro grave: Não consegui ler a chave JSON no Render.")
 
-        arquivo_original = io.BytesIO(r.content)
         pdf_para_ler = None
         erro_ocr = None
 
         if "image" in tipo:
-            pdf_para_ler, erro_ocr = ocr_google_drive(service, arquivo_original, "temp_ocr")
+            with medir("preprocessar"):
+                imagem, mime, relatorio = preprocessar_imagem(arquivo_original, tipo)
+            metricas.anotar(imagem=relatorio)
+            metricas.BYTES.inc("upload", valor=relatorio["bytes_depois"] or relatorio["bytes_antes"])
+            if relatorio["bytes_depois"]:
+                print(f"🖼️ Imagem: {relatorio['bytes_antes'] // 1024} KB -> {relatorio['bytes_depois'] // 1024} KB {relatorio['etapas_ms']}")
+            with _vez_no_drive(), medir("ocr"):
+                pdf_para_ler, erro_ocr = ocr_google_drive(service, imagem, "temp_ocr", mime)
+            if imagem is not arquivo_original: imagem.close()
         elif "pdf" in tipo:
             pdf_para_ler = arquivo_original
 
-        if pdf_para_ler:
-            pasta_destino = decidir_pasta(pdf_para_ler)
-            pdf_para_ler.seek(0)
-            sucesso, erro_salvar = salvar_drive(service, pdf_para_ler, f"DOC_Zap_{pasta_destino[:10]}.pdf", pasta_destino)
-            
-            if sucesso:
-                resp.message(f"✅ Salvo na pasta: {pasta_destino}")
-            else:
-                resp.message(f"❌ Erro 403/Permissão ao salvar final: {erro_salvar}")
-        else:
-            resp.message(f"❌ Erro no OCR: {erro_ocr}")
+        if not pdf_para_ler:
+            return _erro("ocr", f"❌ Erro no OCR: {erro_ocr}")
+
+        def ocr_paginas(pdf_paginas):
+            with _vez_no_drive(), medir("ocr_paginas"):
+                return ocr_texto_paginas(service, pdf_paginas)
+
+        with medir("classificar"):
+            # Foto já passou pelo OCR inteira; no PDF só as páginas escaneadas vão pro OCR
+            decisao = classificar_pdf(pdf_para_ler, ocr_paginas if "pdf" in tipo else None)
+        pasta_destino = decisao.pasta
+        metricas.anotar(pasta=pasta_destino, pagina=decisao.pagina, paginas_lidas=decisao.paginas_lidas,
+                        paginas_ocr=len(decisao.paginas_ocr), motivo=decisao.motivo)
+        if pasta_destino == "Erro Leitura": metricas.ERROS.inc("leitura")
+
+        pdf_para_ler.seek(0, os.SEEK_END)
+        metricas.BYTES.inc("upload", valor=pdf_para_ler.tell())
+        pdf_para_ler.seek(0)
+        with _vez_no_drive(), medir("salvar"):
+            id_arquivo, erro_salvar = salvar_drive(service, pdf_para_ler, f"DOC_Zap_{pasta_destino[:10]}.pdf", pasta_destino)
+
+        if id_arquivo:
+            metricas.DOCUMENTOS.inc(pasta_destino)
+            try:
+                cache.guardar(sha, pasta_destino, id_arquivo, decisao.texto, pdf_para_ler)
+            except Exception as e:
+                print(f"❌ ERRO NO CACHE: {str(e)}")
+            if decisao.pagina: return f"✅ Salvo na pasta: {pasta_destino} (decidido na pág. {decisao.pagina})"
+            return f"✅ Salvo na pasta: {pasta_destino}"
+        return _erro("salvar", f"❌ Erro 403/Permissão ao salvar final: {erro_salvar}")
+    finally:
+        arquivo_original.close()
+
+def _processar_seguro(midia):
+    with metricas.requisicao(midia.get("id"), tipo=midia["tipo"]), medir("documento"):
+        try:
+            return processar_documento(midia["url"], midia["tipo"])
+        except Exception as e:
+            return _erro("inesperado", f"❌ Erro inesperado: {str(e)}")
+
+def processar_mensagem(midias, sid=None):
+    """Processa todos os anexos da mensagem ao mesmo tempo e monta um resumo só."""
+    # O ID de cada documento nos logs é o MessageSid do Twilio + a posição do anexo
+    if sid: midias = [dict(m, id=f"{sid}-{i}") for i, m in enumerate(midias)]
+    if len(midias) == 1: return _processar_seguro(midias[0])
+
+    respostas = list(POOL_ANEXOS.map(_processar_seguro, midias))
+    linhas = [f"📄 Arquivo {i}: {r}" for i, r in enumerate(respostas, start=1)]
+    return f"📦 {len(midias)} arquivos recebidos:\n" + "\n".join(linhas)
+
+def _rodar_proximo_job():
+    job = FILA.pegar()
+    if job is None:
+        # Fila vazia: aproveita pra apagar o que já passou da retenção (no máximo uma vez por hora)
+        if time.time() >= FILA.proxima_limpeza: FILA.limpar()
+        if FILA.aviso.wait(5): FILA.aviso.clear()
+        return
+
+    job_id, dados = job
+    # Jobs antigos na fila guardavam um anexo só
+    midias = dados.get("midias") or [{"url": dados["url"], "tipo": dados["tipo"]}]
+    texto = processar_mensagem(midias, dados.get("sid"))
+
+    try:
+        ENVIADOR.enviar(dados["para"], dados["de"], texto)
+        FILA.finalizar(job_id, "concluido", texto)
+    except Exception as e:
+        # Não reprocessa: o arquivo já foi pro Drive, só a resposta se perdeu
+        print(f"❌ ERRO AO RESPONDER: {str(e)}")
+        FILA.finalizar(job_id, "falhou", texto)
+
+def _trabalhador():
+    while True:
+        try:
+            _rodar_proximo_job()
+        except Exception as e:
+            # Ex.: "database is locked" com vários processos na mesma fila. A thread não pode morrer:
+            # ninguém sobe outra no lugar. Um job que ficou em 'processando' volta pra fila no restart.
+            metricas.ERROS.inc("trabalhador")
+            print(f"❌ ERRO NO TRABALHADOR: {str(e)}")
+            time.sleep(5)
+
+def iniciar_trabalhadores():
+    """Abre a fila e sobe os trabalhadores uma única vez por processo."""
+    global FILA, POOL_ANEXOS
+    with _trava_inicio:
+        if _trabalhadores: return
+        FILA = FilaJobs(FILA_DB)
+        POOL_ANEXOS = ThreadPoolExecutor(max_workers=MAX_ANEXOS_PARALELO, thread_name_prefix="anexo")
+        # O forkserver dos leitores de PDF nasce antes de qualquer thread do robô
+        leitor_pdf.iniciar("flask", "twilio.twiml.messaging_response", "metricas")
+        if AQUECER_NA_PARTIDA: threading.Thread(target=aquecer, name="aquecimento", daemon=True).start()
+        for i in range(NUM_TRABALHADORES):
+            t = threading.Thread(target=_trabalhador, name=f"trabalhador-{i}", daemon=True)
+            t.start()
+            _trabalhadores.append(t)
+
+# --- PARTIDA A FRIO ---
+AQUECIMENTO = {"pronto": False, "tempos_ms": {}, "erros": {}}
+_trava_aquecimento = threading.Lock()
+
+def _importar_pesados():
+    import requests, pypdf, PIL.Image, PIL.ImageOps
+    import google.oauth2.service_account, googleapiclient.discovery, googleapiclient.http, googleapiclient.errors
+
+def _exigir_drive():
+    if not get_drive_service(): raise RuntimeError("não consegui ler a chave JSON")
+
+def aquecer():
+    """Faz antes da primeira mensagem tudo que ela pagaria: imports, cliente do Drive, pastas e dicionário.
+
+    Roda uma vez por processo; devolve o estado com o tempo de cada parte.
+    """
+    with _trava_aquecimento:
+        if AQUECIMENTO["pronto"]: return AQUECIMENTO
+
+        def parte(nome, funcao):
+            inicio = time.perf_counter()
+            try:
+                funcao()
+            except Exception as e:
+                AQUECIMENTO["erros"][nome] = str(e)
+            AQUECIMENTO["tempos_ms"][nome] = round((time.perf_counter() - inicio) * 1000, 1)
+
+        parte("importar", _importar_pesados)
+        parte("cliente_drive", _exigir_drive)
+        parte("pastas", aquecer_cache_pastas)
+        parte("classificador", obter_classificador)
+        parte("leitor_pdf", leitor_pdf.aquecer)
+        parte("sessao_http", obter_sessao)
+        parte("cache_docs", obter_cache_docs)
+        AQUECIMENTO["pronto"] = True
+        print(f"🔥 Aquecido: {AQUECIMENTO['tempos_ms']}")
+        return AQUECIMENTO
+
+@app.route("/healthz", methods=['GET'])
+def healthz():
+    # Com INICIAR_TRABALHADORES=0 o primeiro health check é que sobe os trabalhadores;
+    # com ?aquecer=1 a resposta só volta depois de tudo aquecido
+    iniciar_trabalhadores()
+    if request.args.get('aquecer') == '1': aquecer()
+    # Cópia: o aquecimento em segundo plano ainda pode estar mexendo nos dicionários
+    return {"pronto": AQUECIMENTO["pronto"], "tempos_ms": dict(AQUECIMENTO["tempos_ms"]),
+            "erros": dict(AQUECIMENTO["erros"])}
+
+@app.route("/bot", methods=['POST'])
+def bot():
+    num_media = int(request.values.get('NumMedia', '0'))
+    resp = MessagingResponse()
+    
+    if num_media > 0:
+        midias = [{"url": request.values.get(f'MediaUrl{i}'), "tipo": request.values.get(f'MediaContentType{i}', '')}
+                  for i in range(num_media)]
+        sid = request.values.get('MessageSid')
+        iniciar_trabalhadores()
+        novo, estado, resultado = FILA.colocar({
+            "sid": sid,
+            "midias": midias,
+            "para": request.values.get('From', ''),
+            "de": request.values.get('To', ''),
+        }, sid)
+        if not novo:
+            # O Twilio repetiu o POST: não processa de novo
+            WEBHOOKS_REPETIDOS.inc()
+            if estado in ("concluido", "falhou") and resultado: resp.message(resultado)
+            else: resp.message("⏳ Ainda estou processando essa mensagem, já te aviso.")
+        elif num_media > 1: resp.message(f"📥 Recebi {num_media} arquivos! Estou processando e te aviso as pastas em seguida.")
+        else: resp.message("📥 Recebi! Estou processando e te aviso a pasta em seguida.")
     else:
         resp.message("🤖 Mande a foto.")
 
     return str(resp)
 
+WEBHOOKS_REPETIDOS = metricas.REGISTRO.adicionar(metricas.Contador("robo_webhooks_repetidos_total", "POSTs repetidos do Twilio (mesmo MessageSid)"))
+FILA_PENDENTES = metricas.REGISTRO.adicionar(metricas.Medidor("robo_fila_jobs", "Jobs na fila persistente por estado", ("estado",)))
+
+def _medir_fila():
+    if FILA is None: return
+    for estado in ("pendente", "processando"): FILA_PENDENTES.definir(estado, valor=FILA.contar(estado))
+
+metricas.REGISTRO.antes_de_exportar.append(_medir_fila)
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    return Response(metricas.REGISTRO.texto(), mimetype="text/plain; version=0.0.4")
+
+# Só no processo principal: os leitores de PDF (processos filhos) também importam este arquivo,
+# inclusive enquanto reimportam o __main__ (aí ainda estão "herdando", sem parent_process)
+if (INICIAR_TRABALHADORES and multiprocessing.parent_process() is None
+        and not getattr(multiprocessing.current_process(), "_inheriting", False)):
+    iniciar_trabalhadores()
+
 if __name__ == "__main__":
+    iniciar_trabalhadores()
     app.run(host='0.0.0.0', port=5000)
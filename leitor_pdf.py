@@ -0,0 +1,198 @@
+"""Leitura do texto do PDF num processo separado, que pode ser morto no meio.
+
+O pypdf não tem como interromper um `PdfReader(...)` ou um `extract_text()` travado num PDF
+malicioso. Por isso a leitura roda num processo filho que manda o texto de volta página por
+página; quem lê espera só até o prazo e mata o filho se passar dele.
+
+O filho sai de um forkserver (um processo limpo, sem as threads do robô) que já tem o pypdf e
+os módulos pedidos em `iniciar()` importados: cada PDF custa um fork, não uma partida de Python.
+O PDF não é copiado pro filho: ele recebe o descritor do arquivo e lê direto do disco.
+"""
+import io
+import os
+import time
+import tempfile
+import unicodedata
+import multiprocessing
+import multiprocessing.forkserver
+from multiprocessing import reduction
+
+class TempoEsgotado(Exception):
+    pass
+
+def normalizar_texto(texto):
+    try:
+        texto = texto.lower()
+        return "".join([c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c)])
+    except: return ""
+
+# ==========================================
+# O PROCESSO FILHO
+# ==========================================
+def _pagina_escaneada(page, texto, min_caracteres):
+    if len(texto.strip()) >= min_caracteres: return False
+    try: return len(page.images) > 0
+    except Exception: return True
+
+class _ArquivoHerdado(io.RawIOBase):
+    """O arquivo do robô lido pelo descritor herdado, com pread: a posição do robô não anda."""
+
+    def __init__(self, fd):
+        self.fd, self.posicao = fd, 0
+
+    def readable(self): return True
+    def seekable(self): return True
+    def tell(self): return self.posicao
+
+    def seek(self, posicao, de_onde=os.SEEK_SET):
+        if de_onde == os.SEEK_CUR: posicao += self.posicao
+        elif de_onde == os.SEEK_END: posicao += os.fstat(self.fd).st_size
+        self.posicao = posicao
+        return posicao
+
+    def readinto(self, destino):
+        lido = os.pread(self.fd, len(destino), self.posicao)
+        destino[:len(lido)] = lido
+        self.posicao += len(lido)
+        return len(lido)
+
+def _receber_arquivo(conexao):
+    if conexao.recv() == "fd": return io.BufferedReader(_ArquivoHerdado(reduction.recv_handle(conexao)))
+    return io.BytesIO(conexao.recv_bytes())
+
+def _ler(conexao, max_paginas, max_caracteres, min_caracteres_pagina):
+    """Recebe o PDF e manda ("pagina", n, texto, escaneada) de cada página e depois ("fim", motivo).
+
+    motivo é None no fim do documento, ou o limite que fez parar. Depois fica esperando a lista
+    de páginas escaneadas pra juntar num PDF só (o que vai pro OCR), ou ser encerrado.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+        reader = PdfReader(_receber_arquivo(conexao))
+        lidos, motivo = 0, None
+        for i, page in enumerate(reader.pages, start=1):
+            if i > max_paginas:
+                motivo = "limite de páginas"; break
+            texto = normalizar_texto(page.extract_text() or "")[:max_caracteres - lidos]
+            conexao.send(("pagina", i, texto, _pagina_escaneada(page, texto, min_caracteres_pagina)))
+            lidos += len(texto) + 1
+            if lidos >= max_caracteres:
+                motivo = "limite de caracteres"; break
+        conexao.send(("fim", motivo))
+
+        numeros = conexao.recv()
+        writer = PdfWriter()
+        for n in numeros: writer.add_page(reader.pages[n - 1])
+        saida = io.BytesIO()
+        writer.write(saida)
+        conexao.send(("pdf", saida.getvalue()))
+    except EOFError:
+        pass   # quem leu já decidiu e fechou a conexão
+    except Exception as e:
+        conexao.send(("erro", str(e)))
+
+def _nada():
+    pass
+
+# ==========================================
+# QUEM LÊ (NO PROCESSO DO ROBÔ)
+# ==========================================
+_contexto = None
+PRECARREGAR = ["leitor_pdf", "pypdf"]
+
+def contexto():
+    global _contexto
+    if _contexto is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            _contexto = multiprocessing.get_context("forkserver")
+            _contexto.set_forkserver_preload(PRECARREGAR)
+        else:
+            _contexto = multiprocessing.get_context("spawn")
+    return _contexto
+
+def iniciar(*modulos):
+    """Sobe o forkserver já importando `modulos` (os que o __main__ importa, que o filho reimporta).
+
+    Chame antes de subir threads e antes de criar filhos com fork: quem herda o forkserver por
+    fork não consegue usar ele.
+    """
+    for modulo in modulos:
+        if modulo not in PRECARREGAR: PRECARREGAR.append(modulo)
+    if contexto().get_start_method() == "forkserver":
+        contexto().set_forkserver_preload(PRECARREGAR)
+        multiprocessing.forkserver.ensure_running()
+
+def aquecer():
+    """Espera o forkserver terminar de importar tudo, com um filho que não faz nada."""
+    p = contexto().Process(target=_nada, daemon=True)
+    p.start()
+    p.join()
+
+def _em_memoria(arquivo):
+    """O BytesIO por trás do arquivo, se ele está só na memória (BytesIO, ou Spooled que não foi pro disco)."""
+    if isinstance(arquivo, tempfile.SpooledTemporaryFile): arquivo = arquivo._file
+    return arquivo if isinstance(arquivo, io.BytesIO) else None
+
+class LeitorPdf:
+    """Um processo filho lendo um PDF. Use com `with`: na saída o filho é morto se ainda estiver vivo.
+
+    `arquivo` é o arquivo aberto do robô; o filho lê pelo descritor, ou recebe os bytes se o
+    arquivo ainda está só na memória.
+    """
+
+    def __init__(self, arquivo, max_paginas, max_caracteres, min_caracteres_pagina):
+        self.conexao, filho = contexto().Pipe()
+        self.processo = contexto().Process(target=_ler, args=(filho, max_paginas, max_caracteres, min_caracteres_pagina),
+                                           daemon=True)
+        self.processo.start()
+        filho.close()
+        self.motivo_fim = None
+        try:
+            memoria = _em_memoria(arquivo)
+            if memoria is None and contexto().get_start_method() == "forkserver":
+                self.conexao.send("fd")
+                reduction.send_handle(self.conexao, arquivo.fileno(), self.processo.pid)
+            else:
+                # No spawn (Windows) não tem como passar o descritor: vão os bytes
+                if memoria is None:
+                    arquivo.seek(0)
+                    memoria = io.BytesIO(arquivo.read())
+                self.conexao.send("bytes")
+                with memoria.getbuffer() as dados: self.conexao.send_bytes(dados)
+        except BaseException:
+            self.fechar()
+            raise
+
+    def _receber(self, prazo):
+        restante = prazo - time.monotonic()
+        if restante <= 0 or not self.conexao.poll(restante): raise TempoEsgotado()
+        try: mensagem = self.conexao.recv()
+        except EOFError: raise RuntimeError(f"o leitor de PDF morreu (código {self.processo.exitcode})")
+        if mensagem[0] == "erro": raise RuntimeError(mensagem[1])
+        return mensagem
+
+    def paginas(self, prazo):
+        """(número, texto normalizado, escaneada) de cada página, até o fim ou TempoEsgotado."""
+        while True:
+            mensagem = self._receber(prazo)
+            if mensagem[0] == "fim":
+                self.motivo_fim = mensagem[1]
+                return
+            yield mensagem[1:]
+
+    def juntar(self, numeros, prazo):
+        """As páginas pedidas num PDF só (BytesIO). Só vale depois de `paginas` chegar ao fim."""
+        self.conexao.send(list(numeros))
+        return io.BytesIO(self._receber(prazo)[1])
+
+    def fechar(self):
+        self.conexao.close()
+        if self.processo.is_alive():
+            self.processo.kill()
+        self.processo.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
@@ -0,0 +1,182 @@
+"""Catálogo em lote: gera gráficos, receitas e tabuleiros de muitas peças sem abrir o app.
+
+Usa o mesmo motor do app.py (motor_croche.py). Cada peça do manifesto roda num processo do
+pool; o que é comum a todas vai em "comum" e cada peça pode sobrescrever:
+
+    {"comum": {"peca": "plana", "ponto": "PB", "formatos": ["pdf", "png"]},
+     "pecas": [{"nome": "tapete_mario", "foto": "fotos/mario.jpg", "largura": 40, "cores": 6},
+               {"nome": "porta_copo_ana", "letreiro": "ANA", "peca": "radial", "carreiras": 15},
+               {"nome": "xadrez_ouro", "padrao": "Xadrez 2x2 (Bloquinhos)", "cor2": "#FFD700"}]}
+
+    python lote_catalogo.py catalogo.json --saida catalogo --processos 4
+    python lote_catalogo.py catalogo.json --banco contabilidade_croche.db   # peças com "usar_fios": true
+
+Cada peça vira uma pasta com receita.txt, previa.png, os tabuleiros pedidos e resumo.json (pontos,
+metros por cor, preço sugerido). Peças que já têm resumo.json são puladas, a não ser com --refazer;
+no fim o catalogo.json da saída junta os resumos de todas.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageColor
+
+import motor_croche
+
+PECAS = {"circular": motor_croche.TIPOS_PECA[0], "plana": motor_croche.TIPOS_PECA[1], "radial": motor_croche.TIPOS_PECA[2]}
+PONTOS = {sigla or "cores": nome for nome, sigla in motor_croche.PONTOS_BASE.items()}
+FORMATOS = ("pdf", "png", "zip")
+PADRAO_PECA = {"peca": "circular", "ponto": "PB", "formatos": ["pdf"], "sequencia": False,
+               "carreiras": 15, "anel": 6, "largura": 30, "cores": 4, "metodo": None, "usar_fios": False,
+               "escala": 2, "cor_fundo": "#2C2C2C", "cor_letra": "#F59E0B",
+               "preco_novelo": 18.0, "metros_novelo": 150.0, "valor_hora": 25.0, "margem": 30.0}
+
+# ==========================================
+# UMA PEÇA (RODA NO POOL DE PROCESSOS)
+# ==========================================
+def imagem_da_peca(p, radial, pasta_manifesto, fios):
+    """A imagem base da peça, do mesmo jeito que o app monta a partir da foto, do letreiro ou do padrão."""
+    if "foto" in p:
+        with open(os.path.join(pasta_manifesto, p["foto"]), "rb") as f: dados = f.read()
+        largura, altura = p["largura"], p.get("altura")
+        if altura is None:
+            largura_original, altura_original = motor_croche.tamanho_upload(dados)
+            altura = max(5, int(largura * altura_original / largura_original))
+        if p["usar_fios"] and not fios: raise ValueError("'usar_fios' pede --banco com fios que tenham cor cadastrada")
+        img, _ = motor_croche.imagem_do_upload(dados, radial, largura, altura, p["cores"], p["metodo"], fios if p["usar_fios"] else ())
+        return img
+    if "letreiro" in p:
+        img, cortado = motor_croche.imagem_do_letreiro(p["letreiro"].upper(), p["escala"], p["cor_fundo"], p["cor_letra"], radial)
+        if cortado: print(f"⚠️ {p['nome']}: o nome não coube inteiro no porta-copo", flush=True)
+        return img
+    if "padrao" in p:
+        nome = p["padrao"]
+        if nome not in motor_croche.PADROES_GEOMETRICOS: raise ValueError(f"padrão desconhecido: {nome}")
+        lado = motor_croche.TELA_RADIAL
+        largura, altura = (lado, lado) if radial else (p["largura"], p.get("altura", p["largura"]))
+        cor2 = p.get("cor2", "#FF0000" if "Coração" in nome else "#FFD700")
+        return motor_croche.gerar_padrao(nome, largura, altura, ImageColor.getrgb(p.get("cor1", "#2C2C2C")),
+                                         ImageColor.getrgb(cor2)).convert('RGB')
+    raise ValueError("a peça precisa de 'foto', 'letreiro' ou 'padrao'")
+
+def gerar_peca(p, pasta_saida, pasta_manifesto, fios):
+    """Gera os arquivos de uma peça e devolve o resumo dela (o mesmo que fica no resumo.json)."""
+    inicio = time.perf_counter()
+    tipo_peca, tipo_ponto = PECAS.get(p["peca"], p["peca"]), PONTOS.get(p["ponto"], p["ponto"])
+    if tipo_peca not in motor_croche.TIPOS_PECA: raise ValueError(f"tipo de peça desconhecido: {p['peca']}")
+    if tipo_ponto not in motor_croche.PONTOS_BASE: raise ValueError(f"ponto desconhecido: {p['ponto']}")
+    formatos = [f for f in p["formatos"] if f in FORMATOS]
+    radial, _ = motor_croche.formato_peca(tipo_peca)
+    sigla = motor_croche.PONTOS_BASE[tipo_ponto]
+
+    img_base = imagem_da_peca(p, radial, pasta_manifesto, fios)
+    grafico = motor_croche.montar_grafico(img_base, tipo_peca, p["carreiras"], p["anel"])
+    pasta = os.path.join(pasta_saida, p["nome"])
+    os.makedirs(pasta, exist_ok=True)
+    arquivos = []
+
+    def gravar(nome, dados):
+        with open(os.path.join(pasta, nome), "wb") as f: f.write(dados)
+        arquivos.append(nome)
+
+    _, txt_rec = motor_croche.receita(grafico, f" {sigla}" if sigla else "", tipo_peca, tipo_ponto)
+    gravar("receita.txt", txt_rec.encode("utf-8"))
+    if radial: previa = motor_croche.desenhar_previa_radial(grafico)
+    else: previa = img_base.resize((img_base.width * 10, img_base.height * 10), Image.Resampling.NEAREST)
+    previa.save(os.path.join(pasta, "previa.png"))
+    arquivos.append("previa.png")
+
+    # Tabuleiros só existem para peças não radiais, como no app
+    if not radial and formatos:
+        exportador = motor_croche.Exportador(grafico, p["sequencia"])
+        if "pdf" in formatos: gravar("grafico.pdf", exportador.pdf())
+        if "png" in formatos and grafico.total <= motor_croche.MAX_PONTOS_PNG_UNICO: gravar("grafico.png", exportador.png())
+        if "zip" in formatos or ("png" in formatos and grafico.total > motor_croche.MAX_PONTOS_PNG_UNICO):
+            gravar("paginas.zip", exportador.zip_png())
+
+    metros_por_cor = motor_croche.consumo_por_cor(grafico, sigla)
+    metros = float(metros_por_cor.sum())
+    orc = motor_croche.orcamento(grafico.total, metros * p["preco_novelo"] / p["metros_novelo"], p["valor_hora"], p["margem"])
+    resumo = {"nome": p["nome"], "tipo_peca": tipo_peca, "ponto": tipo_ponto, "pontos": grafico.total,
+              "carreiras": grafico.carreiras, "largura": grafico.largura, "altura": grafico.altura,
+              "cores": [{"cor": h, "pontos": int(n), "metros": round(float(m), 2)}
+                        for h, n, m in zip(grafico.hexes, grafico.contagem(), metros_por_cor)],
+              "metros": round(metros, 2), "minutos": round(orc["minutos"]), "preco_sugerido": round(orc["preco_final"], 2),
+              "arquivos": arquivos, "segundos": round(time.perf_counter() - inicio, 2)}
+    # O resumo é gravado por último: é ele que marca a peça como pronta
+    gravar("resumo.json", json.dumps(resumo, ensure_ascii=False, indent=2).encode("utf-8"))
+    return resumo
+
+# ==========================================
+# O LOTE
+# ==========================================
+def ler_manifesto(caminho):
+    """Devolve a lista de peças já com os valores de "comum" e os padrões preenchidos."""
+    with open(caminho, "r", encoding="utf-8") as f: manifesto = json.load(f)
+    comum = dict(PADRAO_PECA, **manifesto.get("comum", {}))
+    pecas, nomes = [], set()
+    for i, peca in enumerate(manifesto["pecas"], 1):
+        p = dict(comum, **peca)
+        p["nome"] = str(p.get("nome") or f"peca_{i:03d}").replace(os.sep, "_")
+        if p["nome"] in nomes: raise ValueError(f"nome repetido no manifesto: {p['nome']}")
+        nomes.add(p["nome"])
+        pecas.append(p)
+    return pecas
+
+def fios_com_cor(caminho_banco):
+    if not caminho_banco: return ()
+    import banco_croche   # só quem casa cores com o estoque precisa do banco
+    return tuple((nome, dados["cor"]) for nome, dados in banco_croche.Livro(caminho_banco).fios().items() if dados["cor"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera em lote os gráficos, receitas e tabuleiros de um manifesto JSON.")
+    parser.add_argument("manifesto", help="arquivo JSON com as peças")
+    parser.add_argument("--saida", default="catalogo", help="pasta onde cada peça ganha sua subpasta")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 2, help="peças geradas ao mesmo tempo")
+    parser.add_argument("--banco", help="livro-caixa (SQLite) com as cores dos fios, para as peças com \"usar_fios\"")
+    parser.add_argument("--refazer", action="store_true", help="gera de novo as peças que já têm resumo.json")
+    args = parser.parse_args()
+
+    pecas = ler_manifesto(args.manifesto)
+    pasta_manifesto = os.path.dirname(os.path.abspath(args.manifesto))
+    fios = fios_com_cor(args.banco)
+    os.makedirs(args.saida, exist_ok=True)
+
+    resumos, erros, pendentes = {}, {}, []
+    for p in pecas:
+        caminho_resumo = os.path.join(args.saida, p["nome"], "resumo.json")
+        if not args.refazer and os.path.exists(caminho_resumo):
+            with open(caminho_resumo, "r", encoding="utf-8") as f: resumos[p["nome"]] = json.load(f)
+        else: pendentes.append(p)
+    print(f"🧶 {len(pendentes)} peças pra gerar ({len(pecas) - len(pendentes)} já prontas) em {args.processos} processos", flush=True)
+
+    inicio = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.processos) as pool:
+        futuros = {pool.submit(gerar_peca, p, args.saida, pasta_manifesto, fios): p["nome"] for p in pendentes}
+        for feitos, futuro in enumerate(as_completed(futuros), 1):
+            nome = futuros[futuro]
+            try:
+                r = resumos[nome] = futuro.result()
+                print(f"✅ [{feitos}/{len(pendentes)}] {nome}: {r['pontos']} pontos, {len(r['cores'])} cores, "
+                      f"R$ {r['preco_sugerido']:.2f} ({r['segundos']:.1f}s)", flush=True)
+            except Exception as e:
+                erros[nome] = str(e)
+                print(f"❌ [{feitos}/{len(pendentes)}] {nome}: {e}", flush=True)
+
+    # Índice do catálogo na ordem do manifesto (as prontas de antes entram também)
+    with open(os.path.join(args.saida, "catalogo.json"), "w", encoding="utf-8") as f:
+        json.dump([resumos[p["nome"]] for p in pecas if p["nome"] in resumos], f, ensure_ascii=False, indent=2)
+
+    decorrido = time.monotonic() - inicio
+    print("\n==================== RELATÓRIO ====================")
+    print(f"Peças geradas: {len(pendentes) - len(erros)}   já prontas: {len(pecas) - len(pendentes)}   com erro: {len(erros)}")
+    print(f"Tempo: {decorrido:.1f}s   Vazão: {(len(pendentes) - len(erros)) / decorrido if decorrido else 0:.2f} peças/s")
+    for nome, erro in erros.items(): print(f"   ❌ {nome}: {erro}")
+    print(f"Catálogo: {os.path.join(args.saida, 'catalogo.json')}")
+    sys.exit(1 if erros else 0)
+
+if __name__ == "__main__":
+    main()
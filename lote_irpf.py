@@ -0,0 +1,302 @@
+"""Importação em lote: classifica e salva no Drive uma pasta (ou um .zip) inteira de documentos.
+
+Usa as mesmas funções do robô do WhatsApp (estagiario.py). A leitura do PDF e a escolha
+da pasta rodam num pool de processos; o OCR e o upload pro Drive rodam num pool de
+threads separado, com limite de chamadas por segundo.
+
+    python lote_irpf.py documentos_2025.zip --dry-run --csv plano.csv
+    python lote_irpf.py /caminho/da/pasta --processos 4 --uploads-paralelos 4 --taxa 8
+
+O progresso vai pra um arquivo de checkpoint (JSONL): se o processo cair, rodar de novo
+pula o que já foi salvo.
+"""
+import os
+import io
+import csv
+import sys
+import json
+import time
+import hashlib
+import zipfile
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# O lote não atende o WhatsApp: nada de fila nem trabalhadores do robô
+os.environ.setdefault("INICIAR_TRABALHADORES", "0")
+import estagiario
+import leitor_pdf
+
+EXTENSOES_PDF = {".pdf"}
+EXTENSOES_IMAGEM = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+MIME_IMAGEM = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp",
+               ".gif": "image/gif", ".bmp": "image/bmp", ".tif": "image/tiff", ".tiff": "image/tiff"}
+CAMPOS_CSV = ["arquivo", "sha256", "pasta", "pagina", "status", "detalhe"]
+
+# ==========================================
+# LEITURA DA ORIGEM (PASTA OU ZIP)
+# ==========================================
+def listar_origem(origem):
+    """Devolve [(chave, ref)] dos documentos suportados. ref é o que os pools usam pra ler o arquivo."""
+    itens = []
+    if zipfile.is_zipfile(origem):
+        with zipfile.ZipFile(origem) as z:
+            for info in z.infolist():
+                if info.is_dir(): continue
+                ext = os.path.splitext(info.filename)[1].lower()
+                if ext in EXTENSOES_PDF or ext in EXTENSOES_IMAGEM:
+                    itens.append((info.filename, ("zip", origem, info.filename)))
+    else:
+        for raiz, _, arquivos in os.walk(origem):
+            for nome in sorted(arquivos):
+                ext = os.path.splitext(nome)[1].lower()
+                if ext in EXTENSOES_PDF or ext in EXTENSOES_IMAGEM:
+                    caminho = os.path.join(raiz, nome)
+                    itens.append((os.path.relpath(caminho, origem), ("arquivo", caminho)))
+    itens.sort()
+    return itens
+
+def ler(ref):
+    if ref[0] == "zip":
+        with zipfile.ZipFile(ref[1]) as z: return z.read(ref[2])
+    if ref[0] == "bytes":
+        return ref[1]
+    with open(ref[1], "rb") as f: return f.read()
+
+def _e_imagem(chave):
+    return os.path.splitext(chave)[1].lower() in EXTENSOES_IMAGEM
+
+# ==========================================
+# TRABALHO DE CPU (RODA NO POOL DE PROCESSOS)
+# ==========================================
+def classificar(ref):
+    """Lê o PDF e escolhe a pasta. Devolve (sha256, tamanho, Decisao)."""
+    dados = ler(ref)
+    decisao = estagiario.classificar_pdf(io.BytesIO(dados))
+    # O texto lido não volta pro processo principal: só pesaria na troca entre processos
+    return hashlib.sha256(dados).hexdigest(), len(dados), decisao._replace(texto="")
+
+# ==========================================
+# LIMITE DE CHAMADAS AO DRIVE
+# ==========================================
+class LimitadorTaxa:
+    """No máximo `por_segundo` chamadas por segundo, espaçadas igualmente entre as threads."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0.0
+        self.proxima = time.monotonic()
+        self.trava = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo: return
+        with self.trava:
+            agora = time.monotonic()
+            vez = max(self.proxima, agora)
+            self.proxima = vez + self.intervalo
+        if vez > agora: time.sleep(vez - agora)
+
+# ==========================================
+# O LOTE
+# ==========================================
+class Lote:
+    def __init__(self, args, continuar=False):
+        self.args = args
+        self.trava = threading.Lock()
+        self.em_voo = threading.BoundedSemaphore(max(1, (args.processos + args.uploads_paralelos) * 4))
+        self.pendentes = 0
+        self.tudo_pronto = threading.Condition(self.trava)
+        self.limitador = LimitadorTaxa(args.taxa)
+        self.contagem = {}
+        self.por_pasta = {}
+        self.bytes_lidos = 0
+        self.feitos = 0
+        self.total = 0
+        self.inicio = time.monotonic()
+        self.cache = None if args.dry_run else estagiario.obter_cache_docs()
+
+        # Retomando pelo checkpoint, as linhas das rodadas anteriores ficam e as novas vão no fim
+        self.arquivo_csv = open(args.csv, "a" if continuar else "w", newline="", encoding="utf-8")
+        self.csv = csv.DictWriter(self.arquivo_csv, fieldnames=CAMPOS_CSV, delimiter=";")
+        if self.arquivo_csv.tell() == 0: self.csv.writeheader()
+        self.checkpoint = None if args.dry_run else open(args.checkpoint, "a", encoding="utf-8")
+
+        # Os processos do pool saem do forkserver do leitor_pdf (um fork herdaria o forkserver sem
+        # poder usar); cada um sobe o seu, já com o estagiario importado, pros leitores de PDF
+        self.pool_cpu = ProcessPoolExecutor(max_workers=args.processos, mp_context=leitor_pdf.contexto(),
+                                            initializer=leitor_pdf.iniciar, initargs=("estagiario",))
+        self.pool_io = ThreadPoolExecutor(max_workers=args.uploads_paralelos, thread_name_prefix="drive")
+
+    # --- registro do resultado de cada arquivo ---
+    def registrar(self, chave, status, sha=None, pasta=None, pagina=None, detalhe="", drive_id=None, tamanho=0):
+        with self.trava:
+            self.csv.writerow({"arquivo": chave, "sha256": sha or "", "pasta": pasta or "", "pagina": pagina or "",
+                               "status": status, "detalhe": detalhe})
+            if self.checkpoint and status in ("salvo", "ja_salvo"):
+                self.checkpoint.write(json.dumps({"arquivo": chave, "sha256": sha, "pasta": pasta, "drive_id": drive_id},
+                                                 ensure_ascii=False) + "\n")
+                self.checkpoint.flush()
+            self.contagem[status] = self.contagem.get(status, 0) + 1
+            if pasta: self.por_pasta[pasta] = self.por_pasta.get(pasta, 0) + 1
+            self.bytes_lidos += tamanho
+            self.feitos += 1
+            if self.feitos % 25 == 0 or self.feitos == self.total:
+                decorrido = time.monotonic() - self.inicio
+                print(f"⏳ {self.feitos}/{self.total} ({self.feitos / decorrido:.1f} arq/s)", flush=True)
+            self.pendentes -= 1
+            self.tudo_pronto.notify_all()
+        self.em_voo.release()
+
+    def _encadear(self, futuro, chave, etapa, proximo=None):
+        """Quando o futuro terminar, chama proximo(resultado); qualquer erro vira linha de erro."""
+        def callback(f):
+            try:
+                resultado = f.result()
+                if proximo is not None: proximo(resultado)
+            except Exception as e:
+                self.registrar(chave, "erro", detalhe=f"{etapa}: {e}")
+        futuro.add_done_callback(callback)
+
+    # --- etapas ---
+    def iniciar(self, chave, ref):
+        self.em_voo.acquire()
+        with self.trava: self.pendentes += 1
+
+        if _e_imagem(chave):
+            if self.args.dry_run:
+                self._encadear(self.pool_io.submit(self._planejar_imagem, chave, ref), chave, "ler")
+                return
+            self._encadear(self.pool_io.submit(self._ocr, chave, ref), chave, "ocr")
+        else:
+            self._encadear(self.pool_cpu.submit(classificar, ref), chave, "classificar",
+                           lambda r: self._depois_de_classificar(chave, ref, *r))
+
+    def _planejar_imagem(self, chave, ref):
+        # Sem Drive não tem OCR: a pasta de foto só se sabe na importação de verdade
+        dados = ler(ref)
+        self.registrar(chave, "planejado", hashlib.sha256(dados).hexdigest(), "(depende do OCR)", tamanho=len(dados))
+
+    def _ocr(self, chave, ref):
+        dados = ler(ref)
+        sha = hashlib.sha256(dados).hexdigest()
+        ja_salvo = self.cache.buscar(sha)
+        if ja_salvo:
+            self.registrar(chave, "ja_salvo", sha, ja_salvo["pasta"], tamanho=len(dados))
+            return
+        service = estagiario.get_drive_service()
+        ext = os.path.splitext(chave)[1].lower()
+        imagem, mime, _ = estagiario.preprocessar_imagem(io.BytesIO(dados), MIME_IMAGEM.get(ext, "image/jpeg"))
+        self.limitador.esperar()
+        pdf, erro = estagiario.ocr_google_drive(service, imagem, "temp_ocr_lote", mime)
+        if not pdf:
+            self.registrar(chave, "erro", sha, detalhe=f"ocr: {erro}", tamanho=len(dados))
+            return
+        # Daqui pra frente o documento é o PDF do OCR, mas a chave do cache continua sendo a foto
+        ref_pdf = ("bytes", pdf.getvalue())
+        self._encadear(self.pool_cpu.submit(classificar, ref_pdf), chave, "classificar",
+                       lambda r: self._depois_de_classificar(chave, ref_pdf, sha, len(dados), r[2]))
+
+    def _depois_de_classificar(self, chave, ref, sha, tamanho, decisao):
+        if decisao.motivo == "precisa de OCR" and not self.args.dry_run:
+            # PDF escaneado: lê de novo numa thread de I/O, agora mandando as páginas sem texto pro OCR
+            self._encadear(self.pool_io.submit(self._ocr_paginas, ref), chave, "ocr",
+                           lambda d: self._depois_de_classificar(chave, ref, sha, tamanho, d))
+            return
+        if self.args.dry_run:
+            self.registrar(chave, "planejado", sha, decisao.pasta, decisao.pagina, decisao.motivo, tamanho=tamanho)
+            return
+        self._encadear(self.pool_io.submit(self._salvar, chave, ref, sha, decisao, tamanho), chave, "salvar")
+
+    def _ocr_paginas(self, ref):
+        service = estagiario.get_drive_service()
+
+        def ocr(pdf_paginas):
+            self.limitador.esperar()
+            return estagiario.ocr_texto_paginas(service, pdf_paginas)
+
+        return estagiario.classificar_pdf(io.BytesIO(ler(ref)), ocr)
+
+    def _salvar(self, chave, ref, sha, decisao, tamanho):
+        ja_salvo = self.cache.buscar(sha)
+        if ja_salvo:
+            self.registrar(chave, "ja_salvo", sha, ja_salvo["pasta"], tamanho=tamanho)
+            return
+        service = estagiario.get_drive_service()
+        nome = os.path.splitext(os.path.basename(chave))[0] + ".pdf"
+        pdf = io.BytesIO(ler(ref))
+        self.limitador.esperar()
+        id_arquivo, erro = estagiario.salvar_drive(service, pdf, nome, decisao.pasta)
+        if not id_arquivo:
+            self.registrar(chave, "erro", sha, decisao.pasta, decisao.pagina, f"salvar: {erro}", tamanho=tamanho)
+            return
+        try:
+            self.cache.guardar(sha, decisao.pasta, id_arquivo, "", pdf)
+        except Exception as e:
+            print(f"❌ ERRO NO CACHE: {str(e)}")
+        self.registrar(chave, "salvo", sha, decisao.pasta, decisao.pagina, decisao.motivo, id_arquivo, tamanho)
+
+    # --- execução ---
+    def rodar(self, itens):
+        self.total = len(itens)
+        for chave, ref in itens: self.iniciar(chave, ref)
+        with self.trava:
+            self.tudo_pronto.wait_for(lambda: self.pendentes == 0)
+        self.pool_io.shutdown()
+        self.pool_cpu.shutdown()
+        self.arquivo_csv.close()
+        if self.checkpoint: self.checkpoint.close()
+
+    def relatorio(self, pulados):
+        decorrido = time.monotonic() - self.inicio
+        print("\n==================== RELATÓRIO ====================")
+        print(f"Arquivos processados: {self.feitos} (pulados pelo checkpoint: {pulados})")
+        for status, qtd in sorted(self.contagem.items()): print(f"   {status}: {qtd}")
+        print(f"Tempo: {decorrido:.1f}s   Vazão: {self.feitos / decorrido if decorrido else 0:.2f} arq/s"
+              f"   {self.bytes_lidos / 1e6 / decorrido if decorrido else 0:.2f} MB/s")
+        print("Por pasta:")
+        for pasta, qtd in sorted(self.por_pasta.items()): print(f"   {pasta}: {qtd}")
+        print(f"Planilha: {self.args.csv}")
+
+def carregar_checkpoint(caminho):
+    feitos = set()
+    if not os.path.exists(caminho): return feitos
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            try: feitos.add(json.loads(linha)["arquivo"])
+            except (ValueError, KeyError): pass  # última linha cortada por uma queda no meio
+    return feitos
+
+def main():
+    parser = argparse.ArgumentParser(description="Classifica e salva no Drive uma pasta ou .zip de documentos do IRPF.")
+    parser.add_argument("origem", help="pasta ou arquivo .zip")
+    parser.add_argument("--dry-run", action="store_true", help="não usa o Drive: só grava a planilha com as pastas previstas")
+    parser.add_argument("--csv", help="planilha de saída (padrão: <origem>.csv)")
+    parser.add_argument("--checkpoint", help="arquivo de progresso (padrão: <origem>.progresso.jsonl)")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 2, help="processos pra ler os PDFs")
+    parser.add_argument("--uploads-paralelos", type=int, default=4, help="threads de OCR/upload pro Drive")
+    parser.add_argument("--taxa", type=float, default=8.0, help="máximo de chamadas de OCR/upload por segundo (0 = sem limite)")
+    args = parser.parse_args()
+
+    base = os.path.normpath(args.origem)
+    args.csv = args.csv or base + ".csv"
+    args.checkpoint = args.checkpoint or base + ".progresso.jsonl"
+
+    itens = listar_origem(args.origem)
+    pulados, ja_feitos = 0, set()
+    if not args.dry_run:
+        ja_feitos = carregar_checkpoint(args.checkpoint)
+        pulados = sum(1 for chave, _ in itens if chave in ja_feitos)
+        itens = [(chave, ref) for chave, ref in itens if chave not in ja_feitos]
+        if not estagiario.get_drive_service():
+            print("❌ Não consegui ler a chave JSON do Drive.")
+            sys.exit(1)
+        estagiario.aquecer_cache_pastas()
+
+    print(f"📂 {len(itens)} arquivos pra processar" + (" (dry-run)" if args.dry_run else ""))
+    leitor_pdf.iniciar("estagiario")
+    lote = Lote(args, continuar=bool(ja_feitos))
+    lote.rodar(itens)
+    lote.relatorio(pulados)
+    sys.exit(1 if lote.contagem.get("erro") else 0)
+
+if __name__ == "__main__":
+    main()
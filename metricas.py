@@ -0,0 +1,156 @@
+"""Métricas do robô no formato texto do Prometheus, sem depender de biblioteca externa.
+
+Uso: `with medir("ocr"): ...` cronometra a etapa, e `/metrics` devolve `REGISTRO.texto()`.
+Com LOG_JSON=1, cada documento processado gera uma linha JSON com o tempo de cada etapa.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+LOG_JSON = os.environ.get("LOG_JSON", "0") == "1"
+
+BALDES_SEGUNDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _rotulos(nomes, valores):
+    if not nomes: return ""
+    pares = []
+    for n, v in zip(nomes, valores):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pares.append(f'{n}="{v}"')
+    return "{" + ",".join(pares) + "}"
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}
+        self.trava = threading.Lock()
+
+    def cabecalho(self):
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, *rotulos, valor=1):
+        with self.trava: self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+    def linhas(self):
+        with self.trava: itens = sorted(self.valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, k)} {v}" for k, v in itens]
+
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+    def inc(self, *rotulos, valor=1):
+        with self.trava: self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+    def dec(self, *rotulos, valor=1):
+        self.inc(*rotulos, valor=-valor)
+
+    def definir(self, *rotulos, valor):
+        with self.trava: self.valores[rotulos] = valor
+
+    def linhas(self):
+        with self.trava: itens = sorted(self.valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, k)} {v}" for k, v in itens]
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(baldes)
+
+    def observar(self, valor, *rotulos):
+        with self.trava:
+            serie = self.valores.get(rotulos)
+            if serie is None:
+                serie = self.valores[rotulos] = {"baldes": [0] * len(self.baldes), "soma": 0.0, "total": 0}
+            for i, limite in enumerate(self.baldes):
+                if valor <= limite: serie["baldes"][i] += 1
+            serie["soma"] += valor
+            serie["total"] += 1
+
+    def linhas(self):
+        with self.trava: itens = sorted((k, dict(v, baldes=list(v["baldes"]))) for k, v in self.valores.items())
+        saida = []
+        for k, serie in itens:
+            for limite, qtd in zip(self.baldes, serie["baldes"]):
+                saida.append(f"{self.nome}_bucket{_rotulos(self.rotulos + ('le',), k + (limite,))} {qtd}")
+            saida.append(f"{self.nome}_bucket{_rotulos(self.rotulos + ('le',), k + ('+Inf',))} {serie['total']}")
+            saida.append(f"{self.nome}_sum{_rotulos(self.rotulos, k)} {serie['soma']}")
+            saida.append(f"{self.nome}_count{_rotulos(self.rotulos, k)} {serie['total']}")
+        return saida
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+        self.antes_de_exportar = []  # funções chamadas a cada /metrics (ex: tamanho da fila)
+
+    def adicionar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def texto(self):
+        for f in self.antes_de_exportar:
+            try: f()
+            except Exception as e: print(f"❌ ERRO NA MÉTRICA: {str(e)}")
+        linhas = []
+        for m in self.metricas:
+            linhas += m.cabecalho() + m.linhas()
+        return "\n".join(linhas) + "\n"
+
+REGISTRO = Registro()
+
+# Funções chamadas como f(etapa, evento, duracao) no "inicio" e no "fim" de cada etapa.
+# O benchmark usa isso pra ter as amostras exatas; em produção fica vazio.
+OUVINTES = []
+
+ETAPA_SEGUNDOS = REGISTRO.adicionar(Histograma("robo_etapa_segundos", "Tempo gasto em cada etapa do processamento", ("etapa",)))
+EM_ANDAMENTO = REGISTRO.adicionar(Medidor("robo_em_andamento", "Etapas rodando neste momento", ("etapa",)))
+DOCUMENTOS = REGISTRO.adicionar(Contador("robo_documentos_total", "Documentos salvos por pasta", ("pasta",)))
+ERROS = REGISTRO.adicionar(Contador("robo_erros_total", "Erros por tipo", ("tipo",)))
+BYTES = REGISTRO.adicionar(Contador("robo_bytes_total", "Bytes baixados e enviados ao Drive", ("sentido",)))
+
+# --- LOG ESTRUTURADO POR DOCUMENTO ---
+_requisicao = contextvars.ContextVar("requisicao", default=None)
+
+@contextmanager
+def requisicao(id_requisicao=None, **campos):
+    """Abre o registro de um documento; ao sair, imprime uma linha JSON (se LOG_JSON=1)."""
+    registro = {"id": id_requisicao or uuid.uuid4().hex, "etapas_ms": {}, **campos}
+    token = _requisicao.set(registro)
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        _requisicao.reset(token)
+        registro["total_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        if LOG_JSON: print(json.dumps(registro, ensure_ascii=False), flush=True)
+
+def anotar(**campos):
+    registro = _requisicao.get()
+    if registro is not None: registro.update(campos)
+
+@contextmanager
+def medir(etapa):
+    EM_ANDAMENTO.inc(etapa)
+    for f in OUVINTES: f(etapa, "inicio", None)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        for f in OUVINTES: f(etapa, "fim", duracao)
+        EM_ANDAMENTO.dec(etapa)
+        ETAPA_SEGUNDOS.observar(duracao, etapa)
+        registro = _requisicao.get()
+        if registro is not None: registro["etapas_ms"][etapa] = round(duracao * 1000, 1)
@@ -0,0 +1,634 @@
+"""Motor matemático dos gráficos de crochê: a parte do app.py que não depende do Streamlit.
+
+Usado pelo app (uma peça por vez, no navegador) e pelo lote_catalogo.py (muitas peças de uma vez).
+"""
+import io
+import math
+import time
+import hashlib
+import zlib
+import zipfile
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, features
+
+# ==========================================
+# PADRÕES GEOMÉTRICOS (REGISTRO PLUGÁVEL)
+# ==========================================
+# nome que aparece no app -> função(x, y, largura, altura) que devolve a máscara do desenho.
+# x e y são grades de índices do NumPy (x é uma linha, y é uma coluna; elas se expandem
+# uma contra a outra). A máscara vale True onde vai a Cor 2 (desenho) e False na Cor 1 (fundo).
+PADROES_GEOMETRICOS = {}
+
+def registrar_padrao(nome):
+    def decorador(funcao):
+        PADROES_GEOMETRICOS[nome] = funcao
+        return funcao
+    return decorador
+
+@registrar_padrao("Xadrez 2x2 (Bloquinhos)")
+def _xadrez_2x2(x, y, largura, altura):
+    return (x // 2 + y // 2) % 2 != 0
+
+@registrar_padrao("Xadrez 1x1 (Fino)")
+def _xadrez_1x1(x, y, largura, altura):
+    return (x + y) % 2 != 0
+
+@registrar_padrao("Listras Horizontais")
+def _listras_horizontais(x, y, largura, altura):
+    return (y // 2) % 2 != 0
+
+@registrar_padrao("Listras Verticais")
+def _listras_verticais(x, y, largura, altura):
+    return (x // 2) % 2 != 0
+
+@registrar_padrao("Diagonal (Escadinha)")
+def _diagonal(x, y, largura, altura):
+    return (x + y) % 3 != 0
+
+@registrar_padrao("Ziguezague (Chevron)")
+def _chevron(x, y, largura, altura):
+    return ((x + y) % 4 == 0) | ((x - y) % 4 == 0)
+
+@registrar_padrao("Moldura / Borda")
+def _moldura(x, y, largura, altura):
+    return (x < 2) | (x > largura - 3) | (y < 2) | (y > altura - 3)
+
+@registrar_padrao("Coração (Pixel Art Perfeito)")
+def _coracao(x, y, largura, altura):
+    cx, cy = largura / 2, altura / 2
+    escala = min(largura, altura) / 2.5
+    vx, vy = (x - cx) / escala, (cy - y) / (escala * 1.1)
+    return (vx**2 + vy**2 - 1)**3 - (vx**2) * (vy**3) <= 0
+
+def mascara_padrao(nome, largura, altura):
+    y, x = np.ogrid[:altura, :largura]
+    return np.broadcast_to(PADROES_GEOMETRICOS[nome](x, y, largura, altura), (altura, largura))
+
+def gerar_padrao(nome, largura, altura, rgb1, rgb2):
+    """Desenha o padrão direto numa imagem de paleta ("P"): índice 0 = Cor 1, índice 1 = Cor 2."""
+    img = Image.fromarray(mascara_padrao(nome, largura, altura).astype(np.uint8))
+    img.putpalette(list(rgb1) + list(rgb2))
+    return img
+
+# ==========================================
+# ORIGENS DO DESENHO (FOTO E LETREIRO)
+# ==========================================
+def tamanho_upload(dados):
+    """Largura e altura da foto, lendo só o cabeçalho."""
+    return Image.open(io.BytesIO(dados)).size
+
+def imagem_do_upload(dados, radial, largura, altura, num_cores, metodo=None, fios=()):
+    """Foto -> imagem já com num_cores cores (e no tamanho do gráfico, se plana). Devolve (img_base, relatorio).
+
+    A foto é reduzida antes de escolher as cores, nunca quantizada na resolução do celular. metodo é
+    uma chave de METODOS_QUANTIZACAO (None = corte mediano, o que o app sempre usou). Com fios
+    (tupla de (nome, "#rrggbb")) cada cor escolhida vira a do fio mais próximo. O relatório traz o
+    tempo de cada passo e o casamento com os fios.
+    """
+    tempos, inicio = {}, time.perf_counter()
+    img = _reduzir_para_quantizar(dados, radial, largura, altura)
+    tempos["reduzir"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    img_p = img.quantize(colors=num_cores, method=METODOS_QUANTIZACAO[metodo] if metodo else Image.Quantize.MEDIANCUT)
+    tempos["quantizar"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    casamento = []
+    if fios: img_base, casamento = casar_com_fios(img_p, fios)
+    else: img_base = img_p.convert('RGB')
+    tempos["fios"] = time.perf_counter() - inicio
+
+    if not radial: img_base = img_base.resize((largura, altura), Image.Resampling.NEAREST)
+    return img_base, {"tempos_ms": {k: v * 1000 for k, v in tempos.items()}, "tamanho_quantizado": img.size, "fios": casamento}
+
+def imagem_do_letreiro(texto, escala, cor_fundo, cor_letra, radial):
+    """Nome em pixel art. Devolve (imagem, cortado): cortado quando o nome não coube no porta-copo."""
+    # A fonte bitmap padrão do Python tem aprox 6x11 pixels por letra
+    largura_base = (len(texto) * 6) + 4
+    altura_base = 13
+    img_txt = Image.new('RGB', (largura_base, altura_base), color=cor_fundo)
+    ImageDraw.Draw(img_txt).text((2, 1), texto, fill=cor_letra)
+    img_txt = img_txt.resize((largura_base * escala, altura_base * escala), Image.Resampling.NEAREST)
+    if not radial: return img_txt, False
+
+    # Porta-copo: cola o nome no centro da tela do modo radial
+    img_base = Image.new('RGB', (TELA_RADIAL, TELA_RADIAL), color=cor_fundo)
+    cortado = img_txt.width > TELA_RADIAL or img_txt.height > TELA_RADIAL
+    if cortado: img_txt = img_txt.crop((0, 0, TELA_RADIAL, TELA_RADIAL))
+    img_base.paste(img_txt, (max(0, (TELA_RADIAL - img_txt.width) // 2), max(0, (TELA_RADIAL - img_txt.height) // 2)))
+    return img_base, cortado
+
+# ==========================================
+# REDUÇÃO DE CORES DA FOTO E CASAMENTO COM OS FIOS
+# ==========================================
+# nome que aparece no app -> método do Pillow. O libimagequant só entra se o Pillow foi compilado com ele.
+METODOS_QUANTIZACAO = {"Corte mediano (equilibrado)": Image.Quantize.MEDIANCUT,
+                       "Octree rápido": Image.Quantize.FASTOCTREE,
+                       "libimagequant (melhor qualidade)": Image.Quantize.LIBIMAGEQUANT}
+LADO_QUANTIZAR = 256   # a foto é reduzida até caber neste lado antes de escolher as cores
+
+def metodos_quantizacao():
+    return [nome for nome, metodo in METODOS_QUANTIZACAO.items()
+            if metodo != Image.Quantize.LIBIMAGEQUANT or features.check("libimagequant")]
+
+def _reduzir_para_quantizar(dados, radial, largura, altura):
+    """Abre a foto já pequena: o JPEG é decodificado em 1/2, 1/4 ou 1/8 (draft) e o resto vai por BOX."""
+    img = Image.open(io.BytesIO(dados))
+    if radial: alvo = (TELA_RADIAL, TELA_RADIAL)
+    else: alvo = (max(LADO_QUANTIZAR, largura), max(LADO_QUANTIZAR, altura))
+    img.draft("RGB", alvo)
+    img = img.convert('RGB')
+    # O radial estica a foto no quadrado da tela com LANCZOS, como sempre fez
+    if radial: return img.resize(alvo, Image.Resampling.LANCZOS)
+    img.thumbnail(alvo, Image.Resampling.BOX)
+    return img
+
+# sRGB (D65) -> XYZ -> CIELAB: a distância entre cores em Lab é próxima da diferença que o olho vê
+_RGB_PARA_XYZ = np.array([[0.4124, 0.3576, 0.1805], [0.2126, 0.7152, 0.0722], [0.0193, 0.1192, 0.9505]])
+_BRANCO_D65 = np.array([0.95047, 1.0, 1.08883])
+
+def rgb_para_lab(rgb):
+    c = np.asarray(rgb, dtype=np.float64) / 255
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ _RGB_PARA_XYZ.T / _BRANCO_D65
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+@lru_cache(maxsize=16)
+def indice_fios(fios):
+    """fios: tupla de (nome, "#rrggbb"). Devolve (nomes, rgb (M,3) uint8, lab (M,3)), montado uma vez por estoque."""
+    nomes = [nome for nome, _ in fios]
+    rgb = np.array([[int(cor[i:i + 2], 16) for i in (1, 3, 5)] for _, cor in fios], dtype=np.uint8).reshape(-1, 3)
+    return nomes, rgb, rgb_para_lab(rgb)
+
+def casar_com_fios(img_p, fios):
+    """Troca cada cor da paleta pela do fio mais próximo em Lab. Devolve a imagem em RGB e o casamento feito.
+
+    Só a paleta (no máximo num_cores entradas) é comparada com os fios: o custo não depende do tamanho da foto.
+    Duas cores que caem no mesmo fio viram uma só no gráfico.
+    """
+    nomes, rgb_fios, lab_fios = indice_fios(fios)
+    usadas = sorted(img_p.getcolors(256), reverse=True)   # (pixels, índice), da cor mais usada para a menos
+    paleta = np.array(img_p.getpalette()[:3 * (max(i for _, i in usadas) + 1)], dtype=np.uint8).reshape(-1, 3)
+    distancias = np.linalg.norm(rgb_para_lab(paleta)[:, None, :] - lab_fios[None, :, :], axis=2)
+    mais_perto = distancias.argmin(axis=1)
+    img_p = img_p.copy()
+    img_p.putpalette(rgb_fios[mais_perto].tobytes())
+    casamento = [{"cor": "#%02X%02X%02X" % tuple(paleta[i]), "fio": nomes[mais_perto[i]],
+                  "cor_fio": "#%02X%02X%02X" % tuple(rgb_fios[mais_perto[i]]),
+                  "delta_e": float(distancias[i, mais_perto[i]]), "pixels": pixels} for pixels, i in usadas]
+    return img_p.convert('RGB'), casamento
+
+# ==========================================
+# MOTOR RADIAL (PORTA-COPO): TABELA POLAR
+# ==========================================
+TELA_RADIAL = 200   # o desenho do modo radial é sempre uma tela quadrada deste tamanho
+
+@lru_cache(maxsize=32)
+def tabela_polar(num_carreiras, pontos_anel):
+    """Índice plano (y * TELA_RADIAL + x) do pixel que cada ponto lê, anel após anel.
+
+    Devolve (indices, inicios): os pontos do anel r (1..num_carreiras) ficam em
+    indices[inicios[r - 1]:inicios[r]]. A conta é a mesma de math.cos/math.sin com int()
+    de antes, feita uma vez por combinação de carreiras e anel mágico.
+    """
+    meio, limite = TELA_RADIAL / 2, TELA_RADIAL - 1
+    indices, inicios = [], [0]
+    for r_idx in range(1, num_carreiras + 1):
+        n_pontos = r_idx * pontos_anel
+        dist_pct = r_idx / num_carreiras
+        for s in range(n_pontos):
+            theta = (s / n_pontos) * 2 * math.pi - (math.pi / 2)
+            x = int(meio + (dist_pct * meio) * math.cos(theta))
+            y = int(meio + (dist_pct * meio) * math.sin(theta))
+            x, y = max(0, min(limite, x)), max(0, min(limite, y))
+            indices.append(y * TELA_RADIAL + x)
+        inicios.append(len(indices))
+    indices, inicios = np.array(indices, dtype=np.int32), np.array(inicios, dtype=np.int64)
+    indices.setflags(write=False); inicios.setflags(write=False)
+    return indices, inicios
+
+def amostrar_radial(img_base, num_carreiras, pontos_anel):
+    """Cor RGB de cada ponto do porta-copo, na ordem de tecer, num só gather: array (N, 3)."""
+    indices, _ = tabela_polar(num_carreiras, pontos_anel)
+    return np.asarray(img_base.convert('RGB')).reshape(-1, 3)[indices]
+
+def desenhar_previa_radial(grafico, lado=400):
+    """Prévia em fatias de pizza, do anel de fora pra dentro."""
+    img_preview = Image.new('RGB', (lado, lado), '#1E293B')
+    draw_prev = ImageDraw.Draw(img_preview)
+    centro, raio_max = lado / 2, lado / 2 - 10
+    for r_idx in range(grafico.num_carreiras, 0, -1):
+        n_pontos = r_idx * grafico.pontos_anel
+        r_out = (r_idx / grafico.num_carreiras) * raio_max
+        caixa = [centro - r_out, centro - r_out, centro + r_out, centro + r_out]
+        for s, idx in enumerate(grafico.carreira(r_idx).tolist()):
+            a1 = (s / n_pontos) * 360 - 90
+            a2 = ((s + 1) / n_pontos) * 360 - 90
+            draw_prev.pieslice(caixa, a1, a2, fill=grafico.rgb[idx], outline="#333333")
+    return img_preview
+
+# ==========================================
+# GRÁFICO INDEXADO (MODELO ÚNICO DO GRÁFICO)
+# ==========================================
+class Grafico:
+    """O gráfico montado uma vez e lido por tudo (grade, receita, PNG, orçamento).
+
+    pontos: um uint8 por ponto, na ordem de tecer (ponto 1 = pontos[0]), com o índice na paleta.
+    A Cor N da receita é o índice N - 1. Carreira r ocupa pontos[inicios[r - 1]:inicios[r]].
+    """
+    def __init__(self, pontos, paleta, inicios, largura=0, altura=0, plana=False,
+                 ordem=None, num_carreiras=0, pontos_anel=0):
+        self.pontos, self.paleta, self.inicios = pontos, paleta, inicios
+        self.largura, self.altura, self.plana, self._ordem = largura, altura, plana, ordem
+        self.num_carreiras, self.pontos_anel = num_carreiras, pontos_anel
+        self.radial = ordem is None
+        self.rgb = [tuple(c) for c in paleta.tolist()]
+        self.hexes = ['#{:02x}{:02x}{:02x}'.format(*c) for c in self.rgb]
+        self.cores_texto = ["black" if (r*299 + g*587 + b*114)/1000 > 128 else "white" for r, g, b in self.rgb]
+        self.rle = _rle_por_carreira(pontos, inicios)
+        self._contagem = np.bincount(pontos, minlength=len(paleta))
+        self._contagem.flags.writeable = False
+        # Identidade do conteúdo, usada como chave nos caches do Streamlit
+        self.assinatura = hashlib.sha1(b"".join((pontos.tobytes(), paleta.tobytes(), inicios.tobytes(),
+                                                 f"{largura}|{plana}|{pontos_anel}".encode()))).hexdigest()
+
+    @property
+    def total(self): return len(self.pontos)
+
+    @property
+    def carreiras(self): return len(self.inicios) - 1
+
+    def carreira(self, r): return self.pontos[self.inicios[r - 1]:self.inicios[r]]
+
+    def contagem(self):
+        """Quantos pontos de cada cor (posição = índice na paleta), contados uma vez ao montar o gráfico."""
+        return self._contagem
+
+    def grade(self):
+        """Gráfico plano no layout da imagem: (altura, largura) de índices da paleta."""
+        grade = np.empty(self.total, dtype=np.uint8)
+        grade[self._ordem] = self.pontos
+        return grade.reshape(self.altura, self.largura)
+
+    def numeros(self):
+        """Gráfico plano no layout da imagem: número absoluto (1..total) de cada ponto."""
+        numeros = np.empty(self.total, dtype=np.int32)
+        numeros[self._ordem] = np.arange(1, self.total + 1, dtype=np.int32)
+        return numeros.reshape(self.altura, self.largura)
+
+def _indexar(rgb):
+    """(N, 3) RGB -> (índices uint8, paleta) com as cores numeradas na ordem em que aparecem."""
+    codigos = (rgb[:, 0].astype(np.uint32) << 16) | (rgb[:, 1].astype(np.uint32) << 8) | rgb[:, 2]
+    _, primeiro, inverso = np.unique(codigos, return_index=True, return_inverse=True)
+    if len(primeiro) > 256: raise ValueError(f"O gráfico tem {len(primeiro)} cores; o máximo é 256.")
+    ordem = np.argsort(primeiro)
+    posto = np.empty_like(ordem)
+    posto[ordem] = np.arange(len(ordem))
+    return posto[inverso.ravel()].astype(np.uint8), rgb[primeiro[ordem]]
+
+def _rle_por_carreira(pontos, inicios):
+    """Por carreira, a lista de trechos (número da cor, quantidade) na ordem de tecer."""
+    if not len(pontos): return [[] for _ in range(len(inicios) - 1)]
+    quebra = np.ones(len(pontos), dtype=bool)
+    quebra[1:] = pontos[1:] != pontos[:-1]
+    quebra[inicios[:-1][inicios[:-1] < len(pontos)]] = True
+    comecos = np.flatnonzero(quebra)
+    tamanhos = np.diff(np.append(comecos, len(pontos))).tolist()
+    cores = (pontos[comecos].astype(np.int32) + 1).tolist()
+    cortes = np.searchsorted(comecos, inicios).tolist()
+    return [list(zip(cores[a:b], tamanhos[a:b])) for a, b in zip(cortes[:-1], cortes[1:])]
+
+def _ordem_plana(largura, altura, plana):
+    """Para cada ponto, na ordem de tecer, o índice do pixel na imagem (varredura linha a linha).
+
+    A carreira 1 é a de baixo. Na peça plana as carreiras pares voltam da esquerda pra direita;
+    as demais (e todas no tubo) vão da direita pra esquerda.
+    """
+    carr = np.arange(1, altura + 1)
+    x = np.arange(largura)
+    ida = (carr % 2 == 0) & plana
+    xs = np.where(ida[:, None], x[None, :], (largura - 1 - x)[None, :])
+    return ((altura - carr)[:, None] * largura + xs).ravel()
+
+def grafico_plano(img_base, plana):
+    largura, altura = img_base.size
+    indices, paleta = _indexar(np.asarray(img_base.convert('RGB')).reshape(-1, 3))
+    ordem = _ordem_plana(largura, altura, plana)
+    inicios = np.arange(0, largura * altura + 1, largura, dtype=np.int64) if largura else np.zeros(altura + 1, dtype=np.int64)
+    return Grafico(indices[ordem], paleta, inicios, largura, altura, plana, ordem)
+
+def grafico_radial(img_base, num_carreiras, pontos_anel):
+    _, inicios = tabela_polar(num_carreiras, pontos_anel)
+    indices, paleta = _indexar(amostrar_radial(img_base, num_carreiras, pontos_anel))
+    return Grafico(indices, paleta, inicios, num_carreiras=num_carreiras, pontos_anel=pontos_anel)
+
+# Tipos de peça que aparecem no app: o radial sai do centro para as bordas, a plana vai e volta
+TIPOS_PECA = ["Circular (Tubo - Ex: Gorro, Amigurumi)",
+              "Plana (Ida e Volta - Ex: Tapete)",
+              "Circular Plana (Centro p/ Bordas - Ex: Porta-copo) 🚀"]
+
+def formato_peca(tipo_peca):
+    """(radial, plana) de um dos TIPOS_PECA."""
+    return "Centro" in tipo_peca, "Plana" in tipo_peca
+
+def montar_grafico(img_base, tipo_peca, num_carreiras=15, pontos_anel=6):
+    radial, plana = formato_peca(tipo_peca)
+    if radial: return grafico_radial(img_base, num_carreiras, pontos_anel)
+    return grafico_plano(img_base, plana)
+
+def receita(grafico, sigla_pt, tipo_peca, tipo_ponto_base):
+    """Receita escrita carreira por carreira: (linhas em markdown, texto para baixar)."""
+    txt_rec = f"RECEITA DE CROCHÊ\nTipo: {tipo_peca}\nPonto Base: {tipo_ponto_base}\nTotal: {grafico.total} pontos\n" + "-"*30 + "\n\n"
+    linhas = []
+    for num_carr in range(1, grafico.carreiras + 1):
+        seq = ", ".join(f"{cont}x{sigla_pt} Cor {cor}" for cor, cont in grafico.rle[num_carr - 1])
+        if grafico.radial:
+            n_pontos = num_carr * grafico.pontos_anel
+            linhas.append(f"**Carr {num_carr}** ({n_pontos} pts): " + seq)
+            txt_rec += f"Carr {num_carr} ({n_pontos} pts): " + seq + "\n"
+        else:
+            dir_seta = "⬅️" if grafico.plana and num_carr % 2 == 0 else "➔"
+            linhas.append(f"**Carr {num_carr} {dir_seta}:** " + seq)
+            txt_rec += f"Carr {num_carr} {dir_seta}: " + seq + "\n"
+    return linhas, txt_rec
+
+# ==========================================
+# CONSUMO DE FIO E ORÇAMENTO
+# ==========================================
+# Ponto base que aparece no app -> sigla usada na receita e no consumo
+PONTOS_BASE = {"Ponto Baixo (PB)": "PB", "Ponto Alto (PA)": "PA", "Meio Ponto Alto (MPA)": "MPA",
+               "Ponto Baixíssimo (PBX)": "PBX", "Apenas Cores": ""}
+# Metros de fio por ponto. O PB é o 0,045 que o orçamento sempre usou; os outros seguem a altura do ponto.
+# "Apenas Cores" não diz o ponto: conta como PB, como antes.
+METROS_POR_PONTO = {"PB": 0.045, "PBX": 0.035, "MPA": 0.060, "PA": 0.080, "": 0.045}
+
+def consumo_por_cor(grafico, sigla):
+    """Metros de fio de cada cor (posição = índice na paleta)."""
+    return grafico.contagem() * METROS_POR_PONTO[sigla]
+
+def consumo_por_fio(grafico, sigla, fio_da_cor):
+    """fio_da_cor: um nome de fio (ou None) por cor da paleta. Devolve fio -> (pontos, metros).
+
+    Cores ligadas ao mesmo fio somam; cores sem fio (None) ficam de fora.
+    """
+    contagem, metros = grafico.contagem(), consumo_por_cor(grafico, sigla)
+    consumo = {}
+    for i, fio in enumerate(fio_da_cor):
+        if fio is None: continue
+        pontos_antes, metros_antes = consumo.get(fio, (0, 0.0))
+        consumo[fio] = (pontos_antes + int(contagem[i]), metros_antes + float(metros[i]))
+    return consumo
+
+PONTOS_POR_MINUTO = 20
+TAXA_DESGASTE = 1.50   # agulha, luz, embalagem: por peça
+
+def orcamento(total_pontos, custo_material, valor_hora, margem_lucro):
+    """Preço sugerido da peça: material + tempo de agulha + desgaste, com a margem (%) por cima."""
+    minutos = total_pontos / PONTOS_POR_MINUTO
+    custo_tempo = minutos / 60 * valor_hora
+    custo_producao = custo_material + custo_tempo + TAXA_DESGASTE
+    lucro = custo_producao * (margem_lucro / 100)
+    return {"minutos": minutos, "custo_material": custo_material, "custo_tempo": custo_tempo,
+            "custo_producao": custo_producao, "lucro": lucro, "preco_final": custo_producao + lucro}
+
+# ==========================================
+# GRADE HTML (JANELA DE CARREIRAS)
+# ==========================================
+# Uma classe por cor (cr-c0, cr-c1...) e o estado na carreira inteira quando dá: cada ponto vira
+# ~35 bytes de HTML em vez de uma div com estilo inline de ~250.
+CSS_GRADE = (
+    ".cr-g{display:flex;flex-direction:column;gap:4px;padding:15px;background:#111;border-radius:10px;align-items:center;width:100%;max-height:600px;overflow-y:auto}"
+    ".cr-l{display:flex;gap:1px;min-width:max-content}"
+    ".cr-l.cr-r{gap:2px;justify-content:center;flex-wrap:wrap;margin-bottom:4px;min-width:0}"
+    ".cr-n{width:40px;text-align:right;font-size:11px;margin-right:5px;color:#888;align-self:center}"
+    ".cr-r .cr-n{width:50px}"
+    ".cr-p{width:18px;height:18px;display:flex;align-items:center;justify-content:center;font-size:9px;font-weight:bold;opacity:.15}"
+    ".cr-r .cr-p{width:16px;height:16px;border-radius:50%;font-size:8px}"
+    ".cr-f .cr-p,.cr-p.cr-f{opacity:.9}"
+    ".cr-p.cr-a{opacity:1;transform:scale(1.4);z-index:50;border:2px solid red}"
+    ".cr-r .cr-p.cr-a{border-color:#00FF00;box-shadow:0 0 10px #00FF00}"
+)
+
+class GradeHTML:
+    """Grade do "Onde você parou?" montada por carreira, com cache.
+
+    Carreira toda feita ou toda pendente não muda quando o ponto de parada anda: o HTML dela
+    fica guardado e só a carreira do ponto atual é remontada.
+    """
+    def __init__(self, grafico, sequencia):
+        self.g, self.sequencia = grafico, sequencia
+        self.css = "<style>" + CSS_GRADE + "".join(
+            f".cr-c{i}{{background:{h};color:{t}}}" for i, (h, t) in enumerate(zip(grafico.hexes, grafico.cores_texto))) + "</style>"
+        self._grade = self._numeros = None
+        self._linhas = {}
+
+    def carreira_do_ponto(self, ponto):
+        return int(np.searchsorted(self.g.inicios, ponto - 1, side='right'))
+
+    def _celulas(self, r):
+        """(índice da cor, número do ponto) de cada ponto da carreira, na ordem em que aparece na tela."""
+        if self.g.radial:
+            inicio = int(self.g.inicios[r - 1])
+            return [(idx, inicio + s + 1) for s, idx in enumerate(self.g.carreira(r).tolist())]
+        if self._grade is None: self._grade, self._numeros = self.g.grade().tolist(), self.g.numeros().tolist()
+        y = self.g.altura - r
+        return list(zip(self._grade[y], self._numeros[y]))
+
+    def _rotulo(self, r):
+        if self.g.radial: return f"C {r}"
+        return f"C {r} {'⬅️' if self.g.plana and r % 2 == 0 else '➔'}"
+
+    def linha(self, r, parada):
+        inicio, fim = int(self.g.inicios[r - 1]), int(self.g.inicios[r])
+        estado = "f" if fim < parada else ("p" if inicio + 1 > parada else None)
+        if estado and (r, estado) in self._linhas: return self._linhas[(r, estado)]
+
+        classe_linha = "cr-l cr-r" if self.g.radial else "cr-l"
+        if estado == "f": classe_linha += " cr-f"
+        partes = [f'<div class="{classe_linha}"><div class="cr-n">{self._rotulo(r)}</div>']
+        for idx, numero in self._celulas(r):
+            texto = numero if self.sequencia else idx + 1
+            if estado: partes.append(f'<span class="cr-p cr-c{idx}">{texto}</span>')
+            else:
+                marca = " cr-a" if numero == parada else (" cr-f" if numero < parada else "")
+                partes.append(f'<span class="cr-p cr-c{idx}{marca}">{texto}</span>')
+        partes.append("</div>")
+        html = "".join(partes)
+        if estado: self._linhas[(r, estado)] = html
+        return html
+
+    def html(self, parada, de=1, ate=None):
+        """Carreiras de `ate` (em cima) até `de` (embaixo), como no gráfico."""
+        ate = self.g.carreiras if ate is None else ate
+        return self.css + '<div class="cr-g">' + "".join(self.linha(r, parada) for r in range(ate, de - 1, -1)) + "</div>"
+
+# ==========================================
+# EXPORTAÇÃO (PNG / PDF EM PÁGINAS)
+# ==========================================
+BRANCO, PRETO, VERMELHO = 0, 1, 2   # índices fixos na paleta das páginas; as cores do gráfico vêm depois
+MAX_PONTOS_PNG_UNICO = 150 * 150    # acima disso o tabuleiro inteiro num PNG só fica pesado demais
+
+class Exportador:
+    """Desenha o gráfico plano em imagens de paleta ("P") colando sprites de célula prontos.
+
+    Cada (cor, número) vira um sprite uma vez só. No modo sequência os números não se repetem,
+    então o sprite é só o fundo da cor e os dígitos vêm de glifos em cache.
+    """
+    def __init__(self, grafico, sequencia, tam=40, margem=60):
+        if len(grafico.paleta) > 256 - 3: raise ValueError("Cores demais para exportar o gráfico.")
+        self.g, self.sequencia, self.tam, self.margem = grafico, sequencia, tam, margem
+        self.paleta = [255, 255, 255, 0, 0, 0, 255, 0, 0] + grafico.paleta.ravel().tolist()
+        self._grade = grafico.grade().tolist()
+        self._numeros = grafico.numeros().tolist() if sequencia else None
+        self._tintas = [PRETO if t == "black" else BRANCO for t in grafico.cores_texto]
+        self._sprites, self._glifos = {}, {}
+        self._fonte = ImageDraw.Draw(Image.new('P', (1, 1))).getfont()
+
+    def _sprite(self, idx, texto=None):
+        chave = (idx, texto)
+        if chave not in self._sprites:
+            sprite = Image.new('P', (self.tam, self.tam), 3 + idx)
+            draw = ImageDraw.Draw(sprite)
+            draw.line([(0, 0), (self.tam - 1, 0)], fill=PRETO)
+            draw.line([(0, 0), (0, self.tam - 1)], fill=PRETO)
+            if texto is not None: draw.text((5, 10), texto, fill=self._tintas[idx])
+            self._sprites[chave] = sprite
+        return self._sprites[chave]
+
+    def _glifo(self, caractere):
+        if caractere not in self._glifos:
+            avanco = self._fonte.getlength(caractere)
+            mascara = Image.new('1', (math.ceil(avanco) + 2, self.tam))
+            ImageDraw.Draw(mascara).text((0, 0), caractere, fill=1, font=self._fonte)
+            self._glifos[caractere] = (mascara, avanco)
+        return self._glifos[caractere]
+
+    def pagina(self, x0, y0, colunas, linhas, titulo=None):
+        tam, margem, g = self.tam, self.margem, self.g
+        largura_img, altura_img = colunas * tam + margem * 2, linhas * tam + margem * 2
+        img = Image.new('P', (largura_img, altura_img), BRANCO)
+        img.putpalette(self.paleta)
+
+        for j, y in enumerate(range(y0, y0 + linhas)):
+            linha_cores = self._grade[y]
+            py = margem + j * tam
+            for i, x in enumerate(range(x0, x0 + colunas)):
+                idx, px = linha_cores[x], margem + i * tam
+                if self._numeros is None:
+                    img.paste(self._sprite(idx, str(idx + 1)), (px, py))
+                    continue
+                img.paste(self._sprite(idx), (px, py))
+                cursor = px + 5
+                for caractere in str(self._numeros[y][x]):
+                    mascara, avanco = self._glifo(caractere)
+                    img.paste(self._tintas[idx], (round(cursor), py + 10), mascara)
+                    cursor += avanco
+
+        draw = ImageDraw.Draw(img)
+        draw.line([(largura_img - margem, margem), (largura_img - margem, altura_img - margem)], fill=PRETO)
+        draw.line([(margem, altura_img - margem), (largura_img - margem, altura_img - margem)], fill=PRETO)
+        for y_line in range(y0, y0 + linhas + 1):
+            if y_line % 5 == 0:
+                yp = (y_line - y0) * tam + margem
+                draw.line([(margem, yp), (largura_img - margem, yp)], fill=VERMELHO, width=3)
+        for x_line in range(x0, x0 + colunas + 1):
+            if x_line % 5 == 0:
+                xp = (x_line - x0) * tam + margem
+                draw.line([(xp, margem), (xp, altura_img - margem)], fill=VERMELHO, width=3)
+
+        # Réguas com os números absolutos: dá pra emendar as páginas pela sobreposição
+        for j, y in enumerate(range(y0, y0 + linhas)):
+            num_carr = g.altura - y
+            seta = "<-" if g.plana and num_carr % 2 == 0 else "->"
+            y_pos = j * tam + margem + 12
+            draw.text((10, y_pos), f"C{num_carr} {seta}", fill=PRETO)
+            draw.text((largura_img - margem + 10, y_pos), f"C{num_carr} {seta}", fill=PRETO)
+        for i, x in enumerate(range(x0, x0 + colunas)):
+            if (x + 1) % 5 == 0 or x == 0 or x == g.largura - 1 or i == 0 or i == colunas - 1:
+                x_pos = i * tam + margem + 15
+                draw.text((x_pos, margem - 25), str(x + 1), fill=PRETO)
+                draw.text((x_pos, altura_img - margem + 10), str(x + 1), fill=PRETO)
+        if titulo: draw.text((10, 8), titulo, fill=PRETO)
+        return img
+
+    def paginas(self, colunas=28, linhas=40, sobreposicao=2):
+        """Gera (imagem, título) página por página: só uma página na memória de cada vez."""
+        cortes_x = _cortes(self.g.largura, colunas, sobreposicao)
+        cortes_y = _cortes(self.g.altura, linhas, sobreposicao)
+        total = len(cortes_x) * len(cortes_y)
+        n = 0
+        for y0, alt in cortes_y:
+            for x0, larg in cortes_x:
+                n += 1
+                titulo = (f"Pagina {n}/{total} - pontos {x0 + 1} a {x0 + larg} - "
+                          f"carreiras {self.g.altura - y0 - alt + 1} a {self.g.altura - y0}")
+                yield self.pagina(x0, y0, larg, alt, titulo), titulo
+
+    def png(self):
+        """Tabuleiro inteiro num PNG só (em paleta: 1 byte por pixel em vez de 3)."""
+        buf = io.BytesIO()
+        self.pagina(0, 0, self.g.largura, self.g.altura).save(buf, format="PNG")
+        return buf.getvalue()
+
+    def zip_png(self, **kw):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:   # PNG já é comprimido
+            for n, (img, _) in enumerate(self.paginas(**kw), 1):
+                saida = io.BytesIO()
+                img.save(saida, format="PNG")
+                zf.writestr(f"grafico_pagina_{n:02d}.png", saida.getvalue())
+        return buf.getvalue()
+
+    def pdf(self, dpi=150, **kw):
+        return _pdf_indexado((img for img, _ in self.paginas(**kw)), dpi)
+
+def _cortes(total, tamanho, sobreposicao):
+    """Início e tamanho de cada faixa; faixas vizinhas repetem `sobreposicao` pontos."""
+    if total <= tamanho: return [(0, total)]
+    passo = max(1, tamanho - sobreposicao)
+    inicios = list(range(0, total - tamanho, passo)) + [total - tamanho]
+    return [(i, tamanho) for i in inicios]
+
+def _pdf_indexado(paginas, dpi):
+    """PDF com uma imagem de paleta por página, comprimida com zlib.
+
+    O PDF do Pillow grava imagens "P" em hexadecimal sem compressão (~4 MB por página A4);
+    aqui cada página vira um objeto FlateDecode e é descartada assim que é escrita.
+    """
+    buf = io.BytesIO()
+    offsets = {}
+    def objeto(num, corpo, fluxo=None):
+        offsets[num] = buf.tell()
+        buf.write(f"{num} 0 obj\n".encode() + corpo)
+        if fluxo is not None: buf.write(b"\nstream\n" + fluxo + b"\nendstream")
+        buf.write(b"\nendobj\n")
+
+    buf.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    kids = []
+    for n, img in enumerate(paginas):
+        pag, conteudo, imagem = 3 + 3 * n, 4 + 3 * n, 5 + 3 * n
+        kids.append(pag)
+        largura, altura = img.size
+        pt_l, pt_a = largura * 72 / dpi, altura * 72 / dpi
+        paleta = bytes(img.getpalette()[:768])
+        dados = zlib.compress(img.tobytes(), 6)
+        objeto(imagem, (f"<< /Type /XObject /Subtype /Image /Width {largura} /Height {altura} "
+                        f"/ColorSpace [/Indexed /DeviceRGB {len(paleta) // 3 - 1} <{paleta.hex()}>] "
+                        f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(dados)} >>").encode(), dados)
+        desenho = f"q {pt_l:.2f} 0 0 {pt_a:.2f} 0 0 cm /Im0 Do Q".encode()
+        objeto(conteudo, f"<< /Length {len(desenho)} >>".encode(), desenho)
+        objeto(pag, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {pt_l:.2f} {pt_a:.2f}] "
+                     f"/Resources << /XObject << /Im0 {imagem} 0 R >> >> /Contents {conteudo} 0 R >>").encode())
+    objeto(2, f"<< /Type /Pages /Count {len(kids)} /Kids [{' '.join(f'{k} 0 R' for k in kids)}] >>".encode())
+    objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    inicio_xref = buf.tell()
+    total = max(offsets) + 1
+    buf.write(f"xref\n0 {total}\n0000000000 65535 f \n".encode())
+    for num in range(1, total): buf.write(f"{offsets[num]:010d} 00000 n \n".encode())
+    buf.write(f"trailer\n<< /Size {total} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode())
+    return buf.getvalue()
@@ -0,0 +1,78 @@
+"""Documentos de exemplo (texto comum, com "das", "de", "comprovante"...) e a pasta que cada um tem que ir.
+
+    python -m unittest test_classificador
+"""
+import os
+import unittest
+
+os.environ.setdefault("ARQUIVO_CEREBRO", os.devnull)
+os.environ.setdefault("INICIAR_TRABALHADORES", "0")
+import estagiario
+
+DOCUMENTOS = {
+    "1. Despesas Médicas": [
+        "Hospital Santa Clara - Recibo. Recebemos de Maria da Silva a importância referente das despesas de internação e das diárias. Médico responsável: Dr. João. Valor das taxas incluso.",
+        "Clínica Sorriso - Dentista Dra. Ana. Recibo dos serviços de saúde bucal prestados ao paciente, pagamento das parcelas 1 e 2 das 10 previstas. CPF do paciente.",
+        "UNIMED - Demonstrativo anual das mensalidades pagas ao plano de saúde, para fins de declaração de imposto de renda. Comprovante de pagamento.",
+        "Comprovante de pagamento - Hospital São Lucas. Internação de 12/03 a 15/03, valor pago à vista.",
+        "Receita médica - Clínica Bem Estar. Uso contínuo, tomar um comprimido ao dia.",
+    ],
+    "2. Educação": [
+        "Colégio Objetivo - Escola de ensino fundamental. Declaração de pagamento das mensalidades do ano letivo, referente das parcelas de fevereiro a dezembro. Comprovante para o IR.",
+        "Universidade Federal - Faculdade de Direito. Declaração de quitação das anuidades do curso de graduação. Valor total das parcelas pagas no ano-calendário.",
+    ],
+    "3. Rendimentos": [
+        "Holerite - Recibo de pagamento de salário. Demonstrativo das verbas, das horas extras, das deduções e dos descontos do mês de março. Salario base. Banco do Brasil agência 1234.",
+        "Comprovante de Rendimentos Pagos e de Imposto sobre a Renda Retido na Fonte. Informe de rendimentos do ano-calendário. Fonte pagadora: Empresa X. Pró-labore e salário.",
+    ],
+    "4. Bancos": [
+        "Nubank - Extrato da conta corrente. Saldo anterior, lançamentos das transferências e das compras no débito. Saldo final do período.",
+        "Banco Santander - Comprovante de transferência PIX. Data da operação, valor, dados do favorecido e das contas envolvidas.",
+    ],
+    "5. Impostos": [
+        "DARF - Documento de Arrecadação de Receitas Federais. Código da receita 0190. Período de apuração, valor principal, multa e juros.",
+        "DAS - Documento de Arrecadação do Simples Nacional. Período de apuração, vencimento e valor total a pagar das obrigações do mês.",
+    ],
+    "6. Veículos": [
+        "DETRAN SP - Licenciamento anual do veículo e pagamento do IPVA das três parcelas. Placa ABC1D23, RENAVAM.",
+    ],
+    "7. Imóveis": [
+        "Carnê do IPTU exercício 2024. Imóvel inscrito na prefeitura, valor das parcelas e desconto para pagamento em cota única.",
+        "Recibo de aluguel do apartamento e taxa de condomínio do mês, referente das despesas ordinárias do edifício.",
+    ],
+    "Geral": [
+        "Ata da reunião das famílias do bairro. Lista das pessoas presentes e das decisões tomadas.",
+    ],
+}
+
+class TestClassificador(unittest.TestCase):
+    def setUp(self):
+        self.classificador = estagiario.Classificador(estagiario.CEREBRO_DO_ROBO)
+
+    def escolher(self, texto):
+        return self.classificador.escolher(estagiario.normalizar_texto(texto))
+
+    def test_documentos_de_exemplo(self):
+        for pasta, textos in DOCUMENTOS.items():
+            for texto in textos:
+                with self.subTest(texto=texto[:40]):
+                    self.assertEqual(self.escolher(texto), pasta)
+
+    def test_termo_especifico_ganha_do_generico(self):
+        placar = self.classificador.pontuar(estagiario.normalizar_texto("Comprovante de pagamento - Hospital"))
+        self.assertEqual(placar.contagem, {"4. Bancos": 0.5, "1. Despesas Médicas": 1.0})
+        self.assertEqual(placar.vencedor(), "1. Despesas Médicas")
+
+    def test_palavra_repetida_conta_uma_vez(self):
+        placar = self.classificador.pontuar(estagiario.normalizar_texto("extrato " * 10 + "hospital clinica"))
+        self.assertEqual(placar.contagem["4. Bancos"], 1.0)
+        self.assertEqual(placar.vencedor(), "1. Despesas Médicas")
+
+    def test_peso_na_tabela_do_arquivo(self):
+        # O cerebro_do_robo.json é JSON: o termo com peso chega como lista
+        classificador = estagiario.Classificador({"A": [["comum", 0.5]], "B": ["raro"]})
+        self.assertEqual(classificador.escolher("comum raro"), "B")
+        self.assertEqual(classificador.peso, {"comum": 0.5, "raro": 1.0})
+
+if __name__ == "__main__":
+    unittest.main()